@@ -0,0 +1,156 @@
+"""不依赖显示器的 tkinter 替身，只用于基准测试。
+
+install() 把它注册为 tkinter 模块，之后导入的 clipboard_monitor 会使用这里的控件。
+Listbox 和 Text 真实保存内容，其余控件的方法都是空操作，after() 只记录回调而不执行。
+"""
+import sys
+import types
+
+
+class Widget:
+    def __init__(self, master=None, *args, **options):
+        self.master = master
+        self.options = dict(options)
+        self.bindings = {}
+
+    def __getattr__(self, name):
+        # 没有单独实现的方法（pack、grid、attributes 等）都当成空操作
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def bind(self, sequence=None, func=None, add=None):
+        self.bindings[sequence] = func
+
+    def configure(self, cnf=None, **options):
+        self.options.update(cnf or {}, **options)
+
+    config = configure
+
+    def cget(self, key):
+        return self.options.get(key, 0)
+
+    def winfo_height(self):
+        return 1
+
+
+class Tk(Widget):
+    def __init__(self, *args, **options):
+        super().__init__(None)
+        self.scheduled = []
+
+    def after(self, ms, func=None, *args):
+        self.scheduled.append((ms, func, args))
+        return f"after#{len(self.scheduled)}"
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class Toplevel(Widget):
+    pass
+
+
+class Listbox(Widget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.items = []
+        self.selected = set()
+
+    def _index(self, index):
+        return len(self.items) if index == END else int(index)
+
+    def insert(self, index, *elements):
+        index = self._index(index)
+        self.items[index:index] = [str(element) for element in elements]
+
+    def delete(self, first, last=None):
+        first = self._index(first)
+        last = first if last is None else self._index(last)
+        del self.items[first:last + 1]
+
+    def size(self):
+        return len(self.items)
+
+    def itemconfig(self, index, **options):
+        if not 0 <= index < len(self.items):
+            raise IndexError(index)
+
+    def selection_set(self, index):
+        self.selected.add(index)
+
+    def selection_clear(self, first, last=None):
+        self.selected.clear()
+
+    def nearest(self, y):
+        return min(len(self.items) - 1, y // 10)
+
+
+class Text(Widget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.content = ""
+
+    def insert(self, index, text):
+        self.content += text
+
+    def delete(self, first, last=None):
+        self.content = ""
+
+
+class Variable:
+    def __init__(self, master=None, value=None):
+        self.value = value
+        self.callbacks = []
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        for callback in self.callbacks:
+            callback()
+
+    def trace_add(self, mode, callback):
+        self.callbacks.append(callback)
+
+
+class Font:
+    def __init__(self, *args, **options):
+        pass
+
+    def metrics(self, key=None):
+        return 15
+
+
+END = "end"
+
+
+def install():
+    tk = types.ModuleType("tkinter")
+    for name in ("SINGLE", "MULTIPLE", "NONE", "VERTICAL", "HORIZONTAL", "RIGHT", "LEFT", "TOP", "BOTTOM",
+                 "X", "Y", "BOTH", "MOVETO", "SCROLL", "PAGES", "UNITS", "WORD", "DISABLED", "NORMAL"):
+        setattr(tk, name, name.lower())
+    tk.END = END
+    tk.Tk = Tk
+    tk.Toplevel = Toplevel
+    tk.Listbox = Listbox
+    tk.Text = Text
+    tk.StringVar = tk.BooleanVar = tk.IntVar = Variable
+    for name in ("Frame", "Label", "Button", "Checkbutton", "Entry", "Scrollbar", "Menu", "Canvas"):
+        setattr(tk, name, type(name, (Widget,), {}))
+
+    font = types.ModuleType("tkinter.font")
+    font.Font = Font
+    font.families = lambda *args: ("Arial", "Courier", "Helvetica")
+    messagebox = types.ModuleType("tkinter.messagebox")
+    for name in ("showinfo", "showwarning", "showerror"):
+        setattr(messagebox, name, lambda *args, **kwargs: "ok")
+    messagebox.askyesno = lambda *args, **kwargs: True
+    colorchooser = types.ModuleType("tkinter.colorchooser")
+    colorchooser.askcolor = lambda *args, **kwargs: (None, None)
+
+    tk.font, tk.messagebox, tk.colorchooser = font, messagebox, colorchooser
+    sys.modules.update({"tkinter": tk, "tkinter.font": font, "tkinter.messagebox": messagebox,
+                        "tkinter.colorchooser": colorchooser})
+    return tk
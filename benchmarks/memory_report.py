@@ -0,0 +1,103 @@
+"""历史记录内存占用报告：写入 N 条合成记录后重新加载 JSON 存储，用 tracemalloc 统计加载后常驻的内存。
+
+报告总字节数、去重后内容本身（str 对象）占用的字节数，以及扣除内容之后每条记录的开销。
+
+    python benchmarks/memory_report.py --entries 100000 --output memory.json
+"""
+import os
+import sys
+import gc
+import json
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from history_store import JsonHistoryStore  # noqa: E402
+
+WORDS = ("clipboard", "history", "monitor", "lorem", "ipsum", "dolor", "sit", "amet", "def", "return",
+         "import", "self", "value", "http://example.com/path?q=", "SELECT * FROM", "0x7fff", "\n", "  ")
+
+
+def entries(count, duplicate_ratio, seed):
+    """生成 count 条 (时间戳, 内容)，内容为 10~300 个字符，约 duplicate_ratio 比例重复之前的内容。"""
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    recent = []
+    for index in range(count):
+        timestamp = (base + timedelta(seconds=index, microseconds=rng.randrange(1000000))).isoformat()
+        if recent and rng.random() < duplicate_ratio:
+            yield timestamp, rng.choice(recent)
+            continue
+        text = f"{index} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 40)))
+        recent.append(text)
+        if len(recent) > 1000:
+            recent.pop(rng.randrange(len(recent)))
+        yield timestamp, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History store memory report")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    data_dir = tempfile.mkdtemp(prefix="clipboard-memory-")
+    try:
+        history_file = os.path.join(data_dir, "clipboard_history.json")
+        store = JsonHistoryStore(history_file)
+        store.load()
+        unique = {}
+        for timestamp, text in entries(args.entries, args.duplicate_ratio, args.seed):
+            store.insert(timestamp, text)
+            unique[text] = None
+        store.compact(wait=True)
+        store.close()
+        # 内容本身（去重后每个 str 对象）的大小，与存储的实现无关
+        payload_bytes = sum(sys.getsizeof(text) for text in unique)
+        unique_count = len(unique)
+        del unique
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        store = JsonHistoryStore(history_file)
+        store.load()
+        if store._search_thread:
+            # 全文索引在 SQLite 中，不计入 Python 对象的内存
+            store._search_thread.join()
+        gc.collect()
+        total_bytes = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        count = store.count()
+        store.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    result = {
+        "entries": count,
+        "unique": unique_count,
+        "total_bytes": total_bytes,
+        "payload_bytes": payload_bytes,
+        "bytes_per_entry": total_bytes / count,
+        "overhead_bytes_per_entry": (total_bytes - payload_bytes) / count,
+    }
+    print(f"{count} entries ({unique_count} unique): {total_bytes / 1024 / 1024:.1f} MB resident, "
+          f"{result['bytes_per_entry']:.0f} bytes/entry, {result['overhead_bytes_per_entry']:.0f} bytes/entry excluding content")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""剪切板监控的基准测试：捕获、持久化、列表渲染和启动。
+
+每个 (后端, 条数) 组合在单独的子进程中运行，这样峰值内存互不影响。子进程中 pyperclip 被替换为内存实现，
+Tk 控件默认使用 fake_tk 中的替身（--real-tk 时使用真正的 tkinter，可以配合 xvfb-run 运行）。
+
+    python benchmarks/run_benchmarks.py --entries 1000,10000 --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+WORDS = ("clipboard", "history", "monitor", "lorem", "ipsum", "dolor", "sit", "amet", "def", "return",
+         "import", "self", "value", "http://example.com/path?q=", "SELECT * FROM", "0x7fff", "\n", "  ")
+
+# 内容大小分布：(比例, 最小字符数, 最大字符数)
+SIZE_MIX = ((0.90, 10, 300), (0.099, 1024, 16 * 1024), (0.001, 256 * 1024, 1024 * 1024))
+
+# 比较结果时参与比较的指标，越小越好
+COMPARED_METRICS = ("p50_ms", "p99_ms", "seconds", "peak_rss_mb", "bytes_written")
+
+
+# ----------------------------------------------------------------------
+# 合成剪切板数据
+# ----------------------------------------------------------------------
+def clipboard_stream(count, duplicate_ratio, seed=0, pool_size=1000):
+    """生成 count 条剪切板内容，其中约 duplicate_ratio 比例重复最近出现过的内容。"""
+    rng = random.Random(seed)
+    recent = []
+    for index in range(count):
+        if recent and rng.random() < duplicate_ratio:
+            yield rng.choice(recent)
+            continue
+        text = f"{index} " + make_text(rng, pick_size(rng))
+        if len(recent) < pool_size:
+            recent.append(text)
+        else:
+            recent[rng.randrange(pool_size)] = text
+        yield text
+
+
+def pick_size(rng):
+    roll = rng.random()
+    for share, low, high in SIZE_MIX:
+        if roll < share:
+            return rng.randint(low, high)
+        roll -= share
+    return SIZE_MIX[0][1]
+
+
+def make_text(rng, size):
+    chunk = " ".join(rng.choice(WORDS) for _ in range(32))
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+# ----------------------------------------------------------------------
+# 统计
+# ----------------------------------------------------------------------
+def latency_stats(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def bytes_written_so_far():
+    # Linux 上读取进程累计写入的字节数，其他平台返回 None
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def directory_bytes(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Timer:
+    def __init__(self):
+        self.samples = []
+
+    def __call__(self, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+
+# ----------------------------------------------------------------------
+# 子进程：运行一个 (后端, 条数) 组合
+# ----------------------------------------------------------------------
+def stub_pyperclip():
+    import pyperclip
+    clipboard = {"text": ""}
+    pyperclip.copy = lambda text: clipboard.__setitem__("text", text)
+    pyperclip.paste = lambda: clipboard["text"]
+
+
+def run_worker(args):
+    if not args.real_tk:
+        sys.path.insert(0, BENCH_DIR)
+        import fake_tk
+        fake_tk.install()
+    sys.path.insert(0, REPO_DIR)
+    stub_pyperclip()
+
+    import tkinter as tk
+    from clipboard_engine import ClipboardEngine, read_config
+    from clipboard_monitor import ClipboardMonitor
+
+    data_dir = tempfile.mkdtemp(prefix="clipboard-bench-")
+    try:
+        logging.basicConfig(filename=os.path.join(data_dir, "clipboard_monitor.log"), level=logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+        config_file = os.path.join(data_dir, "config.json")
+        config = read_config(config_file, ClipboardMonitor.DEFAULT_CONFIG)
+        config["history_backend"] = args.backend
+        with open(config_file, "w") as file:
+            json.dump(config, file, indent=4)
+
+        result = {"backend": args.backend, "entries": args.entries, "duplicate_ratio": args.duplicate_ratio}
+
+        # 1. 捕获：把合成数据逐条交给核心引擎，每 1000 条刷一次盘（对应 save_history_to_file）
+        written = bytes_written_so_far()
+        start = time.perf_counter()
+        engine = ClipboardEngine(os.path.join(data_dir, "clipboard_history"), config)
+        engine.load()
+        capture, sync = Timer(), Timer()
+        for index, text in enumerate(clipboard_stream(args.entries, args.duplicate_ratio, args.seed), 1):
+            capture(engine.handle_clipboard, text)
+            if index % 1000 == 0:
+                sync(engine.history_store.sync)
+        close_start = time.perf_counter()
+        engine.stop()
+        result["capture"] = latency_stats(capture.samples)
+        result["save_history_to_file"] = latency_stats(sync.samples)
+        result["close"] = {"seconds": time.perf_counter() - close_start}
+        result["fill"] = {"seconds": time.perf_counter() - start,
+                          "bytes_written": None if written is None else bytes_written_so_far() - written,
+                          "disk_bytes": directory_bytes(data_dir)}
+
+        # 2. 启动：在已有 N 条历史记录的目录中创建窗口（首帧），再等后台加载完整的历史记录
+        start = time.perf_counter()
+        root = tk.Tk()
+        app = ClipboardMonitor(root, data_dir=data_dir)
+        root.update_idletasks()
+        result["startup"] = {"seconds": time.perf_counter() - start}
+        while not app.history_ready:
+            # 加载完成的回调通过 ui_queue 交给 Tk 线程执行
+            time.sleep(0.005)
+            app.process_ui_queue()
+        result["history_ready"] = {"seconds": time.perf_counter() - start}
+
+        # 3. 界面：带列表更新的捕获、刷新列表、打开/关闭管理窗口
+        gui_capture, refresh, open_window = Timer(), Timer(), Timer()
+
+        def capture_in_gui(text):
+            app.engine.handle_clipboard(text)
+            # 监听启动后过滤在后台线程中进行，结果经 clipboard_queue 回到 Tk 线程才加入历史记录；
+            # 过滤线程只有一个，排在后面的空任务完成时这条内容已经过滤完
+            app.engine._filter_executor.submit(lambda: None).result()
+            app.process_clipboard_queue()
+
+        history_before = app.engine.history_store.count()
+        for text in clipboard_stream(args.gui_ops, args.duplicate_ratio, args.seed + 1):
+            gui_capture(capture_in_gui, "gui " + text)
+        if app.engine.history_store.count() <= history_before or \
+                app.engine.history_store.get_by_rank(0)[1] != "gui " + text:
+            raise RuntimeError("gui_capture did not add the captured content to the history")
+        for _ in range(args.gui_ops // 10):
+            refresh(lambda: (app.update_history_listbox(), root.update_idletasks()))
+        for _ in range(max(1, args.gui_ops // 50)):
+            open_window(lambda: (app.open_history_window(), root.update_idletasks()))
+            app.close_history_window()
+        result["gui_capture"] = latency_stats(gui_capture.samples)
+        result["update_history_listbox"] = latency_stats(refresh.samples)
+        result["open_history_window"] = latency_stats(open_window.samples)
+
+        app.on_close()
+        result["memory"] = {"peak_rss_mb": peak_rss_mb()}
+        result["total_bytes_written"] = {"bytes_written": None if written is None else bytes_written_so_far() - written}
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    json.dump(result, sys.stdout)
+
+
+# ----------------------------------------------------------------------
+# 主进程：调度、保存和比较结果
+# ----------------------------------------------------------------------
+def run_all(args):
+    results = {}
+    for backend in args.backends.split(","):
+        for entries in (int(value) for value in args.entries.split(",")):
+            name = f"{backend}/{entries}"
+            print(f"running {name} ...", file=sys.stderr, flush=True)
+            command = [sys.executable, os.path.abspath(__file__), "--worker", "--backend", backend,
+                       "--entries", str(entries), "--duplicate-ratio", str(args.duplicate_ratio),
+                       "--seed", str(args.seed), "--gui-ops", str(args.gui_ops)]
+            if args.real_tk:
+                command.append("--real-tk")
+            process = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+            if process.returncode != 0:
+                print(f"{name} failed with exit code {process.returncode}", file=sys.stderr)
+                continue
+            results[name] = json.loads(process.stdout)
+            print_result(name, results[name])
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "real_tk": args.real_tk,
+            "duplicate_ratio": args.duplicate_ratio,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"saved results to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline["results"], results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+def print_result(name, result):
+    for phase, values in result.items():
+        if isinstance(values, dict):
+            shown = ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                              for key, value in values.items())
+            print(f"  {name} {phase}: {shown}")
+
+
+def compare(baseline, current, threshold):
+    """逐项比较两次运行的结果，返回变慢/变大超过 threshold 的指标列表。"""
+    regressions = []
+    for name, result in sorted(current.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        for phase, values in result.items():
+            if not isinstance(values, dict) or not isinstance(old.get(phase), dict):
+                continue
+            for metric in COMPARED_METRICS:
+                new_value, old_value = values.get(metric), old[phase].get(metric)
+                if not new_value or not old_value:
+                    continue
+                ratio = new_value / old_value
+                flag = "REGRESSION" if ratio > 1 + threshold else ""
+                print(f"{name:>16} {phase:>24} {metric:>14}: {old_value:12.3f} -> {new_value:12.3f} ({ratio:6.2f}x) {flag}")
+                if flag:
+                    regressions.append((name, phase, metric, ratio))
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {threshold:.0%}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clipboard Monitor benchmarks")
+    parser.add_argument("--backends", default="json,sqlite", help="comma separated history backends")
+    parser.add_argument("--entries", default="1000,10000,100000,1000000", help="comma separated history sizes")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="share of copies that repeat recent content")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gui-ops", type=int, default=500, help="operations per GUI scenario")
+    parser.add_argument("--real-tk", action="store_true", help="use real Tk widgets (e.g. under xvfb-run)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="compare against a previous JSON results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging a regression")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.entries = int(args.entries)
+        run_worker(args)
+    else:
+        run_all(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pyperclip
+
+from history_store import create_history_store, PREVIEW_CHARS
+from persistence import PersistenceWorker, InstanceLock, atomic_write
+from clipboard_formats import ClipboardData, ClipBlobStore, create_clipboard_reader, describe, parse
+from content_filter import ContentFilter, SecretBox, load_rules
+from clipboard_watcher import create_clipboard_watcher
+from retention import RetentionPolicy, HistoryEvictor
+from log_pipeline import loggable
+from history_archive import export_archive, import_archive, iter_archive
+from history_sync import HistorySync
+
+
+logger = logging.getLogger(__name__)
+
+
+# 敏感内容过滤线程处理完的一次捕获，交回处理剪切板变化的线程写入历史记录
+FilteredCapture = namedtuple("FilteredCapture", "text data result")
+
+
+def read_config(config_file, defaults):
+    """读取配置文件，缺失的配置项使用默认值；配置项有增减时写回文件。"""
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as file:
+            try:
+                config = json.load(file)
+                logger.info("Loaded configuration from file.")
+            except json.JSONDecodeError:
+                logger.error("Failed to decode JSON from config file. Using default configuration.")
+    else:
+        logger.info("Configuration file not found. Using default configuration.")
+
+    values = {key: config.get(key, default) for key, default in defaults.items()}
+    if set(config) != set(defaults):
+        write_config(config_file, values)
+    return values
+
+
+def write_config(config_file, config):
+    try:
+        atomic_write(config_file, json.dumps(config, indent=4))
+        logger.info("Saved configuration to file.")
+    except Exception as e:
+        logger.error(f"Failed to save configuration to file: {e}")
+
+
+class ClipboardEngine:
+    """与界面无关的剪切板监控核心：监听剪切板、写入历史记录、按保留策略淘汰旧记录。
+
+    剪切板变化统一在 start() 的调用方所在的线程中通过 handle_clipboard 处理
+    （Tk 界面为 Tk 线程，无界面模式为 asyncio 事件循环线程），处理结果通过
+    on_added(timestamp, text) 通知界面；on_evicted(条数, 释放字节数) 在淘汰线程中调用，
+    on_synced(条数) 在应用了其它机器的变更后于同步线程中调用。
+    图片和 HTML 在历史记录中只保存一段描述（见 clipboard_formats），正文保存在 <history_base>_clips 中，
+    图片的缩略图生成后在线程池中调用 on_thumbnail(digest, path)。
+
+    历史记录需要先 load()（或 load_in_background()）才能使用。加载完成之前捕获到的内容暂存起来
+    （仍然会调用 on_added），由 flush_pending() 写入；界面可以先用 read_recent_header()
+    读到的最近几条记录占位，加载完成后再整体刷新。
+
+    开启敏感内容过滤时，捕获到的内容先在过滤线程中扫描，结果通过 start() 的 threaded_on_change
+    交回处理剪切板变化的线程，命中规则的内容被丢弃、遮盖或加密后才写入历史记录。
+    """
+
+    # 退出时保存到 <history_base>.recent.json 的最近记录条数，以及单条记录保存的最大字符数
+    RECENT_HEADER_ENTRIES = 100
+    RECENT_HEADER_CHARS = 4096
+
+    def __init__(self, history_base, config, on_added=None, on_evicted=None, on_thumbnail=None, on_synced=None):
+        # 两个进程同时写同一份历史记录会互相覆盖，已经有其他进程打开时抛出 InstanceLockedError
+        self.instance_lock = InstanceLock(history_base + ".lock")
+        self.instance_lock.acquire()
+        self.config = config
+        self.on_added = on_added
+        self.on_evicted = on_evicted
+        self.on_thumbnail = on_thumbnail
+        self.on_synced = on_synced
+        self.clipboard_text = ""
+        self.clipboard_watcher = None
+        # 剪切板读取方式可以替换，能读取图片和 HTML 的读取方式不可用时只读取纯文本
+        self.clipboard_reader = create_clipboard_reader(config["clipboard_reader_backend"])
+        self.clip_blobs = ClipBlobStore(history_base + "_clips")
+        self.recent_header_file = history_base + ".recent.json"
+
+        # 敏感内容过滤：所有规则合并成一个正则，在单独的线程中按捕获顺序扫描
+        self.secret_box = SecretBox(history_base + ".key")
+        self.content_filter = None
+        if config["content_filter_enabled"]:
+            self.content_filter = ContentFilter(load_rules(config["content_filter_rules"]), self.secret_box,
+                                                config["content_filter_max_scan_chars"])
+        self._filter_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-filter")
+        self._dispatch = None
+
+        # 历史记录存储（后端由配置决定：json 快照 + 追加日志，或 sqlite），在 load() 中加载
+        self.history_store = create_history_store(config["history_backend"], history_base, config["large_payload_threshold"])
+        # 所有写盘都在后台线程中进行，调用方只提交，同一内容在合并窗口内的多次提交只写一次
+        self.persistence = PersistenceWorker(config["persist_coalesce_ms"] / 1000)
+        self.persistence.start()
+        self.history_store.auto_sync = False
+        self.loaded = threading.Event()
+        self.load_seconds = None
+        self._load_thread = None
+        self._pending = []
+
+        # 按保留策略在后台分批淘汰旧记录，加载完成后启动
+        retention_policy = RetentionPolicy(config["retention_max_entries"], config["retention_max_bytes"], config["retention_max_age_days"])
+        self.history_evictor = HistoryEvictor(self.history_store, retention_policy, on_evicted=self._evicted)
+
+        # 配置了共享目录时，通过各设备追加写的增量文件与其它机器同步历史记录，加载完成后启动
+        self.history_sync = None
+        if config["sync_dir"]:
+            self.history_sync = HistorySync(self.history_store, config["sync_dir"], history_base + ".sync.json",
+                                            config["sync_interval"], load_clip=self.clip_blobs.load,
+                                            put_clip=self.clip_blobs.put, on_synced=self._synced)
+
+    def load(self):
+        """加载历史记录，可以在后台线程中调用。"""
+        start = time.perf_counter()
+        self.history_store.load()
+        self.load_seconds = time.perf_counter() - start
+        self.collect_clip_garbage()
+        self.history_evictor.start()
+        if self.history_sync:
+            self.history_sync.start()
+        self.loaded.set()
+
+    def load_in_background(self, on_loaded):
+        """在后台线程中加载历史记录，完成后在该线程中调用 on_loaded()。"""
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Failed to load clipboard history: {e}")
+            on_loaded()
+
+        self._load_thread = threading.Thread(target=run, daemon=True)
+        self._load_thread.start()
+
+    def collect_clip_garbage(self):
+        """删除历史记录中已经不存在的图片和 HTML 正文（例如被删除或被保留策略淘汰的条目）。"""
+        if not os.path.isdir(self.clip_blobs.directory):
+            return
+        live, start = set(), 0
+        while True:
+            rows = self.history_store.slice_unique(start, 1000)
+            for digest, text, occurrences, first_seen, last_seen in rows:
+                ref = parse(text)
+                if ref:
+                    live.add(ref.digest)
+            if len(rows) < 1000:
+                break
+            start += len(rows)
+        removed = self.clip_blobs.collect_garbage(live)
+        if removed:
+            logger.info(f"Removed {removed} unused clipboard image/HTML files.")
+
+    def flush_pending(self):
+        """把加载期间暂存的内容写入历史记录，需要在处理剪切板变化的线程中调用。"""
+        pending, self._pending = self._pending, []
+        for timestamp, text in pending:
+            self.history_store.insert(timestamp, text)
+        if pending:
+            self.history_evictor.trigger()
+            self.sync()
+
+    def read_recent_header(self):
+        """读取上次退出时保存的最近记录 [(timestamp, text, truncated), ...]，用于加载完成前的显示。"""
+        try:
+            with open(self.recent_header_file, 'r', encoding='utf-8') as file:
+                return [tuple(entry) for entry in json.load(file)["entries"]]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable recent history header: {e}")
+            return []
+
+    def write_recent_header(self):
+        entries = []
+        for rank in range(self.RECENT_HEADER_ENTRIES):
+            entry = self.history_store.get_by_rank(rank)
+            if entry is None or entry[1] is None:
+                break
+            timestamp, text = entry
+            truncated = len(text) > self.RECENT_HEADER_CHARS
+            entries.append((timestamp, text[:PREVIEW_CHARS] if truncated else text, truncated))
+        try:
+            atomic_write(self.recent_header_file, json.dumps({"version": 1, "entries": entries}))
+        except OSError as e:
+            logger.error(f"Failed to write recent history header: {e}")
+
+    def start(self, root=None, threaded_on_change=None):
+        """启动剪切板监听。
+
+        root 为 Tk 根窗口时轮询在 Tk 事件循环中进行；后台线程读到的内容交给 threaded_on_change，
+        由它转交到调用方的线程后再调用 handle_clipboard。
+        """
+        self._dispatch = threaded_on_change or self.handle_clipboard
+        # 要运行外部命令的读取方式（xclip、wl-paste）即使有 Tk 窗口也在后台线程中轮询
+        if getattr(self.clipboard_reader, "threaded", False):
+            root = None
+        self.clipboard_watcher = create_clipboard_watcher(root, self.handle_clipboard, threaded_on_change or self.handle_clipboard,
+                                                          backend=self.config["clipboard_watcher_backend"],
+                                                          fetch=self.clipboard_reader.read,
+                                                          poll=getattr(self.clipboard_reader, "poll", None))
+
+    def stop(self):
+        if self.clipboard_watcher:
+            self.clipboard_watcher.stop()
+        # 还在过滤中的内容交回时已经没有人处理，直接丢弃
+        self._dispatch = None
+        self._filter_executor.shutdown(wait=True)
+        if self._load_thread:
+            self._load_thread.join()
+        if self.loaded.is_set():
+            self.history_evictor.stop()
+            self.flush_pending()
+            if self.history_sync:
+                self.history_sync.stop()
+            self.persistence.submit("recent history header", self.write_recent_header)
+        # 写完所有还在排队的内容后再关闭存储
+        self.persistence.stop()
+        self.clip_blobs.close()
+        if self.loaded.is_set():
+            try:
+                self.history_store.close()
+            except Exception as e:
+                logger.error(f"Failed to close clipboard history store: {e}")
+        self.instance_lock.release()
+
+    def handle_clipboard(self, new_clipboard_text):
+        try:
+            if isinstance(new_clipboard_text, FilteredCapture):
+                self.add_filtered(new_clipboard_text)
+            elif isinstance(new_clipboard_text, ClipboardData):
+                self.handle_clipboard_data(new_clipboard_text)
+            elif new_clipboard_text != self.clipboard_text:
+                if not self.check_worng_clipboard(new_clipboard_text):
+                    self.clipboard_text = new_clipboard_text
+                    self.filter_and_add(new_clipboard_text)
+        except pyperclip.PyperclipException as pe:
+            logger.error(f"Pyperclip error: {pe}")
+        except Exception as e:
+            logger.error(f"Error handling clipboard change: {e}")
+
+    def handle_clipboard_data(self, data):
+        # 历史记录中只保存描述，正文按内容哈希保存，图片的缩略图在线程池中生成
+        text = describe(data)
+        if text == self.clipboard_text:
+            return
+        self.clipboard_text = text
+        self.filter_and_add(text, data)
+
+    def filter_and_add(self, text, data=None):
+        if self.content_filter is None:
+            self.add_filtered(FilteredCapture(text, data, None))
+        elif self._dispatch is None:
+            # 没有启动监听（例如基准测试直接调用 handle_clipboard）时在当前线程中过滤
+            self.add_filtered(self._filter(text, data))
+        else:
+            self._filter_executor.submit(self._filter_in_background, text, data)
+
+    def _filter(self, text, data):
+        result = self.content_filter.scan(text)
+        if data is not None and result.action:
+            # 图片和 HTML 的正文无法局部遮盖或加密，纯文本部分命中任何规则都不记录
+            result = result._replace(action="drop", text=None)
+        return FilteredCapture(result.text, data, result)
+
+    def _filter_in_background(self, text, data):
+        try:
+            capture = self._filter(text, data)
+            dispatch = self._dispatch
+            if dispatch:
+                dispatch(capture)
+        except Exception as e:
+            logger.error(f"Error filtering clipboard content: {e}")
+
+    def add_filtered(self, capture):
+        result = capture.result
+        if result and result.action == "drop":
+            # 日志中只记录命中的规则，不记录内容
+            logger.warning(f"Dropped clipboard content matching sensitive content rules: {', '.join(result.rules)}")
+            return
+        if result and result.action:
+            logger.info(f"Clipboard content matched {', '.join(result.rules)}, stored with secrets {result.action}ed.")
+        if capture.data is not None:
+            self.clip_blobs.put(parse(capture.text), capture.data.data, self.on_thumbnail)
+        self.add_to_history(capture.text)
+
+    def check_worng_clipboard(self, text):
+        worng = ['••••••••••']
+        if text in worng:
+            logger.warning(f"Clipboard contains worng text: {loggable(text)}")
+            pyperclip.copy(self.clipboard_text)
+            logger.warning(f"Clipboard has been replaced with the original text: {loggable(self.clipboard_text)}")
+            return True
+        return False
+
+    def add_to_history(self, text):
+        logger.info(f"Adding to clipboard history: {loggable(text)}")
+        timestamp = datetime.now().isoformat()
+        if not self.loaded.is_set() or self._pending:
+            # 历史记录还在加载（或暂存的内容还没有写入），先暂存，保证写入顺序
+            self._pending.append((timestamp, text))
+        else:
+            # 只追加一条日志记录，不再重写整个历史文件
+            self.history_store.insert(timestamp, text)
+            self.history_evictor.trigger()
+            self.sync()
+        if self.history_sync:
+            self.history_sync.record_add(timestamp, text)
+        if self.on_added:
+            self.on_added(timestamp, text)
+        return timestamp
+
+    def delete_history(self, timestamps):
+        """删除指定时间戳的记录，返回删除的条数；开启同步时其它机器上的同一条记录也会被删除。"""
+        deleted = 0
+        for timestamp in timestamps:
+            logger.debug(f"Deleting item with timestamp: {timestamp}")
+            text = self.history_store.get(timestamp)
+            if text is None or not self.history_store.delete(timestamp):
+                continue
+            deleted += 1
+            if self.history_sync:
+                self.history_sync.record_delete(timestamp, text)
+        self.sync()
+        return deleted
+
+    def clear_history(self):
+        """清空历史记录；开启同步时其它机器上不晚于现在的记录也会被清空。"""
+        self.history_store.clear()
+        if self.history_sync:
+            self.history_sync.record_clear(datetime.now().isoformat())
+        self.sync()
+
+    def copy_to_clipboard(self, record):
+        """把历史记录复制回剪切板，不会被当成新的复制再记录一次。"""
+        # 加密的片段复制回剪切板时解密
+        text = self.secret_box.decrypt_text(record)
+        self.clipboard_text = text
+        ref = parse(text)
+        if ref:
+            # 只在复制回剪切板时才读取完整的图片/HTML
+            data = self.clip_blobs.load(ref)
+            if data is None:
+                raise ValueError(f"{ref.mime} content is missing")
+            self.clipboard_reader.write(ClipboardData(ref.mime, data, ref.text))
+        else:
+            self.clipboard_reader.write(text)
+        # 日志中用解密之前的内容，开启 log_content 时也不会把解密的片段写进日志
+        logger.info(f"Copied record to clipboard: {loggable(record)}")
+
+    def export_history(self, path, since=None, until=None):
+        """把 since <= 时间戳 <= until 的历史记录逐条导出为 NDJSON（文件名以 .gz 结尾时压缩），返回导出的条数。"""
+        return export_archive(self.history_store, path, since, until, self.clip_blobs.load)
+
+    def import_history(self, path, since=None, until=None, dedup="entry"):
+        """把 NDJSON 导出文件或旧版的历史文件合并进历史记录，返回统计；导入的内容同样经过敏感内容过滤。"""
+        stats = import_archive(self.history_store, iter_archive(path), since, until, dedup, put_clip=self.clip_blobs.put,
+                               scan=self.content_filter.scan if self.content_filter else None)
+        self.history_evictor.trigger()
+        self.sync()
+        return stats
+
+    def sync(self):
+        """在后台线程中把历史记录刷到磁盘，不等待写盘完成。"""
+        if not self.loaded.is_set():
+            return
+        self.persistence.submit("clipboard history", self.history_store.sync)
+
+    def _evicted(self, count, reclaimed):
+        if self.on_evicted:
+            self.on_evicted(count, reclaimed)
+
+    def _synced(self, count):
+        # 在同步线程中调用，其它机器的记录已经写入存储
+        self.history_evictor.trigger()
+        self.sync()
+        if self.on_synced:
+            self.on_synced(count)
@@ -0,0 +1,359 @@
+import io
+import os
+import shutil
+import struct
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pyperclip
+
+from content_filter import hide_encrypted
+from clipboard_watcher import SelectionOwner
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClipboardData(namedtuple("ClipboardData", "mime data text")):
+    """非纯文本的剪切板内容：mime 为 image/png 或 text/html，data 为原始字节，text 为同时提供的纯文本（可能为空）。"""
+
+
+# 历史记录中非纯文本条目的内容：CLIP_PREFIX + "<mime> <hash> <字节数> <宽>x<高>\n<纯文本>"，
+# 正文保存在内容寻址的文件中，历史记录（以及去重、搜索、保留策略）只处理这段描述。
+# 前缀用 U+FFFC（对象替换字符），不能用 \x00，SQLite 的全文索引遇到 \x00 会截断
+CLIP_PREFIX = "\ufffcclip:"
+
+ClipRef = namedtuple("ClipRef", "mime digest size width height text")
+
+EXTENSIONS = {"image/png": ".png", "text/html": ".html"}
+
+
+def is_clip(text):
+    return text.startswith(CLIP_PREFIX)
+
+
+def image_size(data):
+    # 直接读取 PNG 的 IHDR 块，不需要解码图片
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    return 0, 0
+
+
+def describe(data):
+    """返回 ClipboardData 在历史记录中的描述文本。"""
+    digest = hashlib.blake2b(data.data, digest_size=16).hexdigest()
+    width, height = image_size(data.data) if data.mime.startswith("image/") else (0, 0)
+    return f"{CLIP_PREFIX}{data.mime} {digest} {len(data.data)} {width}x{height}\n{data.text}"
+
+
+def parse(text):
+    """解析 describe() 生成的描述文本，不是非纯文本条目时返回 None。"""
+    if not is_clip(text):
+        return None
+    header, _, plain = text[len(CLIP_PREFIX):].partition("\n")
+    try:
+        mime, digest, size, dimensions = header.split(" ")
+        width, height = dimensions.split("x")
+        return ClipRef(mime, digest, int(size), int(width), int(height), plain)
+    except ValueError:
+        return None
+
+
+def display_text(text):
+    """列表和文本框中显示的内容：非纯文本条目显示类型、尺寸和大小，HTML 同时显示纯文本。"""
+    ref = parse(text)
+    if ref is None:
+        return hide_encrypted(text)
+    size = f"{ref.size / 1024:.0f} KB" if ref.size >= 1024 else f"{ref.size} B"
+    if ref.mime.startswith("image/"):
+        return f"[image {ref.width}x{ref.height}, {size}]"
+    return f"[{ref.mime}, {size}] {ref.text}"
+
+
+# ----------------------------------------------------------------------
+# 读取剪切板
+# ----------------------------------------------------------------------
+class PyperclipReader:
+    """只读写纯文本（原来的行为），在没有 xclip/wl-clipboard 的平台上使用。"""
+
+    formats = ("text/plain",)
+    # 读取很快，可以在 Tk 事件循环中轮询
+    threaded = False
+
+    def read(self):
+        return pyperclip.paste()
+
+    def poll(self):
+        return self.read()
+
+    def write(self, content):
+        if isinstance(content, ClipboardData):
+            # 不支持其他格式时退回到复制纯文本
+            logger.warning(f"Clipboard reader cannot write {content.mime}, copying plain text instead.")
+            content = content.text
+        pyperclip.copy(content)
+
+
+class CommandReader:
+    """通过外部命令读取多种格式。
+
+    剪切板中有 PREFERRED 中的格式时按顺序取第一个，否则按纯文本读取。
+    子类提供列出格式、读取和写入的命令。
+    """
+
+    PREFERRED = ("image/png", "text/html")
+    formats = PREFERRED + ("text/plain",)
+    timeout = 5
+    # 每次读取都要运行外部命令，轮询放在后台线程中，不阻塞 Tk 事件循环
+    threaded = True
+
+    def list_targets_command(self):
+        raise NotImplementedError
+
+    def read_command(self, mime):
+        raise NotImplementedError
+
+    def write_command(self, mime):
+        raise NotImplementedError
+
+    def read(self):
+        try:
+            return self._read_targets(self._list_targets())
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"Failed to list clipboard formats, reading plain text: {e}")
+        return pyperclip.paste()
+
+    def poll(self):
+        """轮询时调用，默认与 read() 相同。"""
+        return self.read()
+
+    def _list_targets(self):
+        return self._run(self.list_targets_command()).decode('utf-8', 'replace').split()
+
+    def _read_targets(self, targets, text=None):
+        text = pyperclip.paste() if text is None else text
+        for mime in self.PREFERRED:
+            if mime in targets:
+                return ClipboardData(mime, self._run(self.read_command(mime)), text)
+        return text
+
+    def write(self, content):
+        if not isinstance(content, ClipboardData):
+            pyperclip.copy(content)
+            return
+        # 这些工具一次只能提供一种格式，非纯文本条目按原来的格式写回
+        subprocess.run(self.write_command(content.mime), input=content.data, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, timeout=self.timeout, check=True)
+
+    def _run(self, command):
+        return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              timeout=self.timeout, check=True).stdout
+
+
+class XclipReader(CommandReader):
+    """X11：通过 xclip 读取 TARGETS 和各个格式。选区的 TIMESTAMP 不变时直接返回上一次读到的内容。
+
+    所有者不支持 TIMESTAMP 时，轮询（poll）按 TARGETS 列表和所有者窗口缓存：两者都没变时只重新读取
+    纯文本，纯文本也没变就直接返回上一次的内容，不再读取图片或 HTML。同一个程序连续复制两张
+    没有纯文本的图片时轮询会漏掉后一张；XFixes 监听器只在剪切板易主时调用 read()，不受影响。
+    """
+
+    def __init__(self, owner=None):
+        self._last_timestamp = None
+        self._last_content = None
+        self._last_key = None
+        self.owner = owner or SelectionOwner()
+
+    def list_targets_command(self):
+        return ["xclip", "-selection", "clipboard", "-t", "TARGETS", "-o"]
+
+    def read_command(self, mime):
+        return ["xclip", "-selection", "clipboard", "-t", mime, "-o"]
+
+    def write_command(self, mime):
+        return ["xclip", "-selection", "clipboard", "-t", mime, "-i"]
+
+    def read(self):
+        return self._read(cached=False)
+
+    def poll(self):
+        return self._read(cached=True)
+
+    def _read(self, cached):
+        # 轮询时大多数情况下剪切板没有变化，不用每次都把图片读一遍
+        try:
+            timestamp = self._run(self.read_command("TIMESTAMP")).strip()
+        except (OSError, subprocess.SubprocessError):
+            timestamp = None
+        if timestamp and timestamp == self._last_timestamp:
+            return self._last_content
+        key = text = None
+        try:
+            targets = self._list_targets()
+            if cached and not timestamp and set(targets) & set(self.PREFERRED):
+                owner, text = self.owner(), pyperclip.paste()
+                key = (tuple(targets), owner, text) if owner is not None else None
+                if key is not None and key == self._last_key:
+                    return self._last_content
+            content = self._read_targets(targets, text)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"Failed to list clipboard formats, reading plain text: {e}")
+            content = pyperclip.paste()
+        self._last_timestamp, self._last_content, self._last_key = timestamp, content, key
+        return content
+
+
+class WlClipboardReader(CommandReader):
+    """Wayland：通过 wl-paste/wl-copy 读写。"""
+
+    def list_targets_command(self):
+        return ["wl-paste", "--list-types"]
+
+    def read_command(self, mime):
+        return ["wl-paste", "--no-newline", "--type", mime]
+
+    def write_command(self, mime):
+        return ["wl-copy", "--type", mime]
+
+
+# 可以通过 register_reader 添加其他平台的读取方式
+READERS = {
+    "pyperclip": PyperclipReader,
+    "xclip": XclipReader,
+    "wl-clipboard": WlClipboardReader,
+}
+
+
+def register_reader(name, reader_class):
+    READERS[name] = reader_class
+
+
+def create_clipboard_reader(backend="auto"):
+    """按配置或平台选择剪切板读取方式，auto 时优先使用 wl-clipboard/xclip，都不可用时只读取纯文本。"""
+    if backend == "auto":
+        if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-paste") and shutil.which("wl-copy"):
+            backend = "wl-clipboard"
+        elif os.environ.get("DISPLAY") and shutil.which("xclip"):
+            backend = "xclip"
+        else:
+            backend = "pyperclip"
+    reader_class = READERS.get(backend)
+    if reader_class is None:
+        logger.warning(f"Unknown clipboard reader '{backend}', falling back to pyperclip.")
+        backend, reader_class = "pyperclip", PyperclipReader
+    logger.info(f"Using {backend} clipboard reader ({', '.join(reader_class.formats)}).")
+    return reader_class()
+
+
+# ----------------------------------------------------------------------
+# 内容寻址的正文和缩略图
+# ----------------------------------------------------------------------
+class ClipBlobStore:
+    """非纯文本条目的正文按内容哈希保存在 <directory>/<哈希前两位>/<哈希><扩展名> 中，相同内容只保存一份。
+
+    写盘在后台线程中进行，写完之前的读取直接返回内存中的内容。缩略图由线程池生成，
+    缓存在 <directory>/thumbs/<哈希>.png，需要 Pillow，没有安装时不生成缩略图。
+    """
+
+    THUMBNAIL_SIZE = (96, 96)
+
+    def __init__(self, directory, thumbnail_workers=2):
+        self.directory = directory
+        self.thumbnail_directory = os.path.join(directory, "thumbs")
+        self._pending = {}
+        # 本次运行中保存过的内容，历史记录可能还没有写入，清理时不能删除
+        self._added = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-blobs")
+        self._thumbnailer = ThreadPoolExecutor(max_workers=thumbnail_workers, thread_name_prefix="thumbnail")
+
+    def path(self, ref):
+        return os.path.join(self.directory, ref.digest[:2], ref.digest + EXTENSIONS.get(ref.mime, ".bin"))
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.thumbnail_directory, digest + ".png")
+
+    def put(self, ref, data, on_thumbnail=None):
+        """保存正文，图片同时在线程池中生成缩略图，完成后在线程池中调用 on_thumbnail(digest, path)。"""
+        with self._lock:
+            self._pending[ref.digest] = data
+            self._added.add(ref.digest)
+        self._executor.submit(self._write, ref, data)
+        if Image is not None and ref.mime.startswith("image/"):
+            self._thumbnailer.submit(self._make_thumbnail, ref.digest, data, on_thumbnail)
+
+    def _write(self, ref, data):
+        try:
+            path = self.path(ref)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to store clipboard {ref.mime} {ref.digest}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(ref.digest, None)
+
+    def _make_thumbnail(self, digest, data, on_thumbnail):
+        path = self.thumbnail_path(digest)
+        try:
+            if not os.path.exists(path):
+                with Image.open(io.BytesIO(data)) as image:
+                    image.thumbnail(self.THUMBNAIL_SIZE)
+                    os.makedirs(self.thumbnail_directory, exist_ok=True)
+                    tmp_path = path + ".tmp"
+                    image.save(tmp_path, format="PNG")
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to create thumbnail for {digest}: {e}")
+            return
+        if on_thumbnail:
+            on_thumbnail(digest, path)
+
+    def load(self, ref):
+        with self._lock:
+            data = self._pending.get(ref.digest)
+        if data is not None:
+            return data
+        try:
+            with open(self.path(ref), 'rb') as file:
+                return file.read()
+        except OSError as e:
+            logger.error(f"Failed to load clipboard {ref.mime} {ref.digest}: {e}")
+            return None
+
+    def collect_garbage(self, live_digests):
+        """删除不再被任何历史记录引用的正文和缩略图，返回删除的文件数。"""
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                digest = name.split(".", 1)[0]
+                with self._lock:
+                    if digest in live_digests or digest in self._added:
+                        continue
+                try:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+                except OSError as e:
+                    logger.error(f"Failed to remove unused clipboard file {name}: {e}")
+        return removed
+
+    def close(self):
+        self._thumbnailer.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
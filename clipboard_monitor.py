@@ -1,50 +1,151 @@
 import tkinter as tk
 from tkinter import messagebox, colorchooser, font
-import pyperclip
-import psutil
 import os
-import json
-from datetime import datetime
+import sys
+import queue
+import time
+import argparse
 import logging
+from collections import OrderedDict
+
+from clipboard_engine import ClipboardEngine, read_config, write_config
+from persistence import InstanceLockedError
+from ipc_server import run_headless
+from virtual_listbox import VirtualListbox
+from menu_choices import MenuChoices
+from clipboard_formats import parse as parse_clip, display_text
+from system_sampler import SystemSampler
+from instrumentation import Instrumentation, AfterLagProbe
+from log_pipeline import LogPipeline, loggable
+from history_archive import DEDUP_MODES, parse_time_bound
+
+# __main__ 运行时 __name__ 不是模块名，按模块名取得界面的 logger，log_levels 中用 clipboard_monitor 设置级别
+logger = logging.getLogger("clipboard_monitor")
+
+
+def list_preview(text, limit=50):
+    """列表中显示的前 limit 个字符。"""
+    return display_text(text)[:limit]
+
+
+class PreviewCache:
+    """存储中记录的列表预览，按时间戳（去重视图按内容哈希）缓存最近用过的 maxsize 条。
+
+    滚动和刷新时同一条记录反复出现，缓存之后不再每次重新生成预览字符串。只保存截断后的预览，
+    不会让完整内容（包括已经删除的记录）一直留在内存中；删除或清空记录后调用 clear()，
+    重新使用的时间戳不会显示旧的预览。
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.previews = OrderedDict()
+
+    def get(self, key, text, limit=50):
+        key = (key, limit)
+        preview = self.previews.get(key)
+        if preview is None:
+            preview = self.previews[key] = list_preview(text, limit)
+            if len(self.previews) > self.maxsize:
+                self.previews.popitem(last=False)
+        else:
+            self.previews.move_to_end(key)
+        return preview
+
+    def clear(self):
+        self.previews.clear()
+
 
 class ClipboardMonitor:
-    def __init__(self, root):
+    DEFAULT_CONFIG = {
+        "alpha": 0.7,
+        "bg_color": "#333333",
+        "lable_font": "Arial",
+        "lable_font_size": 11,
+        "lable_font_weight": "normal",
+        "content_font": "Arial",
+        "content_font_size": 11,
+        "content_font_weight": "normal",
+        "history_backend": "json",
+        "clipboard_watcher_backend": "auto",
+        "system_info_process_stats": False,
+        "history_unique_view": False,
+        "large_payload_threshold": 256 * 1024,
+        "retention_max_entries": 0,
+        "retention_max_bytes": 0,
+        "retention_max_age_days": 0,
+        "instrumentation_enabled": False,
+        "metrics_file_interval": 10,
+        "persist_coalesce_ms": 500,
+        "clipboard_reader_backend": "auto",
+        "content_filter_enabled": True,
+        "content_filter_rules": [],
+        "content_filter_max_scan_chars": 1024 * 1024,
+        "log_level": "INFO",
+        "log_levels": {},
+        "log_max_bytes": 2 * 1024 * 1024,
+        "log_backup_count": 5,
+        "log_content": False,
+        "sync_dir": "",
+        "sync_interval": 5
+    }
+
+    # 当前剪切板文本框最多显示的字符数，更大的内容只显示开头
+    TEXT_BOX_PREVIEW_CHARS = 10000
+
+    # 搜索最多返回的条数，以及输入停顿多久后才执行查询（毫秒）
+    SEARCH_RESULT_LIMIT = 200
+    SEARCH_DELAY = 100
+
+    # 字体大小菜单中的选项，以及字体名称菜单每页的条数
+    FONT_SIZES = [8, 9, 10, 11, 12, 13, 14, 16, 18, 20, 22, 24, 26, 28, 36, 48, 72]
+    FONT_MENU_PAGE_SIZE = 40
+
+    def __init__(self, root, data_dir=None):
+        self.startup_started = time.perf_counter()
         self.root = root
         self.root.title("Clipboard Monitor")
-        self.clipboard_text = ""
-        self.clipboard_history = {}
         
-        # 获取脚本所在目录并构建历史记录文件路径
-        script_dir = os.path.dirname(os.path.abspath(__file__))
+        # 获取脚本所在目录并构建历史记录文件路径（基准测试等场景可以指定其他目录）
+        script_dir = data_dir or os.path.dirname(os.path.abspath(__file__))
         self.history_file = os.path.join(script_dir, "clipboard_history.json")
         self.log_file = os.path.join(script_dir, "clipboard_monitor.log")
         self.config_file = os.path.join(script_dir, "config.json")
+        self.metrics_file = os.path.join(script_dir, "clipboard_metrics.json")
 
-        # 配置日志记录
-        logging.basicConfig(
-            filename=self.log_file,
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        
-        # 加载历史记录
-        if os.path.exists(self.history_file):
-            with open(self.history_file, 'r') as file:
-                try:
-                    data = json.load(file)
-                    if isinstance(data, dict):
-                        self.clipboard_history = data
-                    else:
-                        logging.warning("History file format is incorrect. Converting to dictionary.")
-                        self.clipboard_history = {datetime.now().isoformat(): entry for entry in data}
-                except json.JSONDecodeError:
-                    logging.error("Failed to decode JSON from history file. Creating a new empty history.")
-                    self.clipboard_history = {}
+        # 日志先进入队列，读取配置之后再按配置的级别和轮转大小写入文件
+        self.log_pipeline = LogPipeline(self.log_file)
 
         # 加载配置
         self.load_config()
-        
+        self.log_pipeline.start({key: getattr(self, key) for key in self.DEFAULT_CONFIG})
+
+        # 后台线程把结果交给 Tk 线程执行的回调队列
+        self.ui_queue = queue.Queue()
+
+        # 热点路径耗时统计：关闭时不包装任何方法，没有额外开销
+        self.instrumentation = Instrumentation(self.instrumentation_enabled)
+        for method in ("process_clipboard_queue", "process_ui_queue", "update_system_info", "update_history_listbox",
+                       "on_history_added", "open_history_window", "delete_selected", "run_search"):
+            self.instrumentation.instrument(self, method, f"ui.{method}")
+        self.metrics_window = None
+
+        # 与界面无关的核心：历史记录存储、保留策略和剪切板监听，窗口只是它的一个使用者
+        self.engine = ClipboardEngine(os.path.splitext(self.history_file)[0], {key: getattr(self, key) for key in self.DEFAULT_CONFIG},
+                                      on_added=self.on_history_added,
+                                      on_evicted=lambda count, reclaimed: self.ui_queue.put(lambda: self.on_history_evicted(count, reclaimed)),
+                                      on_thumbnail=lambda digest, path: self.ui_queue.put(lambda: self.on_thumbnail_ready(digest)),
+                                      on_synced=lambda count: self.ui_queue.put(lambda: self.on_history_synced(count)))
+        self.history_store = self.engine.history_store
+        self.instrumentation.instrument(self.engine, "handle_clipboard", "check_clipboard")
+        self.instrumentation.instrument(self.engine, "add_to_history", "add_to_history")
+        for method in ("insert", "delete", "sync", "search", "slice_by_rank"):
+            self.instrumentation.instrument(self.history_store, method, f"store.{method}")
+
+        # 历史记录在窗口显示之后才在后台加载，加载完成前先显示上次退出时保存的最近几条记录
+        self.recent_entries = self.engine.read_recent_header()
+        self.history_ready = False
+        self.font_families = None
+        self.font_search_window = None
 
         # 创建框架用于显示剪切板内容和历史记录
         self.frame = tk.Frame(root, bg=self.bg_color)
@@ -55,25 +156,52 @@ class ClipboardMonitor:
         self.current_clipboard_label.grid(row=0, column=0, sticky="w")
         self.text_box = tk.Text(self.frame, wrap=tk.WORD, height=5, width=40, state=tk.DISABLED, font=(self.content_font, self.content_font_size, self.content_font_weight))
         self.text_box.grid(row=1, column=0, padx=10, pady=10)
+        # 当前显示的图片缩略图（需要保留引用，否则会被回收）和它对应的内容哈希
+        self.text_box_image = None
+        self.text_box_digest = None
 
         # 创建标签用于显示CPU和内存使用情况
         self.status_label = tk.Label(root, text="", font=(self.lable_font, self.lable_font_size, self.lable_font_weight), bg=self.bg_color, fg="white")
         self.status_label.pack(pady=5)
+        self.system_sampler = None
+        self.system_info_queue = queue.Queue()
+
+        self.history_window = None
 
-        # 创建列表框用于显示剪切板历史记录
-        self.history_listbox = tk.Listbox(root, height=10, width=40, font=(self.content_font, self.content_font_size, self.content_font_weight), selectmode=tk.SINGLE)
+        # 搜索框：输入时按全文索引过滤历史记录，按 Esc 清空
+        self.search_var = tk.StringVar()
+        self.search_results = []
+        self.search_after_id = None
+        self.previews = PreviewCache()
+        self.search_entry = tk.Entry(root, textvariable=self.search_var, width=40, font=(self.content_font, self.content_font_size, self.content_font_weight))
+        self.search_entry.pack(padx=10, pady=(10, 0))
+        self.search_entry.bind('<Escape>', lambda event: self.search_var.set(""))
+        self.search_var.trace_add("write", self.on_search_changed)
+
+        # 创建列表框用于显示剪切板历史记录（只渲染可见的行）
+        row_count, fetch_rows = self.history_view_source()
+        self.history_listbox = VirtualListbox(root, row_count, fetch_rows, height=10, width=40, font=(self.content_font, self.content_font_size, self.content_font_weight), selectmode=tk.SINGLE)
         self.history_listbox.pack(padx=10, pady=10)
-        self.update_history_listbox()
+        for method in ("refresh", "insert_rows", "delete_rows"):
+            self.instrumentation.instrument(self.history_listbox, method, f"render.{method}")
 
         # 绑定双击事件以复制选中的历史记录
         self.history_listbox.bind('<Double-Button-1>', self.copy_selected_record)
 
-        # 启动第一次检查
-        self.check_clipboard()
+        # 启动剪切板监听：X11 上订阅选区所有者变化，其他平台退回到定时轮询
+        self.clipboard_queue = queue.Queue()
+        self.engine.start(self.root, self.clipboard_queue.put)
+        self.instrumentation.instrument(self.engine.clipboard_watcher, "fetch", "clipboard.paste")
+        self.process_clipboard_queue()
+        self.process_ui_queue()
 
         # 设置窗口始终在最顶层
         self.topmost_var = tk.BooleanVar(value=True)
         self.topmost_checkbox = tk.Checkbutton(root, text="Keep window on top", variable=self.topmost_var, command=self.toggle_topmost)
+
+        # 只显示去重后的内容，按最近使用时间排序
+        self.unique_view_var = tk.BooleanVar(value=self.history_unique_view)
+        self.unique_view_checkbox = tk.Checkbutton(root, text="Unique only", variable=self.unique_view_var, command=self.toggle_unique_view)
         
         # 管理历史记录的按钮
         self.manage_history_button = tk.Button(root, text="Manage History", command=self.open_history_window)
@@ -86,40 +214,80 @@ class ClipboardMonitor:
         frame.pack(pady=5, expand=True, fill=tk.X)
         
         self.topmost_checkbox.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        self.unique_view_checkbox.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self.manage_history_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self.clear_all_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         
         # 初始设置
         self.toggle_topmost()
-        
-        self.history_window = None
 
         # 设置窗口透明度和背景色
         self.root.attributes("-alpha", self.alpha)
         self.root.configure(bg=self.bg_color)
 
-        # 启动第一次日志清理检查
-        self.check_and_clean_log_file()
-
         # 创建菜单栏
         self.create_menu()
 
+        # 定期将日志刷到磁盘，关闭窗口时保证数据落盘
+        self.sync_history()
+
+        # 测量 after() 回调比预期晚了多久，并定期把统计写到文件中
+        self.after_lag_probe = AfterLagProbe(self.root, self.instrumentation)
+        self.after_lag_probe.start()
+        if self.instrumentation.enabled:
+            self.write_metrics_file()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 窗口第一次显示时报告启动耗时，之后才开始加载完整的历史记录
+        self.root.bind('<Map>', self.on_first_map)
+        self.engine.load_in_background(lambda: self.ui_queue.put(self.on_history_loaded))
+
+    def on_first_map(self, event):
+        if event.widget is not self.root:
+            return
+        self.root.unbind('<Map>')
+        self.root.after_idle(self.report_first_frame)
+
+    def report_first_frame(self):
+        elapsed = time.perf_counter() - self.startup_started
+        self.instrumentation.record("startup.first_frame", elapsed)
+        logger.info(f"Time to first frame: {elapsed * 1000:.0f} ms")
+
+    def on_history_loaded(self):
+        if not self.engine.loaded.is_set():
+            messagebox.showerror("Clipboard History", "Failed to load clipboard history, see the log file for details.")
+            return
+        # 把加载期间捕获的内容写入历史记录，再把占位的最近记录换成完整的列表
+        self.engine.flush_pending()
+        self.history_ready = True
+        self.recent_entries = []
+        self.history_listbox.row_count, self.history_listbox.fetch_rows = self.history_view_source()
+        self.history_listbox.selection_clear()
+        self.update_history_listbox()
+        self.instrumentation.record("startup.history_loaded", time.perf_counter() - self.startup_started)
+        logger.info(f"Loaded {self.history_store.count()} history entries in {self.engine.load_seconds * 1000:.0f} ms "
+                     f"({(time.perf_counter() - self.startup_started) * 1000:.0f} ms after startup)")
+
+    def history_loading(self, title):
+        # 加载完成之前不能修改历史记录
+        if self.history_ready:
+            return False
+        messagebox.showinfo(title, "Clipboard history is still loading, please try again in a moment.")
+        return True
+
 
 
     def create_menu(self):
+        # 菜单只创建一次，修改设置时只更新新旧两项的高亮
         menubar = tk.Menu(self.root)
         self.root.config(menu=menubar)
+        self.menu_choices = {}
 
         # 透明度菜单
         transparency_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Transparency", menu=transparency_menu)
-        for alpha in [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]:
-            label_text = f"{int(alpha * 100)}%"
-            if alpha == self.alpha:
-                # 高亮显示当前的 alpha 值
-                transparency_menu.add_command(label=label_text, command=lambda a=alpha: self.set_alpha(a), font=("Arial", 11, "bold"), background="lightblue")
-            else:
-                transparency_menu.add_command(label=label_text, command=lambda a=alpha: self.set_alpha(a), font=("Arial", 11, "normal"))
+        self.add_choice_menu(transparency_menu, "alpha", [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0], self.set_alpha,
+                             label=lambda alpha: f"{int(alpha * 100)}%")
 
         # 颜色菜单
         color_menu = tk.Menu(menubar, tearoff=0)
@@ -132,48 +300,28 @@ class ClipboardMonitor:
 
         # 字体选择子菜单
         # 标签子菜单
+        # 字体很多时逐个创建菜单项很慢，第一次展开子菜单时才创建，每一项用自己的字体显示
         font_name_menu = tk.Menu(font_menu, tearoff=0)
+        font_name_menu.configure(postcommand=lambda: self.populate_font_menu(font_name_menu, "label"))
         font_menu.add_cascade(label="Font Name - Label", menu=font_name_menu)
-        available_fonts = list(font.families())
-        for font_name in available_fonts:
-            if font_name == self.lable_font:
-                # 高亮显示当前的字体名称
-                font_name_menu.add_command(label=font_name, command=lambda fn=font_name: self.set_font_name(fn, "label"), font=(font_name, 11, "bold"), background="lightblue")
-            else:
-                font_name_menu.add_command(label=font_name, command=lambda fn=font_name: self.set_font_name(fn, "label"), font=(font_name, 11, "normal"))
+        self.menu_choices["lable_font"] = MenuChoices(self.lable_font, item_font=lambda font_name: font_name)
 
         # 内容子菜单
         font_name_menu_content = tk.Menu(font_menu, tearoff=0)
+        font_name_menu_content.configure(postcommand=lambda: self.populate_font_menu(font_name_menu_content, "content"))
         font_menu.add_cascade(label="Font Name - Content", menu=font_name_menu_content)
-        for font_name in available_fonts:
-            if font_name == self.content_font:
-                # 高亮显示当前的字体名称
-                font_name_menu_content.add_command(label=font_name, command=lambda fn=font_name: self.set_font_name(fn, "content"), font=(font_name, 11, "bold"), background="lightblue")
-            else:
-                font_name_menu_content.add_command(label=font_name, command=lambda fn=font_name: self.set_font_name(fn, "content"), font=(font_name, 11, "normal"))
-                
+        self.menu_choices["content_font"] = MenuChoices(self.content_font, item_font=lambda font_name: font_name)
+
         # 字体大小子菜单
         # 标签子菜单
         font_size_menu = tk.Menu(font_menu, tearoff=0)
         font_menu.add_cascade(label="Font Size - Label", menu=font_size_menu)
-        for font_size in [8, 9, 10, 11, 12, 13, 14, 16, 18, 20, 22, 24, 26, 28, 36, 48, 72]:
-            if font_size == self.lable_font_size:
-                # 高亮显示当前的字体大小
-                font_size_menu.add_command(label=str(font_size), command=lambda fs=font_size: self.set_font_size(fs, "label"), font=("Arial", 11, "bold"), background="lightblue")
-            else:
-                font_size_menu.add_command(label=str(font_size), command=lambda fs=font_size: self.set_font_size(fs, "label"), font=("Arial", 11, "normal"))
+        self.add_choice_menu(font_size_menu, "lable_font_size", self.FONT_SIZES, lambda fs: self.set_font_size(fs, "label"))
 
         # 内容子菜单
         font_size_menu_content = tk.Menu(font_menu, tearoff=0)
         font_menu.add_cascade(label="Font Size - Content", menu=font_size_menu_content)
-        for font_size in [8, 9, 10, 11, 12, 13, 14, 16, 18, 20, 22, 24, 26, 28, 36, 48, 72]:
-            if font_size == self.content_font_size:
-                # 高亮显示当前的字体大小
-                font_size_menu_content.add_command(label=str(font_size), command=lambda fs=font_size: self.set_font_size(fs, "content"), font=("Arial", 11, "bold"), background="lightblue")
-            else:
-                font_size_menu_content.add_command(label=str(font_size), command=lambda fs=font_size: self.set_font_size(fs, "content"), font=("Arial", 11, "normal"))
-        
-
+        self.add_choice_menu(font_size_menu_content, "content_font_size", self.FONT_SIZES, lambda fs: self.set_font_size(fs, "content"))
 
         # # 字体颜色子菜单
         # font_color_menu = tk.Menu(font_menu, tearoff=0)
@@ -184,31 +332,96 @@ class ClipboardMonitor:
         # 标签子菜单
         font_weight_menu = tk.Menu(font_menu, tearoff=0)
         font_menu.add_cascade(label="Font Weight - Label", menu=font_weight_menu)
-        for font_weight in ["normal", "bold"]:
-            if font_weight == self.lable_font_weight:
-                # 高亮显示当前的字体粗细
-                font_weight_menu.add_command(label=font_weight, command=lambda fw=font_weight: self.set_font_weight(fw, "label"), font=("Arial", 11, "bold"), background="lightblue")
-            else:
-                font_weight_menu.add_command(label=font_weight, command=lambda fw=font_weight: self.set_font_weight(fw, "label"), font=("Arial", 11, "normal"))
+        self.add_choice_menu(font_weight_menu, "lable_font_weight", ["normal", "bold"], lambda fw: self.set_font_weight(fw, "label"))
 
         # 内容子菜单
         font_weight_menu_content = tk.Menu(font_menu, tearoff=0)
         font_menu.add_cascade(label="Font Weight - Content", menu=font_weight_menu_content)
-        for font_weight in ["normal", "bold"]:
-            if font_weight == self.content_font_weight:
-                # 高亮显示当前的字体粗细
-                font_weight_menu_content.add_command(label=font_weight, command=lambda fw=font_weight: self.set_font_weight(fw, "content"), font=("Arial", 11, "bold"), background="lightblue")
-            else:
-                font_weight_menu_content.add_command(label=font_weight, command=lambda fw=font_weight: self.set_font_weight(fw, "content"), font=("Arial", 11, "normal"))
-    
-
+        self.add_choice_menu(font_weight_menu_content, "content_font_weight", ["normal", "bold"], lambda fw: self.set_font_weight(fw, "content"))
+
+        # 调试菜单，只在开启耗时统计时显示
+        if self.instrumentation.enabled:
+            debug_menu = tk.Menu(menubar, tearoff=0)
+            menubar.add_cascade(label="Debug", menu=debug_menu)
+            debug_menu.add_command(label="Metrics Panel", command=self.open_metrics_window)
+
+    def add_choice_menu(self, menu, setting, values, command, label=str):
+        # 高亮显示当前的值
+        choices = self.menu_choices[setting] = MenuChoices(getattr(self, setting))
+        for value in values:
+            choices.add(menu, label(value), value, lambda v=value: command(v))
+
+    def get_font_families(self):
+        # 系统字体列表只读取一次，按名称排序后分页
+        if self.font_families is None:
+            self.font_families = sorted(set(font.families()), key=str.lower)
+        return self.font_families
+
+    def populate_font_menu(self, menu, text_type):
+        if menu.index(tk.END) is not None:
+            return
+        families = self.get_font_families()
+        if len(families) <= self.FONT_MENU_PAGE_SIZE:
+            self.populate_font_page(menu, families, text_type)
+            return
+        # 字体很多时按名称分页，每页第一次展开时才创建，也可以按名称查找
+        menu.add_command(label="Search...", command=lambda: self.open_font_search(text_type))
+        menu.add_separator()
+        for start in range(0, len(families), self.FONT_MENU_PAGE_SIZE):
+            page = families[start:start + self.FONT_MENU_PAGE_SIZE]
+            page_menu = tk.Menu(menu, tearoff=0)
+            page_menu.configure(postcommand=lambda page_menu=page_menu, page=page: self.populate_font_page(page_menu, page, text_type))
+            menu.add_cascade(label=f"{page[0]} - {page[-1]}", menu=page_menu)
+
+    def populate_font_page(self, menu, families, text_type):
+        if menu.index(tk.END) is not None:
+            return
+        choices = self.menu_choices["lable_font" if text_type == "label" else "content_font"]
+        for font_name in families:
+            choices.add(menu, font_name, font_name, lambda fn=font_name: self.set_font_name(fn, text_type))
+
+    def open_font_search(self, text_type):
+        if self.font_search_window:
+            self.close_font_search()
+        window = self.font_search_window = tk.Toplevel(self.root)
+        window.title("Find Font - Label" if text_type == "label" else "Find Font - Content")
+        window.protocol("WM_DELETE_WINDOW", self.close_font_search)
+        window.wm_attributes("-topmost", 1)
+
+        query = tk.StringVar(value="")
+        entry = tk.Entry(window, textvariable=query, width=40)
+        entry.pack(padx=10, pady=(10, 0))
+        listbox = tk.Listbox(window, height=15, width=40, exportselection=False)
+        listbox.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        def update_matches(*args):
+            needle = query.get().lower()
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *[name for name in self.get_font_families() if needle in name.lower()])
+
+        def choose(index):
+            if 0 <= index < listbox.size():
+                self.set_font_name(listbox.get(index), text_type)
+                self.close_font_search()
+
+        query.trace_add("write", update_matches)
+        # 双击选择字体，在输入框中按回车选择第一个匹配的字体
+        listbox.bind('<Double-Button-1>', lambda event: choose(listbox.nearest(event.y)))
+        entry.bind('<Return>', lambda event: choose(0))
+        entry.bind('<Escape>', lambda event: self.close_font_search())
+        update_matches()
+        entry.focus_set()
+
+    def close_font_search(self):
+        self.font_search_window.destroy()
+        self.font_search_window = None
 
     def set_alpha(self, alpha):
         self.alpha = alpha
         self.root.attributes("-alpha", self.alpha)
         self.save_config()
-        self.create_menu()
-        logging.info(f"Transparency set to {alpha * 100}%")
+        self.menu_choices["alpha"].select(alpha)
+        logger.info(f"Transparency set to {alpha * 100}%")
 
     def choose_bg_color(self):
         color_code = colorchooser.askcolor(title="Choose Background Color")[1]
@@ -219,36 +432,40 @@ class ClipboardMonitor:
             self.current_clipboard_label.configure(bg=self.bg_color)
             self.status_label.configure(bg=self.bg_color)
             self.save_config()
-            logging.info(f"Background color set to {color_code}")
+            logger.info(f"Background color set to {color_code}")
 
 
     def set_font_name(self, font_name, text_type):
         if text_type == "label":
             self.lable_font = font_name
+            self.menu_choices["lable_font"].select(font_name)
             self.current_clipboard_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
             self.status_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
         else:
             self.content_font = font_name
+            self.menu_choices["content_font"].select(font_name)
             self.text_box.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
             self.history_listbox.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
+            self.search_entry.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
 
         self.save_config()
-        self.create_menu()
-        logging.info(f"Font name {text_type} set to {font_name}")
+        logger.info(f"Font name {text_type} set to {font_name}")
 
     def set_font_size(self, font_size, text_type):
         if text_type == "label":
             self.lable_font_size = font_size
+            self.menu_choices["lable_font_size"].select(font_size)
             self.current_clipboard_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
             self.status_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
         else:
             self.content_font_size = font_size
+            self.menu_choices["content_font_size"].select(font_size)
             self.text_box.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
             self.history_listbox.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
+            self.search_entry.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
 
         self.save_config()
-        self.create_menu()
-        logging.info(f"Font size {text_type} set to {font_size}")
+        logger.info(f"Font size {text_type} set to {font_size}")
 
 
     def choose_font_color(self):
@@ -259,118 +476,95 @@ class ClipboardMonitor:
     def set_font_weight(self, weight, text_type):
         if text_type == "label":
             self.lable_font_weight = weight
+            self.menu_choices["lable_font_weight"].select(weight)
             self.current_clipboard_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
             self.status_label.configure(font=(self.lable_font, self.lable_font_size, self.lable_font_weight))
         else:
             self.content_font_weight = weight
+            self.menu_choices["content_font_weight"].select(weight)
             self.text_box.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
             self.history_listbox.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
+            self.search_entry.configure(font=(self.content_font, self.content_font_size, self.content_font_weight))
 
         self.save_config()
-        self.create_menu()
-        logging.info(f"Font weight {text_type} set to {weight}")
+        logger.info(f"Font weight {text_type} set to {weight}")
 
 
 
     def load_config(self):
-        default_config = {
-            "alpha": 0.7, 
-            "bg_color": "#333333",
-            "lable_font": "Arial",
-            "lable_font_size": 11,
-            "lable_font_weight": "normal",
-            "content_font": "Arial",
-            "content_font_size": 11,
-            "content_font_weight": "normal"
-            }
-        
-
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as file:
-                try:
-                    config = json.load(file)
-                    self.alpha = config.get("alpha", default_config["alpha"])
-                    self.bg_color = config.get("bg_color", default_config["bg_color"])
-                    # 加载字体配置项
-                    self.lable_font = config.get("lable_font", default_config["lable_font"])
-                    self.lable_font_size = config.get("lable_font_size", default_config["lable_font_size"])
-                    self.lable_font_weight = config.get("lable_font_weight", default_config["lable_font_weight"])
-                    self.content_font = config.get("content_font", default_config["content_font"])
-                    self.content_font_size = config.get("content_font_size", default_config["content_font_size"])
-                    self.content_font_weight = config.get("content_font_weight", default_config["content_font_weight"])
-                    logging.info("Loaded configuration from file.")
-
-                except json.JSONDecodeError:
-                    logging.error("Failed to decode JSON from config file. Using default configuration.")
-                    self.alpha = default_config["alpha"]
-                    self.bg_color = default_config["bg_color"]
-                    # 使用默认字体配置项
-                    self.lable_font = default_config["lable_font"]
-                    self.lable_font_size = default_config["lable_font_size"]
-                    self.lable_font_weight = default_config["lable_font_weight"]
-                    self.content_font = default_config["content_font"]
-                    self.content_font_size = default_config["content_font_size"]
-                    self.content_font_weight = default_config["content_font_weight"]
-                    logging.info("Using default configuration.")
-                    self.save_config()
-
-        else:
-            logging.info("Configuration file not found. Using default configuration.")
-            self.alpha = default_config["alpha"]
-            self.bg_color = default_config["bg_color"]
-            self.lable_font = default_config["lable_font"]
-            self.lable_font_size = default_config["lable_font_size"]
-            self.lable_font_weight = default_config["lable_font_weight"]
-            self.content_font = default_config["content_font"]
-            self.content_font_size = default_config["content_font_size"]
-            self.content_font_weight = default_config["content_font_weight"]
-            self.save_config()
+        # 缺失的配置项使用默认值
+        for key, value in read_config(self.config_file, self.DEFAULT_CONFIG).items():
+            setattr(self, key, value)
 
 
     def save_config(self):
-        config = {
-            "alpha": self.alpha, 
-            "bg_color": self.bg_color, 
-            "lable_font": self.lable_font,
-            "lable_font_size": self.lable_font_size,
-            "lable_font_weight": self.lable_font_weight,
-            "content_font": self.content_font,
-            "content_font_size": self.content_font_size,
-            "content_font_weight": self.content_font_weight
-            }
-        
-        try:
-            with open(self.config_file, 'w') as file:
-                json.dump(config, file, indent=4)
-            logging.info("Saved configuration to file.")
-        except Exception as e:
-            logging.error(f"Failed to save configuration to file: {e}")
+        # 在后台线程中写入，连续修改多项设置时只写最后一次
+        config = {key: getattr(self, key) for key in self.DEFAULT_CONFIG}
+        self.engine.persistence.submit("config", lambda: write_config(self.config_file, config))
 
 
 
     def toggle_topmost(self):
         self.root.attributes("-topmost", self.topmost_var.get())
 
+    def toggle_unique_view(self):
+        self.history_unique_view = self.unique_view_var.get()
+        self.history_listbox.row_count, self.history_listbox.fetch_rows = self.history_view_source()
+        self.history_listbox.selection_clear()
+        self.history_listbox.refresh()
+        self.save_config()
+        logger.info(f"Unique history view set to {self.history_unique_view}")
+
+    def on_search_changed(self, *args):
+        # 连续输入时只在停顿后查询一次
+        if self.search_after_id:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.SEARCH_DELAY, self.run_search)
+
+    def run_search(self):
+        self.search_after_id = None
+        self.update_search_results()
+        self.history_listbox.row_count, self.history_listbox.fetch_rows = self.history_view_source()
+        self.history_listbox.selection_clear()
+        self.history_listbox.refresh()
+
+    def update_search_results(self):
+        query = self.search_var.get()
+        if not query:
+            self.search_results = []
+            return
+        if not self.history_ready:
+            # 加载完成之前只在最近的几条记录中查找
+            needle = query.lower()
+            self.search_results = [(timestamp, text) for timestamp, text, truncated in self.recent_entries if needle in text.lower()]
+            return
+        start = time.perf_counter()
+        self.search_results = self.history_store.search(query, self.SEARCH_RESULT_LIMIT)
+        logger.debug(f"Search for {loggable(query)} returned {len(self.search_results)} results "
+                      f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
     
     def clear_all_records(self):
+        if self.history_loading("Clear All Records"):
+            return
         # 弹出确认对话框
         result = messagebox.askyesno("Clear All Records", "Are you sure you want to clear all clipboard records?")
         if result:
-            # 清空历史记录
-            self.clipboard_history.clear()
+            # 清空历史记录（开启同步时其它机器上的记录也会被清空）
+            self.engine.clear_history()
+            self.previews.clear()
             # 更新历史记录显示
             self.update_history_listbox()
-            self.save_history_to_file()
             messagebox.showinfo("Clear All Records", "All clipboard records have been cleared.")
-            logging.info("All clipboard records have been cleared.")
+            logger.info("All clipboard records have been cleared.")
 
 
 
     def open_history_window(self):
-        if self.history_window:
+        if self.history_window or self.history_loading("Clipboard History"):
             return
 
-        logging.info("Opening history window")
+        logger.info("Opening history window")
 
         self.history_window = tk.Toplevel(self.root)
         self.history_window.title("Clipboard History")
@@ -382,24 +576,18 @@ class ClipboardMonitor:
         # 将窗口置顶
         self.history_window.wm_attributes("-topmost", 1)
 
-        self.history_listbox_inner = tk.Listbox(self.history_window, selectmode=tk.MULTIPLE)
+        # 按时间戳倒序排列，只取出可见的行
+        # 选中的行按时间戳记录，同步或淘汰在后台改变了排名时也不会删除、固定用户没有选过的条目
+        self.history_listbox_inner = VirtualListbox(self.history_window, self.history_store.count, self.fetch_history_details,
+                                                    selectmode=tk.MULTIPLE, keyed=True)
         self.history_listbox_inner.pack(fill=tk.BOTH, expand=True)
 
-        # 按时间戳倒序排序
-        sorted_timestamps = sorted(self.clipboard_history.keys(), reverse=True)
-
-        for index, timestamp in enumerate(sorted_timestamps):
-            content = self.clipboard_history[timestamp]
-            self.history_listbox_inner.insert(tk.END, f"{timestamp}: {content}")
-
-        # 设置交替行的颜色
-        for i in range(0, self.history_listbox_inner.size()):
-            bg_color = 'white' if i % 2 == 0 else '#E8E8E8'
-            self.history_listbox_inner.itemconfig(i, bg=bg_color)
-
         delete_button = tk.Button(self.history_window, text="Delete Selected", command=self.delete_selected)
         delete_button.pack(pady=5)
 
+        pin_button = tk.Button(self.history_window, text="Pin/Unpin Selected", command=self.toggle_pin_selected)
+        pin_button.pack(pady=5)
+
         save_button = tk.Button(self.history_window, text="Save and Close", command=self.save_and_close)
         save_button.pack(pady=5)
 
@@ -417,137 +605,377 @@ class ClipboardMonitor:
             messagebox.showwarning("No Selection", "Please select one or more items to delete.")
             return
 
-        # 获取所有时间戳的列表
-        timestamps = sorted(self.clipboard_history.keys(), reverse=True)
-        # print(timestamps)
+        # 删除的是选中时看到的那些时间戳，而不是现在这些排名上的记录
+        timestamps = self.history_listbox_inner.selected_keys()
+        # 排名没有变化时只在两个列表框中删除对应的行，否则整体刷新
+        in_place = [self.history_store.rank_of(timestamp) for timestamp in timestamps] == list(selected_indices)
 
-        # 使用 reversed 遍历选定的索引，以避免在删除过程中索引变化导致的问题
-        for index in reversed(selected_indices):
-            if index < len(timestamps):
-                timestamp = timestamps[index]
-                logging.info(f"Deleting item with timestamp: {timestamp}")  # 调试信息
-                del self.clipboard_history[timestamp]
-            else:
-                logging.error(f"Index {index} out of range")
+        deleted = self.engine.delete_history(timestamps)
+        logger.info(f"Deleted {deleted} history entries.")
+        self.previews.clear()
 
-        # print(self.clipboard_history)
+        if not in_place:
+            self.update_history_listbox()
+            return
+        self.history_listbox_inner.delete_rows(selected_indices)
+        if self.search_var.get():
+            self.update_search_results()
+            self.history_listbox.refresh()
+        elif self.history_unique_view:
+            self.history_listbox.refresh()
+        else:
+            self.history_listbox.delete_rows(selected_indices)
 
-        # 清空 Listbox 并重新插入剩余的历史记录
-        self.history_listbox_inner.delete(0, tk.END)
-        for timestamp in sorted(self.clipboard_history.keys(), reverse=True):
-            content = self.clipboard_history[timestamp]
-            self.history_listbox_inner.insert(tk.END, f"{timestamp}: {content[:50]}")
-            logging.info(f"Reinserting item with timestamp: {timestamp}, content: {content[:50]}")  # 调试信息
 
 
+    def toggle_pin_selected(self):
+        timestamps = self.history_listbox_inner.selected_keys()
+        if not timestamps:
+            messagebox.showwarning("No Selection", "Please select one or more items to pin or unpin.")
+            return
+
+        # 固定的记录不会被保留策略淘汰
+        for timestamp in timestamps:
+            if self.history_store.get(timestamp) is None:
+                continue
+            pinned = not self.history_store.is_pinned(timestamp)
+            self.history_store.pin(timestamp, pinned)
+            logger.info(f"{'Pinned' if pinned else 'Unpinned'} item with timestamp: {timestamp}")
+
+        self.history_listbox_inner.selection_clear()
+        self.history_listbox_inner.refresh()
+
+    def on_history_evicted(self, count, reclaimed):
+        # 淘汰发生在后台线程中，排名已经变化，只重新读取可见的行（行号对应的条目变了，选中状态随之清除）
+        self.update_history_listbox()
+        logger.info(f"Retention removed {count} entries and reclaimed {reclaimed} bytes.")
+
+    def on_history_synced(self, count):
+        # 其它机器的变更可能落在任何位置，只重新读取可见的行（选中状态随之清除）
+        # 其中可能有删除和清空，缓存的预览一起清掉
+        self.previews.clear()
+        self.update_history_listbox()
+        logger.debug(f"Refreshed history after applying {count} changes from other devices.")
 
     def save_and_close(self):
         # 保存历史记录到文件，并更新显示
         self.update_history_listbox()
         self.save_history_to_file()
         self.close_history_window()
-        logging.info("History saved and window closed")
+        logger.info("History saved and window closed")
 
 
-    def check_clipboard(self):
+    def process_clipboard_queue(self):
+        # 后台监听线程读到的剪切板内容在 Tk 线程中处理
         try:
-            new_clipboard_text = pyperclip.paste()
-            if new_clipboard_text != self.clipboard_text:
-                if not self.check_worng_clipboard(new_clipboard_text):
-                    self.clipboard_text = new_clipboard_text
-                    self.update_text_box(new_clipboard_text)
-                    self.add_to_history(new_clipboard_text)
-        except pyperclip.PyperclipException as pe:
-            logging.error(f"Pyperclip error: {pe}")
-        except Exception as e:
-            logging.error(f"Error accessing clipboard: {e}")
-        
-        self.root.after(500, self.check_clipboard)
+            while True:
+                self.engine.handle_clipboard(self.clipboard_queue.get_nowait())
+        except queue.Empty:
+            pass
+        self.root.after(100, self.process_clipboard_queue)
 
-    def check_worng_clipboard(self, text):
-        worng = ['••••••••••']
-        if text in worng:
-            logging.warning(f"Clipboard contains worng text: {text}")
-            pyperclip.copy(self.clipboard_text)
-            logging.warning(f"Clipboard has been replaced with the original text: {self.clipboard_text[:50]}")
-            return True
-        return False
+    def process_ui_queue(self):
+        try:
+            while True:
+                self.ui_queue.get_nowait()()
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logger.error(f"Error running UI callback: {e}")
+        self.root.after(100, self.process_ui_queue)
 
 
     def update_text_box(self, text):
+        # 图片只显示缓存的缩略图，不解码原图
+        ref = parse_clip(text)
+        self.text_box_digest = ref.digest if ref else None
+        self.text_box_image = self.load_thumbnail(ref.digest) if ref else None
+        text = display_text(text)
+        if len(text) > self.TEXT_BOX_PREVIEW_CHARS:
+            text = f"{text[:self.TEXT_BOX_PREVIEW_CHARS]}\n\n... ({len(text)} characters in total)"
         # 允许编辑以更新内容
         self.text_box.config(state=tk.NORMAL)
         self.text_box.delete('1.0', tk.END)
+        if self.text_box_image:
+            self.text_box.image_create(tk.END, image=self.text_box_image)
+            self.text_box.insert(tk.END, "\n")
         self.text_box.insert(tk.END, text)
         # 更新完成后再次设为不可编辑
         self.text_box.config(state=tk.DISABLED)
 
-    def add_to_history(self, text):
-        logging.info(f"Adding to clipboard history: {text[:50]}")  # 调试信息
-        timestamp = datetime.now().isoformat()
-        self.clipboard_history[timestamp] = text
-        self.update_history_listbox()
-        # 只有当历史记录发生变化时才写入文件
-        self.save_history_to_file()
+    def load_thumbnail(self, digest):
+        path = self.engine.clip_blobs.thumbnail_path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            return tk.PhotoImage(file=path)
+        except tk.TclError as e:
+            logger.error(f"Failed to load thumbnail {path}: {e}")
+            return None
+
+    def on_thumbnail_ready(self, digest):
+        # 缩略图在线程池中生成，完成时如果仍在显示这张图片就刷新文本框
+        if digest == self.text_box_digest:
+            self.update_text_box(self.engine.clipboard_text)
+
+    def on_history_added(self, timestamp, text):
+        self.update_text_box(text)
+        if not self.history_ready:
+            # 还在加载：暂存的内容先显示在最近记录的最前面
+            self.recent_entries.insert(0, (timestamp, text, False))
+            if self.search_var.get():
+                self.update_search_results()
+                self.history_listbox.refresh()
+            else:
+                self.history_listbox.insert_rows(0)
+            return
+        # 在对应位置插入一行，而不是重建整个列表
+        rank = self.history_store.rank_of(timestamp)
+        if self.search_var.get():
+            # 搜索结果按最近复制时间排序，重新查询一次
+            self.update_search_results()
+            self.history_listbox.refresh()
+        elif self.history_unique_view:
+            # 重复内容会移动到最前面，只重新读取可见的几行
+            self.history_listbox.refresh()
+        else:
+            self.history_listbox.insert_rows(rank)
+        if self.history_window:
+            self.history_listbox_inner.insert_rows(rank)
 
     def save_history_to_file(self):
         try:
-            with open(self.history_file, 'w') as file:
-                json.dump(self.clipboard_history, file, indent=4)
-            logging.info("Saved clipboard history to file.")
+            self.engine.sync()
+            logger.info("Queued clipboard history for saving.")
         except Exception as e:
-            logging.error(f"Failed to save clipboard history to file: {e}")
+            logger.error(f"Failed to save clipboard history to file: {e}")
 
-    def update_history_listbox(self):
-        self.history_listbox.delete(0, tk.END)
+    def sync_history(self):
+        self.engine.sync()
+        self.root.after(int(self.history_store.fsync_interval * 1000), self.sync_history)
 
-        for timestamp in sorted(self.clipboard_history.keys(), reverse=True):
-            record = self.clipboard_history[timestamp][:50]  # 显示前50个字符
-            self.history_listbox.insert(tk.END, f"{record}")
+    def on_close(self):
+        if self.system_sampler:
+            self.system_sampler.stop()
+        self.engine.stop()
+        if self.instrumentation.enabled:
+            self.instrumentation.write(self.metrics_file, self.metrics_extra())
+        self.log_pipeline.stop()
+        self.root.destroy()
 
-        for i in range(0, self.history_listbox.size()):
-            bg_color = 'white' if i % 2 == 0 else '#E8E8E8'
-            self.history_listbox.itemconfig(i, bg=bg_color)
+    def update_history_listbox(self):
+        self.update_search_results()
+        self.history_listbox.refresh()
+        if self.history_window:
+            self.history_listbox_inner.refresh()
+
+    def history_view_source(self):
+        if self.search_var.get():
+            return lambda: len(self.search_results), self.fetch_search_results
+        if not self.history_ready:
+            return lambda: len(self.recent_entries), self.fetch_recent_previews
+        if self.history_unique_view:
+            return self.history_store.unique_count, self.fetch_unique_previews
+        return self.history_store.count, self.fetch_history_previews
+
+    def fetch_unique_previews(self, start, count):
+        rows = []
+        for digest, text, occurrences, first_seen, last_seen in self.history_store.slice_unique(start, count):
+            preview = self.previews.get(digest, text)
+            rows.append(f"{preview} (x{occurrences})" if occurrences > 1 else preview)
+        return rows
+
+    def fetch_recent_previews(self, start, count):
+        return [list_preview(text) for timestamp, text, truncated in self.recent_entries[start:start + count]]
+
+    def fetch_search_results(self, start, count):
+        return [list_preview(text) for timestamp, text in self.search_results[start:start + count]]
+
+    def fetch_history_previews(self, start, count):
+        return [self.previews.get(timestamp, text) for timestamp, text in self.history_store.slice_by_rank(start, count)]
+
+    def fetch_history_details(self, start, count):
+        # 管理窗口中显示时间戳和前200个字符，固定的记录加上标记
+        rows = []
+        for timestamp, text in self.history_store.slice_by_rank(start, count):
+            pinned = "[pinned] " if self.history_store.is_pinned(timestamp) else ""
+            rows.append((timestamp, f"{pinned}{timestamp}: {self.previews.get(timestamp, text, 200)}"))
+        return rows
 
     def copy_selected_record(self, event):
         selected_index = self.history_listbox.curselection()
         if selected_index:
-            selected_timestamp = sorted(self.clipboard_history.keys(), reverse=True)[selected_index[0]]
-            selected_record = self.clipboard_history[selected_timestamp]
-            pyperclip.copy(selected_record)
+            if not self.history_ready:
+                # 加载完成之前列表和搜索结果都来自最近记录，过长的内容在其中只保存了开头
+                if self.search_var.get():
+                    timestamp = self.search_results[selected_index[0]][0]
+                    recent = next(entry for entry in self.recent_entries if entry[0] == timestamp)
+                else:
+                    recent = self.recent_entries[selected_index[0]]
+                if recent[2] and self.history_loading("Clipboard History"):
+                    return
+                entry = recent[:2]
+            elif self.search_var.get():
+                # 搜索结果只有预览，按最近一次复制的时间戳读取完整内容
+                timestamp = self.search_results[selected_index[0]][0]
+                entry = (timestamp, self.history_store.get(timestamp))
+            elif self.history_unique_view:
+                entry = self.history_store.get_unique_by_rank(selected_index[0])
+            else:
+                entry = self.history_store.get_by_rank(selected_index[0])
+            if entry is None:
+                return
+            selected_record = entry[1]
+            if selected_record is None:
+                return
+            try:
+                self.engine.copy_to_clipboard(selected_record)
+            except Exception as e:
+                # 图片/HTML 通过外部命令写回剪切板，可能失败
+                logger.error(f"Failed to copy record to clipboard: {e}")
+                messagebox.showerror("Clipboard History", f"Failed to copy record to clipboard: {e}")
+                return
             self.update_text_box(selected_record)
-            self.clipboard_text = selected_record
-            logging.info(f"Copied selected record to clipboard: {selected_record[:50]}")
 
     def update_system_info(self):
+        # 采样在后台线程中完成，这里只取出最新的结果更新标签，不会阻塞事件循环
+        if self.system_sampler is None:
+            self.system_sampler = SystemSampler(self.system_info_queue, process_stats=self.system_info_process_stats)
+            self.instrumentation.instrument(self.system_sampler, "_take_sample", "psutil.sample")
+            self.system_sampler.start()
+
+        sample = None
         try:
-            cpu_usage = psutil.cpu_percent(interval=1)
-            memory_usage = psutil.virtual_memory().percent
-            self.status_label.config(text=f"CPU Usage: {cpu_usage}% | Memory Usage: {memory_usage}%")
-            # logging.info(f"System Info - CPU Usage: {cpu_usage}%, Memory Usage: {memory_usage}%")
-        except psutil.Error as pe:
-            logging.error(f"Psutil error: {pe}")
-        except Exception as e:
-            logging.error(f"Failed to get system info: {e}")
-        self.root.after(1000, self.update_system_info)  # 每秒更新一次系统信息
-
-    def check_and_clean_log_file(self):
-        set_max_log_size = 2  # 5 MB
-        if os.path.exists(self.log_file):
-            log_size = os.path.getsize(self.log_file)
-            max_log_size = set_max_log_size * 1024 * 1024
-            if log_size > max_log_size:
-                with open(self.log_file, 'w') as file:
-                    file.truncate(0)  # 清空文件
-                logging.info(f"Log file size exceeds {set_max_log_size}MB. Clearing the log file.")
-        # 每隔十分钟检查一次日志文件
-        self.root.after(600000, self.check_and_clean_log_file)
+            while True:
+                sample = self.system_info_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        if sample:
+            try:
+                self.status_label.config(text=self.format_system_info(sample))
+            except Exception as e:
+                logger.error(f"Failed to get system info: {e}")
+        self.root.after(250, self.update_system_info)
+
+    def format_system_info(self, sample):
+        lines = [f"CPU Usage: {sample.cpu}% | Memory Usage: {sample.memory}%"]
+        cpu_stats = self.system_sampler.stats("cpu")
+        averages = "/".join(f"{stat[1]:.1f}" if stat else "-" for stat in cpu_stats.values())
+        peak = cpu_stats[max(cpu_stats)]
+        lines.append(f"CPU 1m/5m/15m avg: {averages}% | 15m max: {peak[2] if peak else '-'}%")
+        if sample.process_rss is not None:
+            lines.append(f"Monitor: CPU {sample.process_cpu}% | RSS {sample.process_rss / (1024 * 1024):.1f} MB")
+        return "\n".join(lines)
+
+    def write_metrics_file(self):
+        self.engine.persistence.submit("metrics", lambda: self.instrumentation.write(self.metrics_file, self.metrics_extra()))
+        self.root.after(int(self.metrics_file_interval * 1000), self.write_metrics_file)
+
+    def open_metrics_window(self):
+        if self.metrics_window:
+            return
+        self.metrics_window = tk.Toplevel(self.root)
+        self.metrics_window.title("Metrics")
+        self.metrics_window.protocol("WM_DELETE_WINDOW", self.close_metrics_window)
+        self.metrics_text = tk.Text(self.metrics_window, wrap=tk.NONE, width=90, height=24, font=("Courier", 10))
+        self.metrics_text.pack(fill=tk.BOTH, expand=True)
+        self.refresh_metrics_window()
+
+    def refresh_metrics_window(self):
+        if not self.metrics_window:
+            return
+        self.metrics_text.config(state=tk.NORMAL)
+        self.metrics_text.delete('1.0', tk.END)
+        self.metrics_text.insert(tk.END, self.instrumentation.format_table() + "\n\n" + self.format_persistence_stats())
+        self.metrics_text.config(state=tk.DISABLED)
+        self.root.after(1000, self.refresh_metrics_window)
+
+    def metrics_extra(self):
+        return {"persistence": self.engine.persistence.stats()}
+
+    def format_persistence_stats(self):
+        stats = self.engine.persistence.stats()
+        latency = stats["write_latency"]
+        return (f"persistence: queue depth {stats['queue_depth']}, {stats['writes']} writes, "
+                f"{stats['coalesced']} coalesced, {stats['failures']} failed; write latency "
+                f"p50 {latency['p50_ms']:.2f} / p99 {latency['p99_ms']:.2f} / max {latency['max_ms']:.2f} ms")
+
+    def close_metrics_window(self):
+        self.metrics_window.destroy()
+        self.metrics_window = None
+
+def run_headless_monitor(socket_path=None):
+    # 无界面模式：不创建任何 Tk 窗口，历史记录通过 Unix 域套接字查询
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    log_pipeline = LogPipeline(os.path.join(script_dir, "clipboard_monitor.log"))
+    config = read_config(os.path.join(script_dir, "config.json"), ClipboardMonitor.DEFAULT_CONFIG)
+    log_pipeline.start(config)
+    try:
+        engine = ClipboardEngine(os.path.join(script_dir, "clipboard_history"), config)
+        engine.load()
+        run_headless(engine, socket_path or os.path.join(script_dir, "clipboard_monitor.sock"))
+    except InstanceLockedError as e:
+        logger.error(f"Clipboard history is already in use: {e}")
+        print(f"Clipboard history is already in use: {e}", file=sys.stderr)
+        return 1
+    finally:
+        log_pipeline.stop()
+    return 0
+
+def run_archive_command(args, data_dir=None):
+    # 导入/导出历史记录后退出；监控窗口或无界面模式正在运行时历史记录被锁定，直接报错退出
+    script_dir = data_dir or os.path.dirname(os.path.abspath(__file__))
+    log_pipeline = LogPipeline(os.path.join(script_dir, "clipboard_monitor.log"))
+    config = read_config(os.path.join(script_dir, "config.json"), ClipboardMonitor.DEFAULT_CONFIG)
+    log_pipeline.start(config)
+    try:
+        engine = ClipboardEngine(os.path.join(script_dir, "clipboard_history"), config)
+    except InstanceLockedError as e:
+        print(f"Cannot import or export while the clipboard monitor is running: {e}", file=sys.stderr)
+        log_pipeline.stop()
+        return 1
+    try:
+        engine.load()
+        if args.import_file:
+            stats = engine.import_history(args.import_file, args.since, args.until, args.dedup)
+            print(f"Imported {stats['imported']} entries ({stats['duplicates']} duplicates, {stats['filtered']} filtered, "
+                  f"{stats['out_of_range']} out of range, {stats['invalid']} invalid, {stats['missing_data']} without image/HTML data).")
+        if args.export:
+            count = engine.export_history(args.export, args.since, args.until)
+            print(f"Exported {count} entries to {args.export}.")
+    finally:
+        engine.stop()
+        log_pipeline.stop()
+    return 0
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = ClipboardMonitor(root)
-    app.update_system_info()  # 初始化系统信息更新
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Clipboard Monitor")
+    parser.add_argument("--headless", action="store_true", help="run without the Tk window and serve history over a Unix domain socket")
+    parser.add_argument("--socket", help="socket path for --headless (default: clipboard_monitor.sock next to this script)")
+    parser.add_argument("--export", metavar="FILE", help="export history as NDJSON (gzip-compressed if FILE ends with .gz) and exit")
+    parser.add_argument("--import", dest="import_file", metavar="FILE",
+                        help="merge an NDJSON export or a legacy clipboard_history.json into the history and exit")
+    parser.add_argument("--since", type=parse_time_bound, help="only import/export entries at or after this ISO date or time")
+    parser.add_argument("--until", type=lambda value: parse_time_bound(value, end=True),
+                        help="only import/export entries at or before this ISO date or time (a date includes the whole day)")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default="entry",
+                        help="entry: skip records already present with the same time and content; content: skip content already in history")
+    args = parser.parse_args()
+
+    if args.import_file or args.export:
+        sys.exit(run_archive_command(args))
+    elif args.headless:
+        sys.exit(run_headless_monitor(args.socket))
+    else:
+        root = tk.Tk()
+        try:
+            app = ClipboardMonitor(root)
+        except InstanceLockedError as e:
+            messagebox.showerror("Clipboard Monitor", f"Clipboard history is already in use: {e}")
+            sys.exit(1)
+        app.update_system_info()  # 初始化系统信息更新
+        root.mainloop()
 
 
 
@@ -0,0 +1,256 @@
+import os
+import sys
+import select
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+import pyperclip
+
+
+logger = logging.getLogger(__name__)
+
+
+class PollingClipboardWatcher:
+    """在 Tk 事件循环里定时读取剪切板，作为没有 XFixes 时的后备方案。"""
+
+    def __init__(self, root, on_change, interval=500, fetch=pyperclip.paste):
+        self.root = root
+        self.on_change = on_change
+        self.interval = interval
+        self.fetch = fetch
+        self.last_text = None
+        self._after_id = None
+
+    def start(self):
+        self._poll()
+
+    def stop(self):
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _poll(self):
+        try:
+            text = self.fetch()
+            if text != self.last_text:
+                self.last_text = text
+                self.on_change(text)
+        except pyperclip.PyperclipException as pe:
+            logger.error(f"Pyperclip error: {pe}")
+        except Exception as e:
+            logger.error(f"Error accessing clipboard: {e}")
+        self._after_id = self.root.after(self.interval, self._poll)
+
+
+class ThreadedPollingClipboardWatcher:
+    """没有 Tk 事件循环时（无界面模式）在后台线程中定时读取剪切板，on_change 在该线程中被调用。"""
+
+    def __init__(self, on_change, interval=500, fetch=pyperclip.paste):
+        self.on_change = on_change
+        self.interval = interval
+        self.fetch = fetch
+        self.last_text = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            try:
+                text = self.fetch()
+                if text != self.last_text:
+                    self.last_text = text
+                    self.on_change(text)
+            except pyperclip.PyperclipException as pe:
+                logger.error(f"Pyperclip error: {pe}")
+            except Exception as e:
+                logger.error(f"Error accessing clipboard: {e}")
+            if self._stop.wait(self.interval / 1000):
+                break
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("pad", ctypes.c_long * 24)]
+
+
+class SelectionOwner:
+    """通过 libX11 查询选区当前的所有者窗口。
+
+    第一次调用时打开自己的显示连接，之后一直复用；只应在一个线程中调用。
+    没有 libX11 或打不开显示时返回 None。
+    """
+
+    def __init__(self, selection="CLIPBOARD", display_name=None):
+        self.selection = selection
+        self.display_name = display_name
+        self._xlib = None
+        self._display = None
+        self._atom = None
+        self._failed = False
+
+    def __call__(self):
+        if self._display is None and not self._open():
+            return None
+        return self._xlib.XGetSelectionOwner(self._display, self._atom)
+
+    def _open(self):
+        if self._failed:
+            return False
+        x11_path = ctypes.util.find_library("X11")
+        xlib = ctypes.CDLL(x11_path) if x11_path else None
+        if xlib is not None:
+            xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+            xlib.XOpenDisplay.restype = ctypes.c_void_p
+            xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+            xlib.XInternAtom.restype = ctypes.c_ulong
+            xlib.XGetSelectionOwner.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+            xlib.XGetSelectionOwner.restype = ctypes.c_ulong
+            display = xlib.XOpenDisplay(self.display_name.encode() if self.display_name else None)
+        if xlib is None or not display:
+            logger.debug("Cannot query the clipboard owner without an X display.")
+            self._failed = True
+            return False
+        self._xlib, self._display = xlib, display
+        self._atom = xlib.XInternAtom(display, self.selection.encode(), 0)
+        return True
+
+    def close(self):
+        if self._display:
+            self._xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+
+
+class XFixesClipboardWatcher:
+    """订阅 XFixes 的选区所有者变化通知，只在剪切板易主时才读取内容。
+
+    监听和读取都在后台线程中完成，on_change 会在该线程中被调用。
+    """
+
+    XFixesSetSelectionOwnerNotifyMask = 1
+    XFixesSelectionNotify = 0
+
+    def __init__(self, on_change, selection="CLIPBOARD", fetch=pyperclip.paste, display_name=None):
+        self.on_change = on_change
+        self.selection = selection
+        self.fetch = fetch
+        self.display_name = display_name
+        self._stop = threading.Event()
+        self._thread = None
+        self._xlib, self._xfixes = self._load_libraries()
+
+    @staticmethod
+    def _load_libraries():
+        x11_path = ctypes.util.find_library("X11")
+        xfixes_path = ctypes.util.find_library("Xfixes")
+        if not x11_path or not xfixes_path:
+            raise OSError("libX11 or libXfixes not found")
+        xlib = ctypes.CDLL(x11_path)
+        xfixes = ctypes.CDLL(xfixes_path)
+
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        xlib.XInternAtom.restype = ctypes.c_ulong
+        xlib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        xlib.XPending.argtypes = [ctypes.c_void_p]
+        xlib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+        xlib.XFlush.argtypes = [ctypes.c_void_p]
+        xfixes.XFixesQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+        xfixes.XFixesSelectSelectionInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong]
+        return xlib, xfixes
+
+    def start(self):
+        display_name = self.display_name.encode() if self.display_name else None
+        display = self._xlib.XOpenDisplay(display_name)
+        if not display:
+            raise OSError("Cannot open X display")
+
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not self._xfixes.XFixesQueryExtension(display, ctypes.byref(event_base), ctypes.byref(error_base)):
+            self._xlib.XCloseDisplay(display)
+            raise OSError("XFixes extension is not available")
+
+        atom = self._xlib.XInternAtom(display, self.selection.encode(), 0)
+        self._xfixes.XFixesSelectSelectionInput(
+            display, self._xlib.XDefaultRootWindow(display), atom, self.XFixesSetSelectionOwnerNotifyMask)
+        self._xlib.XFlush(display)
+
+        self._thread = threading.Thread(target=self._run, args=(display, event_base.value), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self, display, event_base):
+        # 启动时先读取一次当前内容
+        self._fetch_and_report()
+        fd = self._xlib.XConnectionNumber(display)
+        event = XEvent()
+        try:
+            while not self._stop.is_set():
+                # 用 select 等待而不是阻塞在 XNextEvent 上，这样 stop() 能及时生效
+                readable, _, _ = select.select([fd], [], [], 0.5)
+                if not readable and not self._xlib.XPending(display):
+                    continue
+                changed = False
+                while self._xlib.XPending(display):
+                    self._xlib.XNextEvent(display, ctypes.byref(event))
+                    if event.type == event_base + self.XFixesSelectionNotify:
+                        changed = True
+                # 同一批通知只读取一次剪切板
+                if changed:
+                    self._fetch_and_report()
+        finally:
+            self._xlib.XCloseDisplay(display)
+
+    def _fetch_and_report(self):
+        try:
+            self.on_change(self.fetch())
+        except pyperclip.PyperclipException as pe:
+            logger.error(f"Pyperclip error: {pe}")
+        except Exception as e:
+            logger.error(f"Error accessing clipboard: {e}")
+
+
+def create_clipboard_watcher(root, on_change, threaded_on_change, backend="auto", interval=500, fetch=pyperclip.paste,
+                             poll=None):
+    """按平台选择剪切板监听方式。
+
+    XFixes 监听器在后台线程中回调 threaded_on_change，轮询监听器在 Tk 线程中回调 on_change；
+    root 为 None（无界面模式，或读取剪切板要运行外部命令）时在后台线程中轮询，同样回调 threaded_on_change。
+    fetch 读取剪切板内容，返回文本或 ClipboardData（见 clipboard_formats）；轮询时改用 poll（如果提供），
+    它可以在剪切板看起来没有变化时直接返回上一次的内容。
+    """
+    if backend in ("auto", "xfixes") and sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        try:
+            watcher = XFixesClipboardWatcher(threaded_on_change, fetch=fetch)
+            watcher.start()
+            logger.info("Using XFixes selection-owner notifications for clipboard changes.")
+            return watcher
+        except OSError as e:
+            logger.warning(f"XFixes clipboard watcher unavailable, falling back to polling: {e}")
+
+    poll = poll or fetch
+    if root is None:
+        watcher = ThreadedPollingClipboardWatcher(threaded_on_change, interval=interval, fetch=poll)
+    else:
+        watcher = PollingClipboardWatcher(root, on_change, interval=interval, fetch=poll)
+    watcher.start()
+    logger.info(f"Polling clipboard every {interval} ms.")
+    return watcher
@@ -0,0 +1,307 @@
+import os
+import re
+import logging
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+from collections import namedtuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+
+logger = logging.getLogger(__name__)
+
+
+ACTIONS = ("drop", "mask", "encrypt", "allow")
+
+
+def luhn_valid(text):
+    digits = [int(char) for char in text if char.isdigit()]
+    checksum = 0
+    for index, digit in enumerate(reversed(digits)):
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+class FilterRule(namedtuple("FilterRule", "name pattern action validate")):
+    """一条过滤规则：pattern 为正则表达式，命中后按 action 处理；validate(匹配文本) 返回 False 时忽略这次命中。"""
+
+    def __new__(cls, name, pattern, action, validate=None):
+        return super().__new__(cls, name, pattern, action, validate)
+
+
+# 内置规则，可以在配置中用同名规则修改动作，动作为 allow 时关闭
+BUILTIN_RULES = (
+    FilterRule("private_key", r"-----BEGIN (?:[A-Z0-9]+ )*PRIVATE KEY-----[\s\S]*?-----END (?:[A-Z0-9]+ )*PRIVATE KEY-----", "drop"),
+    FilterRule("aws_access_key", r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b", "mask"),
+    FilterRule("github_token", r"\bgh[pousr]_[A-Za-z0-9]{36,255}\b", "mask"),
+    FilterRule("slack_token", r"\bxox[abprs]-[A-Za-z0-9-]{10,}", "mask"),
+    FilterRule("jwt", r"\beyJ[A-Za-z0-9_-]{8,}\.eyJ[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}", "mask"),
+    FilterRule("secret_assignment", r"(?i:\b(?:api[_-]?key|secret|token|password|passwd)\b\s*[:=]\s*['\"]?)[A-Za-z0-9_\-/+=.]{12,}", "mask"),
+    FilterRule("credit_card", r"\b(?:\d[ -]?){12,18}\d\b", "mask", luhn_valid),
+)
+
+
+def load_rules(configured):
+    """内置规则加上配置中的规则 [{"name": ..., "pattern": ..., "action": ...}, ...]，同名的配置规则覆盖内置规则。"""
+    rules = {rule.name: rule for rule in BUILTIN_RULES}
+    for index, item in enumerate(configured):
+        try:
+            name = item.get("name") or f"rule_{index}"
+            action = item.get("action", "drop")
+            if action not in ACTIONS:
+                raise ValueError(f"unknown action '{action}'")
+            pattern = item.get("pattern") or rules[name].pattern
+            re.compile(pattern)
+        except (AttributeError, KeyError, ValueError, re.error) as e:
+            logger.error(f"Ignoring invalid content filter rule {item!r}: {e}")
+            continue
+        validate = rules[name].validate if name in rules and pattern == rules[name].pattern else None
+        rules[name] = FilterRule(name, pattern, action, validate)
+    return [rule for rule in rules.values() if rule.action != "allow"]
+
+
+# 加密后的片段在历史记录中的形式
+ENCRYPTED_PREFIX = "\ufffcenc:"
+ENCRYPTED_PATTERN = re.compile("\ufffcenc:([A-Za-z0-9_=-]+)\ufffc")
+
+
+def hide_encrypted(text):
+    """显示时把加密的片段替换成 [encrypted]。"""
+    if ENCRYPTED_PREFIX not in text:
+        return text
+    return ENCRYPTED_PATTERN.sub("[encrypted]", text)
+
+
+class SecretBox:
+    """用 Fernet 加密命中 encrypt 规则的片段，密钥在第一次使用时生成，保存在只有当前用户可读写的文件中。
+
+    需要 cryptography，没有安装时 available 为 False。
+    """
+
+    def __init__(self, key_file):
+        self.key_file = key_file
+        self._fernet = None
+
+    @property
+    def available(self):
+        return Fernet is not None
+
+    def _cipher(self):
+        if self._fernet is None:
+            try:
+                with open(self.key_file, 'rb') as file:
+                    key = file.read().strip()
+            except FileNotFoundError:
+                key = Fernet.generate_key()
+                fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(key)
+                logger.info(f"Created clipboard history encryption key {self.key_file}.")
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def encrypt(self, text):
+        token = self._cipher().encrypt(text.encode('utf-8', 'surrogatepass')).decode('ascii')
+        return f"{ENCRYPTED_PREFIX}{token}\ufffc"
+
+    def decrypt_text(self, text):
+        """把文本中所有加密的片段解密回原文。"""
+        if ENCRYPTED_PREFIX not in text:
+            return text
+        if not self.available:
+            raise ValueError("decrypting history entries requires the cryptography package")
+
+        def decrypt(match):
+            try:
+                return self._cipher().decrypt(match.group(1).encode('ascii')).decode('utf-8', 'surrogatepass')
+            except InvalidToken:
+                raise ValueError("encrypted history entry cannot be decrypted with the current key")
+        return ENCRYPTED_PATTERN.sub(decrypt, text)
+
+
+FilterResult = namedtuple("FilterResult", "action text rules")
+
+
+# 提取关键字时展开字符集的上限，以及关键字的最短长度
+MAX_KEYWORDS_PER_RULE = 32
+MIN_KEYWORD_LENGTH = 3
+
+
+def _literal_prefixes(items):
+    """返回 (前缀列表, 是否完整)：匹配一定以列表中某个字符串开头（不区分大小写时按小写比较）。"""
+    prefixes = [""]
+    for op, av in items:
+        if op is sre_parse.AT:
+            # \b、^ 等不占字符，跳过
+            continue
+        if op is sre_parse.LITERAL:
+            options = [chr(av)]
+        elif op is sre_parse.IN and all(kind is sre_parse.LITERAL for kind, _ in av):
+            options = [chr(value) for _, value in av]
+        elif op is sre_parse.SUBPATTERN:
+            options, complete = _literal_prefixes(av[-1])
+            if not complete:
+                return _extend(prefixes, options), False
+        elif op is sre_parse.BRANCH:
+            options, complete = [], True
+            for branch in av[1]:
+                branch_prefixes, branch_complete = _literal_prefixes(branch)
+                options.extend(branch_prefixes)
+                complete = complete and branch_complete
+            if not complete:
+                return _extend(prefixes, options), False
+        else:
+            return prefixes, False
+        if len(prefixes) * len(options) > MAX_KEYWORDS_PER_RULE:
+            return prefixes, False
+        prefixes = _extend(prefixes, options)
+    return prefixes, True
+
+
+def _extend(prefixes, options):
+    if len(prefixes) * len(options) > MAX_KEYWORDS_PER_RULE:
+        return prefixes
+    return [prefix + option for prefix in prefixes for option in options]
+
+
+def rule_keywords(pattern):
+    """规则匹配必须以之开头的小写关键字，提取不出足够长的关键字时返回 None（这条规则需要单独扫描全文）。"""
+    try:
+        prefixes, _ = _literal_prefixes(sre_parse.parse(pattern))
+    except (re.error, RecursionError):
+        return None
+    keywords = {prefix.lower() for prefix in prefixes}
+    if not keywords or min(len(keyword) for keyword in keywords) < MIN_KEYWORD_LENGTH:
+        return None
+    return keywords
+
+
+def keyword_pattern(keywords):
+    """把关键字组织成前缀树形式的正则表达式，每个位置只需沿一条分支比较，不用逐个尝试所有关键字。"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # 关键字在这里结束时后面的部分是可选的
+        return f"(?:{body})?" if "" in node else body
+
+    # 放在前瞻断言中，重叠的关键字（例如 pass 和 password）也都能找到
+    return f"(?=({emit(trie)}))"
+
+
+class ContentFilter:
+    """按规则检查每次捕获的内容。
+
+    规则开头的字面文本（例如 AKIA、ghp_、eyJ）提取为关键字，所有关键字组织成一个前缀树正则表达式，
+    对全文只扫描一遍；找到关键字时才在这个位置用对应规则的正则表达式确认。提取不出关键字的规则
+    （例如信用卡号）单独扫描全文。规则再多，扫描的开销也只随文本长度和命中的次数增长。
+    任意一条 drop 规则命中时整条内容不记录；否则 mask 规则命中的片段被遮盖，encrypt 规则命中的片段被加密。
+    只扫描前 max_scan_chars 个字符，保证多 MB 的内容扫描开销也有上限。
+    """
+
+    MASK_CHAR = "•"
+    MASK_KEEP = 4
+
+    def __init__(self, rules, secret_box=None, max_scan_chars=1024 * 1024):
+        self.max_scan_chars = max_scan_chars
+        self.secret_box = secret_box
+        if any(rule.action == "encrypt" for rule in rules) and not (secret_box and secret_box.available):
+            logger.warning("The cryptography package is not installed, content matching encrypt rules will be dropped.")
+            rules = [rule._replace(action="drop") if rule.action == "encrypt" else rule for rule in rules]
+        self.rules = rules
+        self._compiled = [re.compile(rule.pattern) for rule in rules]
+        self._keyword_rules = {}
+        self._unanchored = []
+        for index, rule in enumerate(rules):
+            keywords = rule_keywords(rule.pattern)
+            if keywords is None:
+                self._unanchored.append(index)
+                continue
+            for keyword in keywords:
+                self._keyword_rules.setdefault(keyword, []).append(index)
+        self._keyword_lengths = sorted({len(keyword) for keyword in self._keyword_rules})
+        pattern = keyword_pattern(self._keyword_rules) if self._keyword_rules else None
+        self._keyword_regex = re.compile(pattern) if pattern else None
+        # 小写后长度改变（少数非 ASCII 字符）时位置对不上，改用不区分大小写的匹配
+        self._keyword_regex_ignorecase = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    def _matches(self, text):
+        """返回 (开始, 结束, 规则序号) 的列表，没有按位置排序。"""
+        limit = min(len(text), self.max_scan_chars)
+        found = []
+        if self._keyword_regex is not None:
+            lowered = text[:limit].lower()
+            if len(lowered) == limit:
+                hits = self._keyword_regex.finditer(lowered)
+            else:
+                hits = self._keyword_regex_ignorecase.finditer(text, 0, limit)
+            for hit in hits:
+                position, keyword = hit.start(), hit.group(1).lower()
+                # 较短的关键字是找到的关键字的前缀时，它们的规则也要检查
+                for length in self._keyword_lengths:
+                    if length > len(keyword):
+                        break
+                    for index in self._keyword_rules.get(keyword[:length], ()):
+                        match = self._compiled[index].match(text, position, limit)
+                        if match and match.end() > position:
+                            found.append((position, match.end(), index))
+        for index in self._unanchored:
+            for match in self._compiled[index].finditer(text, 0, limit):
+                if match.end() > match.start():
+                    found.append((match.start(), match.end(), index))
+        return found
+
+    def scan(self, text):
+        """返回 FilterResult(action, text, rules)：没有命中时 action 为 None，drop 时 text 为 None。"""
+        if not self.rules:
+            return FilterResult(None, text, ())
+        matches = []
+        for start, end, index in sorted(self._matches(text)):
+            rule = self.rules[index]
+            if rule.validate and not rule.validate(text[start:end]):
+                continue
+            # drop 规则在去掉重叠的命中之前检查，和前面一条 mask 规则的命中重叠时同样生效
+            if rule.action == "drop":
+                return FilterResult("drop", None, (rule.name,))
+            matches.append((start, end, rule))
+        spans, position = [], 0
+        # 按位置排序，同一位置排在前面的规则优先，重叠的命中只保留第一个
+        for start, end, rule in matches:
+            if start < position:
+                continue
+            spans.append((start, end, rule))
+            position = end
+        if not spans:
+            return FilterResult(None, text, ())
+
+        parts, position = [], 0
+        for start, end, rule in spans:
+            parts.append(text[position:start])
+            secret = text[start:end]
+            parts.append(self.secret_box.encrypt(secret) if rule.action == "encrypt" else self.mask(secret))
+            position = end
+        parts.append(text[position:])
+        action = "encrypt" if any(rule.action == "encrypt" for _, _, rule in spans) else "mask"
+        return FilterResult(action, "".join(parts), tuple(sorted({rule.name for _, _, rule in spans})))
+
+    def mask(self, secret):
+        # 较长的内容保留最后几个字符，方便辨认
+        keep = self.MASK_KEEP if len(secret) >= 4 * self.MASK_KEEP else 0
+        return self.MASK_CHAR * (len(secret) - keep) + secret[len(secret) - keep:]
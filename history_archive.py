@@ -0,0 +1,322 @@
+import os
+import gzip
+import json
+import base64
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from history_store import JsonHistoryStore, content_hash, to_micros, from_micros
+from clipboard_formats import ClipBlobStore, parse
+
+
+logger = logging.getLogger(__name__)
+
+
+# 导入时每批写入的条数，去重只需要在存储和当前这一批中查找
+IMPORT_BATCH_SIZE = 1000
+DEDUP_MODES = ("entry", "content")
+
+
+def parse_time_bound(value, end=False):
+    """把 --since/--until 的参数转成与历史记录相同格式的时间戳，只给日期时 end 为 True 表示当天结束。"""
+    moment = datetime.fromisoformat(value)
+    if end and "T" not in value and " " not in value:
+        moment += timedelta(days=1, microseconds=-1)
+    return moment.isoformat()
+
+
+def open_archive(path, mode, compress=False):
+    """打开归档文件：写入时 compress 为 True 则按 gzip 压缩，读取时根据文件内容自动识别 gzip。"""
+    if mode == "w":
+        return gzip.open(path, 'wt', encoding='utf-8') if compress else open(path, 'w', encoding='utf-8')
+    with open(path, 'rb') as file:
+        compressed = file.read(2) == b"\x1f\x8b"
+    return gzip.open(path, 'rt', encoding='utf-8') if compressed else open(path, 'r', encoding='utf-8')
+
+
+# ----------------------------------------------------------------------
+# 导出
+# ----------------------------------------------------------------------
+def export_archive(store, path, start=None, end=None, load_clip=None):
+    """把 start <= 时间戳 <= end 的记录逐条写成 NDJSON，返回导出的条数。
+
+    每行一个 {"ts": 时间戳, "text": 内容}，固定的记录加上 "pinned": true；图片和 HTML 条目通过
+    load_clip(ref) 读取正文，以 base64 放在 "data" 中。文件名以 .gz 结尾时按 gzip 压缩。
+    记录按时间从旧到新排列，导入时每条都追加在存储的末尾。
+    先写临时文件，完成后再替换目标文件。
+    """
+    count = 0
+    tmp_path = path + ".tmp"
+    with open_archive(tmp_path, "w", compress=path.endswith(".gz")) as file:
+        for timestamp, text in store.range_by_time(start, end, oldest_first=True):
+            record = {"ts": timestamp, "text": text}
+            if store.is_pinned(timestamp):
+                record["pinned"] = True
+            ref = parse(text)
+            if ref and load_clip:
+                data = load_clip(ref)
+                if data is not None:
+                    record["data"] = base64.b64encode(data).decode('ascii')
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {count} history entries to {path}.")
+    return count
+
+
+# ----------------------------------------------------------------------
+# 读取归档
+# ----------------------------------------------------------------------
+class JsonStream:
+    """从文件中逐个读出 JSON 值，只在内存中保留当前这一个值，用于流式读取很大的旧版 JSON 历史文件。"""
+
+    def __init__(self, file, chunk_size=64 * 1024):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read_more(self, size=None):
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符，文件结束时返回空字符串。"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_more():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} but found {char!r}")
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # 值还没有读完整，每次多读一倍，很大的值也只需要解析几次
+                if not self._read_more(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            # 数字可能正好在缓冲区末尾被截断
+            if end == len(self.buffer) and not self.eof and self._read_more():
+                continue
+            self.position = end
+            return value
+
+    def items(self):
+        """逐个返回顶层对象的 (键, 值) 或顶层数组的 (None, 值)。"""
+        opener = self.expect("{[")
+        closer = "}" if opener == "{" else "]"
+        if self.peek() == closer:
+            return
+        while True:
+            key = None
+            if opener == "{":
+                key = self.value()
+                self.expect(":")
+            yield key, self.value()
+            if self.expect("," + closer) == closer:
+                return
+
+
+# NDJSON 导出文件中一条记录可能有的键
+RECORD_KEYS = ("ts", "text", "pinned", "data")
+
+
+def detect_format(path):
+    """返回归档的格式：ndjson、legacy-dict（{时间戳: 内容}）、legacy-list（[内容, ...]）或 snapshot（当前的快照文件）。
+
+    第一个对象只有记录的键、同时有 ts 和 text，并且后面紧跟下一个对象或文件结束时是 NDJSON，与键的顺序无关。
+    """
+    with open_archive(path, "r") as file:
+        stream = JsonStream(file)
+        char = stream.peek()
+        if char == "[":
+            return "legacy-list"
+        if char != "{":
+            raise ValueError(f"{path} is not a clipboard history archive")
+        keys = set()
+        # 一出现记录以外的键就停下，旧格式和快照整个文件是一个对象，不能把它读完
+        for key, value in stream.items():
+            if key == "version" and not keys:
+                return "snapshot"
+            if key not in RECORD_KEYS or key in keys:
+                return "legacy-dict"
+            keys.add(key)
+        if {"ts", "text"} <= keys and stream.peek() in ("{", ""):
+            return "ndjson"
+    return "legacy-dict"
+
+
+def iter_archive(path):
+    """逐条读出归档中的记录 {"ts": ..., "text": ..., ["pinned": ..., "data": ...]}。
+
+    NDJSON 和旧版的字典/列表格式都是流式读取，内存占用与文件大小无关；旧版列表格式没有时间戳，
+    按顺序分配以文件修改时间结尾、每条相差 1 微秒的递增时间戳，保留所有条目和它们的顺序。
+    当前版本的快照文件（连同旁边的追加日志、大内容文件和图片/HTML 正文）通过 JsonHistoryStore 读取。
+    """
+    archive_format = detect_format(path)
+    logger.info(f"Reading {archive_format} history archive {path}.")
+    if archive_format == "ndjson":
+        with open_archive(path, "r") as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if isinstance(record.get("ts"), str) and isinstance(record.get("text"), str):
+                        yield record
+                        continue
+                except (ValueError, AttributeError):
+                    pass
+                logger.warning(f"Skipping malformed record on line {line_number} of {path}.")
+    elif archive_format == "legacy-dict":
+        with open_archive(path, "r") as file:
+            for timestamp, text in JsonStream(file).items():
+                if isinstance(text, str):
+                    yield {"ts": timestamp, "text": text}
+                else:
+                    logger.warning(f"Skipping non-text legacy entry at {timestamp}.")
+    elif archive_format == "legacy-list":
+        # 先数一遍条数，才能让最后一条正好落在文件修改时间上
+        with open_archive(path, "r") as file:
+            count = sum(1 for _ in JsonStream(file).items())
+        base = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(microseconds=count)
+        with open_archive(path, "r") as file:
+            for offset, (_, text) in enumerate(JsonStream(file).items(), 1):
+                if isinstance(text, str):
+                    yield {"ts": (base + timedelta(microseconds=offset)).isoformat(), "text": text}
+                else:
+                    logger.warning(f"Skipping non-text legacy entry #{offset}.")
+    else:
+        store = JsonHistoryStore(path)
+        clip_blobs = ClipBlobStore(os.path.splitext(path)[0] + "_clips")
+        store.load()
+        try:
+            for timestamp, text in store.iter_entries():
+                record = {"ts": timestamp, "text": text, "pinned": store.is_pinned(timestamp)}
+                ref = parse(text)
+                data = clip_blobs.load(ref) if ref else None
+                if data is not None:
+                    record["data"] = base64.b64encode(data).decode('ascii')
+                yield record
+        finally:
+            store.close()
+            clip_blobs.close()
+
+
+# ----------------------------------------------------------------------
+# 导入
+# ----------------------------------------------------------------------
+def place_in_run(timestamp, text, lookup):
+    """从 timestamp 开始逐微秒检查连续被占用的时间戳，lookup(时间戳) 返回那里的内容或 None。
+
+    这一段中已经有相同的内容时返回 (它的时间戳, True)，否则返回 (第一个空闲的时间戳, False)。
+    冲突的记录总是往后顺延，所以再次导入时会在同一段中找到上次顺延过的副本，不会再顺延一次。
+    """
+    moment = datetime.fromisoformat(timestamp)
+    while True:
+        existing = lookup(timestamp)
+        if existing is None:
+            return timestamp, False
+        if existing == text:
+            return timestamp, True
+        moment += timedelta(microseconds=1)
+        timestamp = moment.isoformat()
+
+
+def import_archive(store, records, start=None, end=None, dedup="entry", put_clip=None, scan=None):
+    """把 records 合并进 store，返回各类条数的统计。
+
+    dedup 为 entry 时跳过时间戳和内容都相同的记录，时间戳相同但内容不同时顺延到下一个空闲的时间戳，
+    顺延前先在连续被占用的几个时间戳中查找相同的内容（重复导入同一个文件不会产生重复）；
+    为 content 时跳过内容已经在历史记录中出现过的记录，时间戳被其它内容占用时同样顺延，不会覆盖已有的记录。
+    scan(text) 返回敏感内容过滤的结果，put_clip(ref, data) 保存图片和 HTML 的正文。
+    """
+    if dedup not in DEDUP_MODES:
+        raise ValueError(f"unknown dedup mode '{dedup}'")
+    stats = {"imported": 0, "duplicates": 0, "filtered": 0, "out_of_range": 0, "missing_data": 0, "invalid": 0}
+    batch, batch_texts, batch_digests, pins = [], {}, set(), []
+
+    def flush():
+        store.insert_many(batch)
+        for timestamp in pins:
+            store.pin(timestamp)
+        stats["imported"] += len(batch)
+        batch.clear()
+        batch_texts.clear()
+        batch_digests.clear()
+        pins.clear()
+
+    def lookup(timestamp):
+        # 这一批还没有写入存储，先在批内查找
+        existing = batch_texts.get(timestamp)
+        return existing if existing is not None else store.get(timestamp)
+
+    for record in records:
+        timestamp, text = record["ts"], record["text"]
+        try:
+            # 统一成存储使用的格式；存储中的时间戳为微秒数，解析不了或带时区的时间戳无法保存
+            timestamp = from_micros(to_micros(timestamp))
+        except ValueError:
+            logger.warning(f"Skipping record with invalid timestamp {timestamp!r}.")
+            stats["invalid"] += 1
+            continue
+        if (start and timestamp < start) or (end and timestamp > end):
+            stats["out_of_range"] += 1
+            continue
+        ref = parse(text)
+        if scan:
+            result = scan(text)
+            # 与实时记录相同：图片和 HTML 的正文无法局部遮盖或加密，描述中的纯文本命中任何规则都不导入
+            if result.action == "drop" or (ref and result.action):
+                stats["filtered"] += 1
+                continue
+            text = result.text
+
+        if dedup == "content":
+            digest = content_hash(text)
+            if digest in batch_digests or store.has_content(text):
+                stats["duplicates"] += 1
+                continue
+            batch_digests.add(digest)
+        timestamp, duplicate = place_in_run(timestamp, text, lookup)
+        if duplicate:
+            stats["duplicates"] += 1
+            continue
+        batch_texts[timestamp] = text
+
+        if ref and put_clip:
+            data = record.get("data")
+            data = base64.b64decode(data) if data else None
+            if data is not None and hashlib.blake2b(data, digest_size=16).hexdigest() == ref.digest:
+                put_clip(ref, data)
+            else:
+                stats["missing_data"] += 1
+        batch.append((timestamp, text))
+        if record.get("pinned"):
+            pins.append(timestamp)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+    flush()
+    logger.info(f"Imported {stats['imported']} history entries, skipped {stats['duplicates']} duplicates, "
+                f"{stats['filtered']} filtered, {stats['out_of_range']} out of range and {stats['invalid']} invalid.")
+    return stats
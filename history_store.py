@@ -0,0 +1,1367 @@
+import os
+import json
+import bisect
+import hashlib
+import mmap
+import zlib
+import time
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from search_index import SearchIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+# 内存中的时间戳为距 1970-01-01 的微秒数（int64），与 ISO 格式的字符串一一对应（不带时区，按本地时间）
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(timestamp):
+    """ISO 格式的时间戳 -> 微秒数，不是合法的不带时区的时间戳时抛出 ValueError。"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        raise ValueError(f"timezone-aware timestamp {timestamp!r} is not supported")
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_micros(value):
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+class OrderedIndex:
+    """用 bisect 维护的有序 int64 键数组（array('q')，每个键 8 字节），排名 0 对应最大的键（最新的时间戳）。
+
+    排名 -> 键为 O(1)，键 -> 排名为 O(log N)。新条目的时间戳几乎总是最大的，
+    插入基本都落在数组末尾，不需要移动其它元素。
+    """
+
+    def __init__(self, keys=()):
+        self._keys = array('q', sorted(keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        position = bisect.bisect_left(self._keys, key)
+        return position < len(self._keys) and self._keys[position] == key
+
+    def add(self, key):
+        """插入键并返回它的排名，键已存在时不重复插入。"""
+        position = bisect.bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            self._keys.insert(position, key)
+        return len(self._keys) - 1 - position
+
+    def remove(self, key):
+        """删除键并返回它原来的排名，键不存在时返回 None。"""
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+            return len(self._keys) - position
+        return None
+
+    def rank_of(self, key):
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return len(self._keys) - 1 - position
+        return None
+
+    def key_at(self, rank):
+        if 0 <= rank < len(self._keys):
+            return self._keys[len(self._keys) - 1 - rank]
+        return None
+
+    def slice(self, start, count):
+        """按排名返回 [start, start + count) 的键，最新的在前。"""
+        start = max(0, start)
+        end = len(self._keys) - start
+        begin = max(0, end - max(0, count))
+        return self._keys[begin:end][::-1].tolist()
+
+    def iter_range(self, start=None, end=None, oldest_first=False):
+        """按从新到旧（oldest_first 为 True 时从旧到新）的顺序返回 start <= key <= end 的键。"""
+        high = len(self._keys) if end is None else bisect.bisect_right(self._keys, end)
+        low = 0 if start is None else bisect.bisect_left(self._keys, start)
+        positions = range(low, high) if oldest_first else range(high - 1, low - 1, -1)
+        for position in positions:
+            yield self._keys[position]
+
+    def iter_oldest(self):
+        """从最旧的键开始依次返回。"""
+        return iter(self._keys)
+
+    def clear(self):
+        del self._keys[:]
+
+
+class EntryTable(OrderedIndex):
+    """按时间排序的全部历史记录：键数组之外再用一个平行的列表保存每条记录对应的 Blob。
+
+    每条记录只占 8 字节的时间戳和一个指向共享 Blob 的指针，没有逐条的字符串和字典项。
+    """
+
+    def __init__(self, items=()):
+        super().__init__()
+        self._values = []
+        for key, value in sorted(items, key=lambda item: item[0]):
+            if self._keys and self._keys[-1] == key:
+                # 同一个时间戳出现多次时保留最后一个
+                self._values[-1] = value
+                continue
+            self._keys.append(key)
+            self._values.append(value)
+
+    def get(self, key):
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return self._values[position]
+        return None
+
+    def put(self, key, value):
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            self._values[position] = value
+        else:
+            self._keys.insert(position, key)
+            self._values.insert(position, value)
+
+    def pop(self, key):
+        """删除键并返回它的值，键不存在时返回 None。"""
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+            return self._values.pop(position)
+        return None
+
+    def value_at(self, rank):
+        if 0 <= rank < len(self._keys):
+            return self._values[len(self._keys) - 1 - rank]
+        return None
+
+    def slice_items(self, start, count):
+        """按排名返回 [start, start + count) 的 (键, 值)，最新的在前。"""
+        start = max(0, start)
+        end = len(self._keys) - start
+        begin = max(0, end - max(0, count))
+        return list(zip(self._keys[begin:end][::-1], self._values[begin:end][::-1]))
+
+    def items(self):
+        """从旧到新返回 (键, 值)。"""
+        return zip(self._keys, self._values)
+
+    def clear(self):
+        super().clear()
+        self._values.clear()
+
+
+class HistoryStore(ABC):
+    """剪切板历史记录存储接口。
+
+    条目以 ISO 格式的时间戳为键，排名 0 表示最新的一条。
+    insert_many、slice_by_rank、iter_entries、sync 和 close 有默认实现，其它方法由子类实现。
+    """
+
+    # 调用方定期调用 sync() 的间隔（秒）
+    fsync_interval = 1.0
+    # 为 False 时写入操作不会自己刷盘，完全由调用方（例如后台写盘线程）调用 sync()
+    auto_sync = True
+
+    @abstractmethod
+    def load(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, timestamp, text):
+        raise NotImplementedError
+
+    def insert_many(self, entries):
+        """批量写入 [(timestamp, text), ...]，用于导入。"""
+        for timestamp, text in entries:
+            self.insert(timestamp, text)
+
+    @abstractmethod
+    def delete(self, timestamp):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, timestamp):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_rank(self, rank):
+        """返回第 rank 新的 (timestamp, text)，越界时返回 None。"""
+        raise NotImplementedError
+
+    def slice_by_rank(self, start, count):
+        """返回排名在 [start, start + count) 内的 (timestamp, preview) 列表，用于列表显示。
+
+        大内容只返回开头的预览，完整内容通过 get/get_by_rank 读取。
+        """
+        entries = []
+        for rank in range(start, start + count):
+            entry = self.get_by_rank(rank)
+            if entry is None:
+                break
+            entries.append(entry)
+        return entries
+
+    @abstractmethod
+    def rank_of(self, timestamp):
+        """返回条目当前的排名，不存在时返回 None。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def has_content(self, text):
+        """历史记录中是否有与 text 相同的内容。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def range_by_time(self, start=None, end=None, limit=None, oldest_first=False):
+        """按时间倒序（oldest_first 为 True 时按时间顺序）返回 start <= timestamp <= end 的 (timestamp, text)。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def unique_count(self):
+        """去重后的内容条数。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def slice_unique(self, start, count):
+        """按最近使用时间倒序返回去重后的内容 (hash, preview, count, first_seen, last_seen) 列表。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_unique_by_rank(self, rank):
+        """与 slice_unique 相同，但返回完整内容。"""
+        raise NotImplementedError
+
+    def iter_entries(self):
+        """从旧到新返回全部记录。用于导出、导入和同步：写入另一个存储时每条都追加在末尾，不用在数组开头插入。"""
+        return self.range_by_time(oldest_first=True)
+
+    @abstractmethod
+    def search(self, query, limit=100):
+        """返回包含 query（不区分大小写）的去重内容 (last_seen, preview) 列表，最近复制的在前。
+
+        三个字符以上的查询走全文索引；索引尚未建好或查询太短时逐条扫描。
+        大内容只搜索开头的预览。
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def pin(self, timestamp, pinned=True):
+        """固定/取消固定一条记录，固定的记录不会被保留策略淘汰。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_pinned(self, timestamp):
+        raise NotImplementedError
+
+    @abstractmethod
+    def oldest_unpinned(self, limit):
+        """从旧到新返回最多 limit 条未固定记录的时间戳。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def total_bytes(self):
+        """去重后所有内容的 UTF-8 字节数之和。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def evict(self, timestamps):
+        """删除一批记录，返回 (删除条数, 释放的字节数)。"""
+        raise NotImplementedError
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return self.count()
+
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def utf8_size(text):
+    return len(text.encode('utf-8', 'surrogatepass'))
+
+
+class Blob:
+    """内容相同的多次复制共享的一份内容，以及它的哈希、出现次数和首次/最近出现时间（JSON 存储中为微秒数）。
+
+    大内容被转存到单独的压缩文件后，text 只保留开头的预览，size 记录完整内容的 UTF-8 字节数。
+    内容出现不止一次时，seen 按时间顺序保存每次出现的时间戳（array('q')），删除最早或最近的
+    一次出现后用它直接得到新的首次/最近出现时间；只出现一次的内容不分配这个数组。
+    """
+
+    __slots__ = ("digest", "text", "count", "first_seen", "last_seen", "seen", "spilled", "size")
+
+    def __init__(self, text, spilled=False, size=None, digest=None):
+        self.digest = digest
+        self.text = text
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.seen = None
+        self.spilled = spilled
+        self.size = utf8_size(text) if size is None else size
+
+
+PREVIEW_CHARS = 200
+
+
+def make_preview(text):
+    return text[:PREVIEW_CHARS]
+
+
+class BlobSpill:
+    """把超过阈值的大内容压缩后写到 <hash>.z 文件中，需要时再通过 mmap 读取并解压。
+
+    压缩和写盘在后台线程中进行，写完之前的读取直接返回内存中的内容。
+    """
+
+    def __init__(self, directory, threshold=256 * 1024, level=6):
+        self.directory = directory
+        self.threshold = threshold
+        self.level = level
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blob-spill")
+
+    def should_spill(self, text):
+        return self.threshold and len(text) > self.threshold
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + ".z")
+
+    def spill(self, digest, text):
+        with self._lock:
+            self._pending[digest] = text
+        self._executor.submit(self._write, digest, text)
+
+    def _write(self, digest, text):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path(digest)
+            if not os.path.exists(path):
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(zlib.compress(text.encode('utf-8', 'surrogatepass'), self.level))
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to spill large clipboard entry {digest}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def load(self, digest):
+        with self._lock:
+            text = self._pending.get(digest)
+        if text is not None:
+            return text
+        try:
+            with open(self.path(digest), 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return zlib.decompress(mapped).decode('utf-8', 'surrogatepass')
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error(f"Failed to load large clipboard entry {digest}: {e}")
+            return None
+
+    def discard(self, digest):
+        self._executor.submit(self._remove, digest)
+
+    def _remove(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove large clipboard entry {digest}: {e}")
+
+    def collect_garbage(self, live_digests):
+        """删除不再被任何条目引用的文件。"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            digest, ext = os.path.splitext(name)
+            if ext == ".z" and digest not in live_digests:
+                self.discard(digest)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def create_history_store(backend, base_path, large_payload_threshold=256 * 1024):
+    """根据配置的后端名称创建历史记录存储（尚未加载），base_path 为不带扩展名的文件路径。"""
+    json_file = base_path + ".json"
+    if backend == "sqlite":
+        # 首次切换到 SQLite 时在 load() 中导入原有的 JSON 历史记录
+        return SqliteHistoryStore(base_path + ".db", spill_threshold=large_payload_threshold, legacy_json_file=json_file)
+
+    if backend != "json":
+        logger.warning(f"Unknown history backend '{backend}', falling back to json.")
+    return JsonHistoryStore(json_file, spill_threshold=large_payload_threshold)
+
+
+def open_history_store(backend, base_path, large_payload_threshold=256 * 1024):
+    """创建并加载历史记录存储。"""
+    store = create_history_store(backend, base_path, large_payload_threshold)
+    store.load()
+    return store
+
+
+class JsonHistoryStore(HistoryStore):
+    """剪切板历史记录的快照 + 追加日志存储。
+
+    每次新增/删除只向日志文件追加一行 JSON，写入开销与条目大小相关而与历史总量无关。
+    日志增长到一定大小后在后台线程中压缩成新的快照文件，启动时先读快照再重放日志。
+    """
+
+    def __init__(self, snapshot_file, journal_file=None, fsync_batch=32, fsync_interval=1.0,
+                 compact_min_bytes=1024 * 1024, spill_threshold=256 * 1024):
+        self.snapshot_file = snapshot_file
+        self.spill = BlobSpill(os.path.splitext(snapshot_file)[0] + "_blobs", spill_threshold)
+        self.journal_file = journal_file or os.path.splitext(snapshot_file)[0] + ".journal"
+        self.rotated_journal_file = self.journal_file + ".old"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_min_bytes = compact_min_bytes
+
+        # 每次复制是一个以时间戳（微秒数）为键的事件，事件只引用内容，相同内容共享一个 Blob；
+        # 内存中不保留逐条的时间戳字符串，对外的接口仍然使用 ISO 格式的字符串
+        self.entries = EntryTable()
+        self.blobs = {}
+        # 去重后的内容按最近出现时间排序，每个内容的最近出现时间都对应一条不同的记录
+        self.unique_index = OrderedIndex()
+        self.pinned = set()
+        self._total_bytes = 0
+        # 内存中的全文索引，启动时在后台线程中建立，之后随增删同步更新
+        self.search_index = SearchIndex(sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None))
+        self._search_thread = None
+        # _state_lock 保护内存中的历史记录（保留策略会在后台线程中删除记录），_lock 保护日志文件
+        self._state_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_bytes = 0
+        self._snapshot_bytes = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._compact_thread = None
+        # 清空后等 sync() 在后台线程中压缩日志
+        self._compact_requested = False
+        self._replaying = False
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+    def load(self):
+        self.entries.clear()
+        self.blobs.clear()
+        self.pinned.clear()
+        self._rebuild_indexes(self._load_snapshot())
+        # 上一次压缩可能在写完快照前中断，先重放旧日志再重放当前日志（重放是幂等的）
+        self._replaying = True
+        for path in (self.rotated_journal_file, self.journal_file):
+            self._replay_journal(path)
+        self._replaying = False
+        # 重放期间不删除大内容文件，全部加载完后再清理没有被引用的文件
+        self.spill.collect_garbage({digest for digest, blob in self.blobs.items() if blob.spilled})
+
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal_bytes = self._journal.tell()
+        logger.info(f"Loaded {len(self.entries)} history entries ({len(self.blobs)} unique) "
+                    f"(snapshot {self._snapshot_bytes} bytes, journal {self._journal_bytes} bytes).")
+        self._maybe_compact()
+
+        # 加载期间不更新索引，全部加载完后再分批建立
+        self._search_thread = threading.Thread(target=self._build_search_index, daemon=True)
+        self._search_thread.start()
+
+    def _build_search_index(self):
+        with self._state_lock:
+            digests = list(self.blobs)
+
+        def fetch_batch(position, limit):
+            position = position or 0
+            rows = [(digest, self.blobs[digest].text, from_micros(self.blobs[digest].last_seen))
+                    for digest in digests[position:position + limit] if digest in self.blobs]
+            position += limit
+            return rows, position if position < len(digests) else None
+
+        try:
+            self.search_index.build(fetch_batch, self._state_lock)
+        except Exception as e:
+            logger.error(f"Failed to build search index: {e}")
+
+    def _load_snapshot(self):
+        """读取快照，返回其中的 [(微秒数, Blob), ...]。"""
+        events = []
+        if not os.path.exists(self.snapshot_file):
+            return events
+        with open(self.snapshot_file, 'r') as file:
+            try:
+                data = json.load(file)
+            except json.JSONDecodeError:
+                logger.error("Failed to decode JSON from history file. Creating a new empty history.")
+                return events
+        self._snapshot_bytes = os.path.getsize(self.snapshot_file)
+
+        if isinstance(data, dict) and data.get("version") == 2:
+            for digest, value in data["blobs"].items():
+                if isinstance(value, dict):
+                    # 转存到单独文件的大内容，快照里只有预览
+                    self.blobs[digest] = Blob(value["preview"], spilled=True, size=value["size"], digest=digest)
+                else:
+                    self.blobs[digest] = Blob(value, digest=digest)
+            for timestamp, digest in data["events"].items():
+                key = self._key(timestamp)
+                if key is not None and digest in self.blobs:
+                    events.append((key, self.blobs[digest]))
+            self.pinned.update(key for key in map(self._key, data.get("pinned", ())) if key is not None)
+        elif isinstance(data, dict):
+            # 旧版本的 {时间戳: 内容} 格式
+            for timestamp, text in data.items():
+                self._load_legacy_entry(events, self._key(timestamp), text)
+        else:
+            # 旧版本的列表格式：按顺序分配递增的时间戳，避免所有条目落到同一个键上
+            logger.warning("History file format is incorrect. Converting to dictionary.")
+            base = to_micros(datetime.now().isoformat()) - len(data)
+            for offset, entry in enumerate(data):
+                self._load_legacy_entry(events, base + offset, entry)
+        return events
+
+    def _load_legacy_entry(self, events, key, text):
+        if key is None:
+            return
+        digest = content_hash(text)
+        if digest not in self.blobs:
+            self.blobs[digest] = self._make_blob(digest, text)
+        events.append((key, self.blobs[digest]))
+
+    def _key(self, timestamp, warn=True):
+        """ISO 格式的时间戳 -> 内存中的键，无法解析时返回 None（加载时同时记录日志）。"""
+        try:
+            return to_micros(timestamp)
+        except (TypeError, ValueError) as e:
+            if warn:
+                logger.warning(f"Ignoring invalid history timestamp {timestamp!r}: {e}")
+            return None
+
+    def _rebuild_indexes(self, events):
+        self.entries = EntryTable(events)
+        for blob in self.blobs.values():
+            blob.count = 0
+            blob.first_seen = blob.last_seen = blob.seen = None
+        # 记录按时间从旧到新排列，第一次遇到的是最早的一次出现
+        for timestamp, blob in self.entries.items():
+            if blob.count == 1:
+                blob.seen = array('q', (blob.first_seen,))
+            if blob.seen is not None:
+                blob.seen.append(timestamp)
+            blob.count += 1
+            if blob.first_seen is None:
+                blob.first_seen = timestamp
+            blob.last_seen = timestamp
+        for digest in [digest for digest, blob in self.blobs.items() if not blob.count]:
+            del self.blobs[digest]
+        self.pinned = {timestamp for timestamp in self.pinned if timestamp in self.entries}
+        self._total_bytes = sum(blob.size for blob in self.blobs.values())
+        self.unique_index = OrderedIndex(blob.last_seen for blob in self.blobs.values())
+
+    def _replay_journal(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as file:
+            for line_no, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    logger.warning(f"Skipping corrupt journal record at {path}:{line_no}")
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        op = record.get("op")
+        timestamp = self._key(record["ts"]) if "ts" in record else None
+        if op in ("add", "del", "pin", "unpin") and timestamp is None:
+            return
+        if op == "add":
+            digest = record.get("hash") or content_hash(record["text"])
+            if "text" in record:
+                make_blob = lambda: Blob(record["text"])
+            elif record.get("spilled"):
+                make_blob = lambda: Blob(record["preview"], spilled=True, size=record["size"])
+            elif digest in self.blobs:
+                # 内容已经存在，日志里只记录了哈希
+                make_blob = None
+            else:
+                logger.warning(f"Journal references unknown content {digest} at {record['ts']}")
+                return
+            self._put(timestamp, digest, make_blob)
+        elif op == "del":
+            self._unlink(timestamp)
+        elif op == "pin":
+            if timestamp in self.entries:
+                self.pinned.add(timestamp)
+        elif op == "unpin":
+            self.pinned.discard(timestamp)
+        elif op == "clear":
+            self._clear_memory()
+        else:
+            logger.warning(f"Unknown journal operation: {op}")
+
+    # ------------------------------------------------------------------
+    # 内存中的事件与内容
+    # ------------------------------------------------------------------
+    def _put(self, timestamp, digest, make_blob):
+        """记录一次复制，返回是否新增了内容。make_blob 只在内容尚不存在时调用。"""
+        current = self.entries.get(timestamp)
+        if current is not None and current.digest == digest:
+            return False
+        self._unlink(timestamp)
+        blob = self.blobs.get(digest)
+        new_blob = blob is None
+        if new_blob:
+            blob = make_blob()
+            # 字典的键和 Blob 共用同一个哈希字符串
+            blob.digest = digest
+            self.blobs[digest] = blob
+            self._total_bytes += blob.size
+        self._link(timestamp, blob)
+        return new_blob
+
+    def _make_blob(self, digest, text):
+        if self.spill.should_spill(text):
+            # 大内容压缩后写到单独的文件，内存里只保留预览
+            self.spill.spill(digest, text)
+            return Blob(make_preview(text), spilled=True, size=utf8_size(text), digest=digest)
+        return Blob(text, digest=digest)
+
+    def _link(self, timestamp, blob):
+        if blob.count:
+            self.unique_index.remove(blob.last_seen)
+            if blob.seen is None:
+                blob.seen = array('q', (blob.first_seen,))
+            bisect.insort(blob.seen, timestamp)
+            blob.first_seen, blob.last_seen = blob.seen[0], blob.seen[-1]
+        else:
+            blob.first_seen = blob.last_seen = timestamp
+        blob.count += 1
+        self.unique_index.add(blob.last_seen)
+        self.entries.put(timestamp, blob)
+        if not self._replaying:
+            self.search_index.add(blob.digest, blob.text, from_micros(blob.last_seen))
+
+    def _unlink(self, timestamp):
+        blob = self.entries.pop(timestamp)
+        if blob is None:
+            return None
+        self.pinned.discard(timestamp)
+        self.unique_index.remove(blob.last_seen)
+        blob.count -= 1
+        if not blob.count:
+            del self.blobs[blob.digest]
+            self._total_bytes -= blob.size
+            if not self._replaying:
+                self.search_index.remove(blob.digest)
+                if blob.spilled:
+                    self.spill.discard(blob.digest)
+            return blob.digest
+        # 只有重复内容才会走到这里，按二分查找删掉这次出现，不需要扫描全部记录
+        del blob.seen[bisect.bisect_left(blob.seen, timestamp)]
+        blob.first_seen, blob.last_seen = blob.seen[0], blob.seen[-1]
+        if blob.count == 1:
+            blob.seen = None
+        self.unique_index.add(blob.last_seen)
+        if not self._replaying:
+            self.search_index.add(blob.digest, blob.text, from_micros(blob.last_seen))
+        return blob.digest
+
+    def _clear_memory(self):
+        self.entries.clear()
+        self.blobs.clear()
+        self.pinned.clear()
+        self._total_bytes = 0
+        self.unique_index.clear()
+        self.search_index.clear()
+
+    # ------------------------------------------------------------------
+    # 修改
+    # ------------------------------------------------------------------
+    def insert(self, timestamp, text):
+        key = to_micros(timestamp)
+        with self._state_lock:
+            digest = content_hash(text)
+            new_blob = self._put(key, digest, lambda: self._make_blob(digest, text))
+            record = {"op": "add", "ts": timestamp, "hash": digest}
+            if new_blob:
+                # 相同内容只在第一次出现时写入正文，大内容只写预览
+                blob = self.blobs[digest]
+                if blob.spilled:
+                    record.update(spilled=True, preview=blob.text, size=blob.size)
+                else:
+                    record["text"] = text
+            self._append(record)
+
+    def delete(self, timestamp):
+        key = self._key(timestamp, warn=False)
+        with self._state_lock:
+            if key is None or self._unlink(key) is None:
+                return False
+            self._append({"op": "del", "ts": timestamp})
+            return True
+
+    def clear(self):
+        with self._state_lock:
+            for digest, blob in self.blobs.items():
+                if blob.spilled:
+                    self.spill.discard(digest)
+            self._clear_memory()
+            self._append({"op": "clear"})
+            # 快照此时为空，压缩掉整个日志；由调用方刷盘时留给下一次 sync()，不在调用方的线程中 fsync
+            if self.auto_sync:
+                self.compact()
+            else:
+                self._compact_requested = True
+
+    def pin(self, timestamp, pinned=True):
+        key = self._key(timestamp, warn=False)
+        with self._state_lock:
+            if key not in self.entries or (key in self.pinned) == pinned:
+                return False
+            if pinned:
+                self.pinned.add(key)
+            else:
+                self.pinned.discard(key)
+            self._append({"op": "pin" if pinned else "unpin", "ts": timestamp})
+            return True
+
+    def evict(self, timestamps):
+        with self._state_lock:
+            before = self._total_bytes
+            evicted = sum(1 for timestamp in timestamps if self.delete(timestamp))
+            return evicted, before - self._total_bytes
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._journal.write(line)
+            self._journal_bytes += len(line)
+            self._pending += 1
+            if not self.auto_sync:
+                return
+            if (self._pending >= self.fsync_batch
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_locked()
+        self._maybe_compact()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _full_text(self, blob):
+        return self.spill.load(blob.digest) if blob.spilled else blob.text
+
+    def get(self, timestamp):
+        key = self._key(timestamp, warn=False)
+        with self._state_lock:
+            blob = self.entries.get(key) if key is not None else None
+            return self._full_text(blob) if blob else None
+
+    def get_by_rank(self, rank):
+        with self._state_lock:
+            key = self.entries.key_at(rank)
+            if key is None:
+                return None
+            return from_micros(key), self._full_text(self.entries.value_at(rank))
+
+    def slice_by_rank(self, start, count):
+        # 时间戳字符串只为这一页的记录生成
+        with self._state_lock:
+            return [(from_micros(key), blob.text) for key, blob in self.entries.slice_items(start, count)]
+
+    def rank_of(self, timestamp):
+        key = self._key(timestamp, warn=False)
+        with self._state_lock:
+            return self.entries.rank_of(key) if key is not None else None
+
+    def count(self):
+        return len(self.entries)
+
+    def has_content(self, text):
+        return content_hash(text) in self.blobs
+
+    def range_by_time(self, start=None, end=None, limit=None, oldest_first=False):
+        start = to_micros(start) if start else None
+        end = to_micros(end) if end else None
+        # 先在锁内取出时间戳（int64 数组，不占多少内存），再逐条读取内容，避免在迭代期间一直持有锁
+        with self._state_lock:
+            keys = array('q')
+            for key in self.entries.iter_range(start, end, oldest_first):
+                if limit is not None and len(keys) >= limit:
+                    break
+                keys.append(key)
+        for key in keys:
+            with self._state_lock:
+                blob = self.entries.get(key)
+                text = self._full_text(blob) if blob else None
+            if text is not None:
+                yield from_micros(key), text
+
+    def is_pinned(self, timestamp):
+        return self._key(timestamp, warn=False) in self.pinned
+
+    def oldest_unpinned(self, limit):
+        with self._state_lock:
+            timestamps = []
+            for key in self.entries.iter_oldest():
+                if len(timestamps) >= limit:
+                    break
+                if key not in self.pinned:
+                    timestamps.append(from_micros(key))
+            return timestamps
+
+    def total_bytes(self):
+        return self._total_bytes
+
+    def unique_count(self):
+        with self._state_lock:
+            return len(self.blobs)
+
+    def slice_unique(self, start, count):
+        with self._state_lock:
+            entries = []
+            for last_seen in self.unique_index.slice(start, count):
+                blob = self.entries.get(last_seen)
+                entries.append((blob.digest, blob.text, blob.count, from_micros(blob.first_seen), from_micros(last_seen)))
+            return entries
+
+    def search(self, query, limit=100):
+        with self._state_lock:
+            digests = self.search_index.search(query, limit)
+            if digests is None:
+                needle = query.lower()
+                digests = []
+                for last_seen in self.unique_index.iter_range():
+                    if len(digests) >= limit:
+                        break
+                    blob = self.entries.get(last_seen)
+                    if needle in blob.text.lower():
+                        digests.append(blob.digest)
+            return [(from_micros(self.blobs[digest].last_seen), self.blobs[digest].text) for digest in digests]
+
+    def get_unique_by_rank(self, rank):
+        with self._state_lock:
+            entries = self.slice_unique(rank, 1)
+            if not entries:
+                return None
+            digest, preview, occurrences, first_seen, last_seen = entries[0]
+            return digest, self._full_text(self.blobs[digest]), occurrences, first_seen, last_seen
+
+    # ------------------------------------------------------------------
+    # 刷盘与压缩
+    # ------------------------------------------------------------------
+    def sync(self):
+        with self._lock:
+            if not self._pending:
+                return
+            # 锁内只把缓冲区交给操作系统，fsync 在锁外进行，不阻塞正在追加日志的线程
+            self._journal.flush()
+            fd = os.dup(self._journal.fileno())
+            self._pending = 0
+            self._last_sync = time.monotonic()
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._maybe_compact()
+
+    def _sync_locked(self):
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _maybe_compact(self):
+        if self._compact_requested or self._journal_bytes > max(self.compact_min_bytes, self._snapshot_bytes):
+            self.compact()
+
+    def compact(self, wait=False):
+        with self._state_lock:
+            if self._compact_thread and self._compact_thread.is_alive():
+                if not wait:
+                    return
+                self._compact_thread.join()
+            self._compact_requested = False
+
+            with self._lock:
+                self._sync_locked()
+                self._journal.close()
+                if os.path.exists(self.rotated_journal_file):
+                    # 上一次压缩失败留下的旧日志，合并进去以免丢失
+                    with open(self.rotated_journal_file, 'a', encoding='utf-8') as old, \
+                            open(self.journal_file, 'r', encoding='utf-8') as current:
+                        old.write(current.read())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.rotated_journal_file)
+                self._journal = open(self.journal_file, 'a', encoding='utf-8')
+                self._journal_bytes = 0
+                data = {
+                    "version": 2,
+                    "blobs": {digest: {"preview": blob.text, "size": blob.size} if blob.spilled else blob.text
+                              for digest, blob in self.blobs.items()},
+                    "events": {from_micros(key): blob.digest for key, blob in self.entries.items()},
+                    "pinned": [from_micros(key) for key in sorted(self.pinned)]
+                }
+
+            self._compact_thread = threading.Thread(target=self._write_snapshot, args=(data,), daemon=True)
+            self._compact_thread.start()
+            if wait:
+                self._compact_thread.join()
+
+    def _write_snapshot(self, data):
+        start = time.monotonic()
+        tmp_file = self.snapshot_file + ".tmp"
+        try:
+            with open(tmp_file, 'w') as file:
+                json.dump(data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            os.remove(self.rotated_journal_file)
+            self._snapshot_bytes = os.path.getsize(self.snapshot_file)
+            logger.info(f"Compacted clipboard history: {len(data['events'])} entries, "
+                        f"{self._snapshot_bytes} bytes in {time.monotonic() - start:.3f}s.")
+        except Exception as e:
+            logger.error(f"Failed to compact clipboard history: {e}")
+
+    def close(self):
+        if self._compact_thread and self._compact_thread.is_alive():
+            self._compact_thread.join()
+        self.spill.close()
+        with self._lock:
+            if self._journal:
+                self._sync_locked()
+                self._journal.close()
+                self._journal = None
+
+
+class KeysetPager:
+    """按排名分页读取按某一列倒序排列的表，不用 OFFSET 从头跳过前面的行。
+
+    记住上一次读到的一页两端的 (排名, 键)。下一页从最近的已知位置出发：向后翻页是
+    WHERE 键 <= ? 的键集查询，只跳过到目标排名之间的几行；向前翻页或跳到末尾时先按键正序
+    找到目标行的键。写入比某个键新的行会让它的排名移动，调用方通过 shift() 同步。
+    """
+
+    def __init__(self, table, column, where_column=None):
+        self.table = table
+        self.column = column
+        self.where_column = where_column or column
+        self.anchors = []
+
+    def reset(self):
+        self.anchors = []
+
+    def shift(self, key, delta):
+        """插入（delta=1）或删除（delta=-1）了键为 key 的行。"""
+        self.anchors = [(rank + delta if anchor_key < key else rank, anchor_key) for rank, anchor_key in self.anchors
+                        if not (delta < 0 and anchor_key == key)]
+
+    def fetch(self, conn, total, start, count, query, key_index=0):
+        """返回排名在 [start, start + count) 内的行。
+
+        query 按键倒序排列，以 LIMIT ? OFFSET ? 结尾，并在 WHERE 的位置留一个 {where} 占位符；
+        key_index 是键在结果行中的位置。
+        """
+        start = max(0, start)
+        if start >= total or count <= 0:
+            return []
+        key, offset = self._locate(conn, total, start)
+        if key is None:
+            rows = conn.execute(query.format(where=""), (count, offset)).fetchall()
+        else:
+            rows = conn.execute(query.format(where=f"WHERE {self.where_column} <= ?"), (key, count, offset)).fetchall()
+        if rows:
+            self.anchors = [(start, rows[0][key_index]), (start + len(rows) - 1, rows[-1][key_index])]
+        return rows
+
+    def _locate(self, conn, total, rank):
+        """返回 (键, 偏移)：目标行是键不大于这个键（None 表示不限）的行按倒序的第 偏移 行。"""
+        # 候选起点 (距离, 排名, 键)：最新的一行、上一页的两端和最旧的一行
+        candidates = [(rank, None, None)]
+        candidates += [(abs(rank - anchor_rank), anchor_rank, key) for anchor_rank, key in self.anchors]
+        candidates.append((total - 1 - rank, total - 1, None))
+        distance, anchor_rank, key = min(candidates, key=lambda candidate: candidate[0])
+        if anchor_rank is None:
+            return None, rank
+        if key is not None and anchor_rank <= rank:
+            return key, rank - anchor_rank
+        # 目标在起点之前（更新），或者从最旧的一行数起，按键正序数过去
+        where, params = (f"WHERE {self.column} >= ?", (key,)) if key is not None else ("", ())
+        row = conn.execute(f"SELECT {self.column} FROM {self.table} {where} ORDER BY {self.column} LIMIT 1 OFFSET ?",
+                           params + (anchor_rank - rank,)).fetchone()
+        return (row[0], 0) if row else (None, rank)
+
+
+class SqliteHistoryStore(HistoryStore):
+    """基于 sqlite3 的历史记录存储，WAL 模式 + 时间戳索引，历史不需要全部载入内存。
+
+    events 表记录每次复制的时间戳和内容哈希，blobs 表按哈希保存去重后的内容。
+    auto_sync 为 False 时写操作只留在未提交的事务中（同一个连接上的查询可以看到），
+    由调用方在后台写盘线程中调用 sync() 统一提交。
+    """
+
+    def __init__(self, db_file, spill_threshold=256 * 1024, legacy_json_file=None):
+        self.db_file = db_file
+        self.legacy_json_file = legacy_json_file
+        self.spill = BlobSpill(os.path.splitext(db_file)[0] + "_db_blobs", spill_threshold)
+        self.conn = None
+        self.search_index = None
+        self._search_thread = None
+        self._count = 0
+        self._unique_count = 0
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        # 列表按排名分页读取，用上一页的位置做键集查询；去重列表按 last_seen 排序，同样处理
+        self._event_pager = KeysetPager("events", "ts", "e.ts")
+        self._unique_pager = KeysetPager("blobs", "last_seen")
+
+    def load(self):
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                          "count INTEGER NOT NULL, first_seen TEXT NOT NULL, last_seen TEXT NOT NULL, "
+                          "spilled INTEGER NOT NULL DEFAULT 0, size INTEGER NOT NULL DEFAULT 0)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(blobs)")}
+        if "spilled" not in columns:
+            self.conn.execute("ALTER TABLE blobs ADD COLUMN spilled INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("ALTER TABLE blobs ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("UPDATE blobs SET size = LENGTH(CAST(text AS BLOB))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_seen ON blobs (last_seen)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS events (ts TEXT NOT NULL, hash TEXT NOT NULL, "
+                          "pinned INTEGER NOT NULL DEFAULT 0)")
+        if "pinned" not in {row[1] for row in self.conn.execute("PRAGMA table_info(events)")}:
+            self.conn.execute("ALTER TABLE events ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_events_ts ON events (ts)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_hash ON events (hash)")
+        self.search_index = SearchIndex(self.conn)
+        self.conn.commit()
+        self._refresh_counts()
+        self._migrate_history_table()
+        self._import_legacy_json()
+        self.conn.commit()
+        logger.info(f"Opened SQLite history store {self.db_file} with {self._count} entries "
+                    f"({self._unique_count} unique).")
+
+        # 全文索引和内容在同一个事务中更新，只有旧版本的数据库需要补建
+        if self.search_index.count() == self._unique_count:
+            self.search_index.ready = True
+        else:
+            with self.conn:
+                self.search_index.clear()
+            self._search_thread = threading.Thread(target=self._build_search_index, daemon=True)
+            self._search_thread.start()
+
+    def _build_search_index(self):
+        def fetch_batch(position, limit):
+            rows = self.conn.execute(
+                "SELECT rowid, hash, text, last_seen FROM blobs WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (position or 0, limit)).fetchall()
+            position = rows[-1][0] if len(rows) == limit else None
+            return [row[1:] for row in rows], position
+
+        try:
+            self.search_index.build(fetch_batch, self._lock, commit=self.conn.commit)
+        except Exception as e:
+            logger.error(f"Failed to build search index: {e}")
+
+    def _refresh_counts(self):
+        self._event_pager.reset()
+        self._unique_pager.reset()
+        self._count = self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        self._unique_count, self._total_bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+
+    def _migrate_history_table(self):
+        # 早期版本把内容直接存在 history 表中
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history'").fetchone():
+            return
+        self.insert_many(self.conn.execute("SELECT ts, text FROM history").fetchall())
+        with self.conn:
+            self.conn.execute("DROP TABLE history")
+        logger.info(f"Migrated SQLite history table to deduplicated schema ({self._unique_count} unique).")
+
+    def _import_legacy_json(self):
+        if not self.legacy_json_file or self._count:
+            return
+        legacy = JsonHistoryStore(self.legacy_json_file, spill_threshold=self.spill.threshold)
+        if not (os.path.exists(legacy.snapshot_file) or os.path.exists(legacy.journal_file)):
+            return
+        legacy.load()
+        self.insert_many(legacy.iter_entries())
+        legacy.close()
+        logger.info(f"Imported {self._count} entries from {self.legacy_json_file} into SQLite store.")
+
+    @contextmanager
+    def _writing(self):
+        """写操作的事务：auto_sync 为 True 时立即提交，否则放在保存点中，出错时只回滚这一次修改。"""
+        with self._lock:
+            if self.auto_sync:
+                try:
+                    with self.conn:
+                        yield
+                except BaseException:
+                    self._refresh_counts()
+                    raise
+                return
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute("SAVEPOINT write")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK TO write")
+                self.conn.execute("RELEASE write")
+                # 内存中的计数可能已经加上了回滚掉的修改
+                self._refresh_counts()
+                raise
+            self.conn.execute("RELEASE write")
+
+    def sync(self):
+        with self._lock:
+            if self.conn and self.conn.in_transaction:
+                self.conn.commit()
+
+    def insert(self, timestamp, text):
+        with self._writing():
+            self._insert_locked(timestamp, text)
+
+    def insert_many(self, entries):
+        with self._writing():
+            for timestamp, text in entries:
+                self._insert_locked(timestamp, text)
+
+    def _insert_locked(self, timestamp, text):
+        digest = content_hash(text)
+        old = self.conn.execute("SELECT hash FROM events WHERE ts = ?", (timestamp,)).fetchone()
+        if old and old[0] == digest:
+            return
+        if old:
+            self._unlink_locked(timestamp, old[0])
+        stored_text, spilled, size = text, False, utf8_size(text)
+        if not self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+            self._unique_count += 1
+            self._total_bytes += size
+            if self.spill.should_spill(text):
+                # 大内容压缩后写到单独的文件，表中只保存预览
+                self.spill.spill(digest, text)
+                stored_text, spilled = make_preview(text), True
+        self.conn.execute(
+            "INSERT INTO blobs (hash, text, count, first_seen, last_seen, spilled, size) VALUES (?, ?, 1, ?, ?, ?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET count = count + 1, "
+            "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)",
+            (digest, stored_text, timestamp, timestamp, spilled, size))
+        self.conn.execute("INSERT INTO events (ts, hash) VALUES (?, ?)", (timestamp, digest))
+        self._count += 1
+        self._event_pager.shift(timestamp, 1)
+        self._unique_pager.reset()
+        self._index_blob(digest)
+
+    def _index_blob(self, digest):
+        text, last_seen = self.conn.execute("SELECT text, last_seen FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        self.search_index.add(digest, text, last_seen)
+
+    def _unlink_locked(self, timestamp, digest):
+        self.conn.execute("DELETE FROM events WHERE ts = ?", (timestamp,))
+        self._count -= 1
+        self._event_pager.shift(timestamp, -1)
+        self._unique_pager.reset()
+        occurrences, spilled, size = self.conn.execute(
+            "SELECT count, spilled, size FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if occurrences <= 1:
+            self.conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+            self._unique_count -= 1
+            self._total_bytes -= size
+            self.search_index.remove(digest)
+            if spilled:
+                self.spill.discard(digest)
+        else:
+            self.conn.execute(
+                "UPDATE blobs SET count = count - 1, first_seen = (SELECT MIN(ts) FROM events WHERE hash = ?), "
+                "last_seen = (SELECT MAX(ts) FROM events WHERE hash = ?) WHERE hash = ?",
+                (digest, digest, digest))
+            self._index_blob(digest)
+
+    def delete(self, timestamp):
+        with self._writing():
+            row = self.conn.execute("SELECT hash FROM events WHERE ts = ?", (timestamp,)).fetchone()
+            if not row:
+                return False
+            self._unlink_locked(timestamp, row[0])
+        return True
+
+    def clear(self):
+        with self._writing():
+            for (digest,) in self.conn.execute("SELECT hash FROM blobs WHERE spilled").fetchall():
+                self.spill.discard(digest)
+            self.conn.execute("DELETE FROM events")
+            self.conn.execute("DELETE FROM blobs")
+            self.search_index.clear()
+            self._count = self._unique_count = self._total_bytes = 0
+            self._event_pager.reset()
+            self._unique_pager.reset()
+
+    def _full_text(self, digest, text, spilled):
+        return self.spill.load(digest) if spilled else text
+
+    def get(self, timestamp):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT b.hash, b.text, b.spilled FROM events e JOIN blobs b ON b.hash = e.hash WHERE e.ts = ?",
+                (timestamp,)).fetchone()
+        return self._full_text(*row) if row else None
+
+    def get_by_rank(self, rank):
+        if not 0 <= rank < self._count:
+            return None
+        with self._lock:
+            rows = self._event_pager.fetch(
+                self.conn, self._count, rank, 1,
+                "SELECT e.ts, b.hash, b.text, b.spilled FROM events e JOIN blobs b ON b.hash = e.hash "
+                "{where} ORDER BY e.ts DESC LIMIT ? OFFSET ?")
+        return (rows[0][0], self._full_text(*rows[0][1:])) if rows else None
+
+    def slice_by_rank(self, start, count):
+        with self._lock:
+            return self._event_pager.fetch(
+                self.conn, self._count, start, count,
+                "SELECT e.ts, b.text FROM events e JOIN blobs b ON b.hash = e.hash "
+                "{where} ORDER BY e.ts DESC LIMIT ? OFFSET ?")
+
+    def rank_of(self, timestamp):
+        with self._lock:
+            if not self.conn.execute("SELECT 1 FROM events WHERE ts = ?", (timestamp,)).fetchone():
+                return None
+            return self.conn.execute("SELECT COUNT(*) FROM events WHERE ts > ?", (timestamp,)).fetchone()[0]
+
+    def count(self):
+        return self._count
+
+    def has_content(self, text):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash(text),)).fetchone() is not None
+
+    def range_by_time(self, start=None, end=None, limit=None, oldest_first=False):
+        query = ("SELECT e.ts, b.hash, b.text, b.spilled FROM events e JOIN blobs b ON b.hash = e.hash "
+                 f"WHERE e.ts >= ? AND e.ts <= ? ORDER BY e.ts {'ASC' if oldest_first else 'DESC'} LIMIT ?")
+        params = (start or "", end or "\uffff", -1 if limit is None else limit)
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+        # 分批取出，避免一次性把所有行载入内存
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for timestamp, digest, text, spilled in rows:
+                yield timestamp, self._full_text(digest, text, spilled)
+
+    def unique_count(self):
+        return self._unique_count
+
+    def slice_unique(self, start, count):
+        with self._lock:
+            return self._unique_pager.fetch(
+                self.conn, self._unique_count, start, count,
+                "SELECT hash, text, count, first_seen, last_seen FROM blobs "
+                "{where} ORDER BY last_seen DESC LIMIT ? OFFSET ?", key_index=4)
+
+    def pin(self, timestamp, pinned=True):
+        with self._writing():
+            return self.conn.execute("UPDATE events SET pinned = ? WHERE ts = ? AND pinned != ?",
+                                     (int(pinned), timestamp, int(pinned))).rowcount > 0
+
+    def is_pinned(self, timestamp):
+        with self._lock:
+            row = self.conn.execute("SELECT pinned FROM events WHERE ts = ?", (timestamp,)).fetchone()
+        return bool(row and row[0])
+
+    def oldest_unpinned(self, limit):
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT ts FROM events WHERE NOT pinned ORDER BY ts LIMIT ?", (limit,))]
+
+    def total_bytes(self):
+        return self._total_bytes
+
+    def evict(self, timestamps):
+        with self._writing():
+            before, evicted = self._total_bytes, 0
+            for timestamp in timestamps:
+                row = self.conn.execute("SELECT hash FROM events WHERE ts = ?", (timestamp,)).fetchone()
+                if row:
+                    self._unlink_locked(timestamp, row[0])
+                    evicted += 1
+            return evicted, before - self._total_bytes
+
+    def search(self, query, limit=100):
+        with self._lock:
+            digests = self.search_index.search(query, limit)
+            if digests is None:
+                return self.conn.execute(
+                    "SELECT last_seen, text FROM blobs WHERE instr(lower(text), lower(?)) > 0 "
+                    "ORDER BY last_seen DESC LIMIT ?", (query, limit)).fetchall()
+            rows = {}
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                rows.update((row[0], row[1:]) for row in self.conn.execute(
+                    f"SELECT hash, last_seen, text FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk))
+            return [rows[digest] for digest in digests if digest in rows]
+
+    def get_unique_by_rank(self, rank):
+        with self._lock:
+            rows = self._unique_pager.fetch(
+                self.conn, self._unique_count, rank, 1,
+                "SELECT hash, text, count, first_seen, last_seen, spilled FROM blobs "
+                "{where} ORDER BY last_seen DESC LIMIT ? OFFSET ?", key_index=4)
+        if not rows:
+            return None
+        digest, text, occurrences, first_seen, last_seen, spilled = rows[0]
+        return digest, self._full_text(digest, text, spilled), occurrences, first_seen, last_seen
+
+    def close(self):
+        self.spill.close()
+        with self._lock:
+            if self.conn:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
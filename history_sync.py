@@ -0,0 +1,348 @@
+import os
+import re
+import json
+import uuid
+import socket
+import base64
+import logging
+import threading
+
+from history_store import content_hash, to_micros, from_micros
+from history_archive import import_archive
+from clipboard_formats import parse
+from persistence import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+# 每个增量文件最多包含的操作条数，第一次开启同步时已有的历史记录也按这个大小分批发布
+DELTA_MAX_OPS = 1000
+DELTA_SUFFIX = ".ndjson"
+DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+# 时间戳冲突时记录会被顺延几微秒，墓碑覆盖原时间戳前后这个范围内（微秒）内容相同的记录
+TOMBSTONE_WINDOW = 1000
+
+
+def new_device_id():
+    """主机名加随机后缀，共享目录中一眼能看出是哪台机器，同一台机器上的多个实例也不会冲突。"""
+    host = re.sub(r"[^A-Za-z0-9_.-]", "_", socket.gethostname()) or "device"
+    return f"{host}-{uuid.uuid4().hex[:8]}"
+
+
+def delta_path(shared_dir, device_id, seq):
+    return os.path.join(shared_dir, device_id, f"{seq:010d}{DELTA_SUFFIX}")
+
+
+class HistorySync:
+    """通过共享目录（NFS 或网盘同步的目录）在多台机器之间同步历史记录。
+
+    每台机器只追加写自己的目录 <shared_dir>/<设备 ID>/，每批本地变更写成一个新的增量文件
+    <序号>.ndjson，写完后不再修改；其它机器记住每个设备已经应用到的序号，只读取新的文件。
+
+    一条记录由 (时间戳, 内容哈希) 确定，合并是无冲突的：所有机器添加的记录取并集，删除留下
+    永久的墓碑，清空记录留下一个时间点（不晚于它的记录都视为已删除）。墓碑和清空时间点保存在
+    本机的状态文件中，无论各设备的增量文件以什么顺序到达，所有机器最终得到相同的历史记录。
+
+    只同步复制、删除和清空；固定记录和保留策略的淘汰只作用于本机。
+    两台机器在同一微秒复制了不同的内容时，后应用的一条顺延到下一个空闲的时间戳（与导入相同），
+    所以墓碑按内容哈希匹配原时间戳前后 TOMBSTONE_WINDOW 微秒内的记录，顺延过的副本同样会被删除。
+    """
+
+    def __init__(self, store, shared_dir, state_file, interval=5, load_clip=None, put_clip=None, on_synced=None):
+        self.store = store
+        self.shared_dir = shared_dir
+        self.state_file = state_file
+        self.interval = interval
+        self.load_clip = load_clip
+        self.put_clip = put_clip
+        self.on_synced = on_synced
+
+        self.device_id = None
+        self.next_seq = 1
+        self.cursors = {}
+        self.tombstones = set()
+        # 内容哈希 -> 墓碑的时间戳（微秒数），用于按范围匹配
+        self._tombstone_times = {}
+        self.cleared_before = None
+        self.bootstrapped = False
+        self.published = 0
+        self.applied = 0
+
+        # 发件箱和墓碑会被调用方的线程（记录本机变更）和同步线程同时访问
+        self._outbox = []
+        self._lock = threading.Lock()
+        # 本机状态和存储的合并只在一个线程中进行（同步线程，或停止后调用 run_pass 的线程）
+        self._pass_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # 本机状态
+    # ------------------------------------------------------------------
+    def load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            self.device_id = state["device_id"]
+            self.next_seq = state["next_seq"]
+            self.cursors = dict(state["cursors"])
+            self._set_tombstones({tuple(tombstone) for tombstone in state["tombstones"]})
+            self.cleared_before = state["cleared_before"]
+            self.bootstrapped = state["bootstrapped"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # 换一个新的设备 ID 重新发布全部记录，其它机器上的重复会被合并掉
+            logger.warning(f"Ignoring unreadable sync state {self.state_file}: {e}")
+            self.device_id = None
+        if not self.device_id or not DEVICE_ID_PATTERN.match(self.device_id):
+            self.device_id = new_device_id()
+            self.next_seq = 1
+            self.cursors = {}
+            self.bootstrapped = False
+        # 上次写完增量文件后可能没来得及保存状态，跳过已经存在的序号，已发布的文件不会被覆盖
+        while os.path.exists(delta_path(self.shared_dir, self.device_id, self.next_seq)):
+            self.next_seq += 1
+
+    def save_state(self):
+        with self._lock:
+            tombstones = sorted(self.tombstones)
+            cleared_before = self.cleared_before
+        state = {
+            "version": 1,
+            "device_id": self.device_id,
+            "next_seq": self.next_seq,
+            "cursors": self.cursors,
+            "tombstones": tombstones,
+            "cleared_before": cleared_before,
+            "bootstrapped": self.bootstrapped,
+        }
+        atomic_write(self.state_file, json.dumps(state))
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+    def start(self):
+        self.load_state()
+        os.makedirs(os.path.join(self.shared_dir, self.device_id), exist_ok=True)
+        logger.info(f"History sync enabled: device {self.device_id}, shared directory {self.shared_dir}, "
+                    f"every {self.interval}s.")
+        self._thread = threading.Thread(target=self._run, name="history-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程，并把还没有发布的本机变更写到共享目录。"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+            try:
+                self.publish()
+                self.save_state()
+            except Exception as e:
+                logger.error(f"Failed to publish history changes to {self.shared_dir}: {e}")
+
+    def trigger(self):
+        """立即同步一次，不等下一个周期。"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pass()
+            except Exception as e:
+                # 共享目录暂时不可用时本机变更留在发件箱中，下一轮再试
+                logger.error(f"History sync with {self.shared_dir} failed: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def run_pass(self):
+        """发布本机的变更并应用其它设备的新增量文件，返回应用的远程操作条数。
+
+        状态文件每轮只保存一次。两次保存之间崩溃时，已发布的序号在 load_state 中跳过，
+        读游标落后的增量文件会被重新应用，添加、删除和清空都是幂等的，重复应用不会改变结果。
+        """
+        with self._pass_lock:
+            seq, cursors = self.next_seq, dict(self.cursors)
+            try:
+                self.publish()
+                applied = self.pull()
+            finally:
+                if self.next_seq != seq or self.cursors != cursors:
+                    self.save_state()
+        if applied and self.on_synced:
+            self.on_synced(applied)
+        return applied
+
+    # ------------------------------------------------------------------
+    # 本机变更
+    # ------------------------------------------------------------------
+    def record_add(self, timestamp, text):
+        with self._lock:
+            self._outbox.append({"op": "add", "ts": timestamp, "text": text})
+
+    def record_delete(self, timestamp, text):
+        tombstone = (timestamp, content_hash(text))
+        with self._lock:
+            # 本机也记住墓碑，其它设备稍后发布的同一条记录不会再加回来
+            self._add_tombstone(tombstone)
+            self._outbox.append({"op": "del", "ts": timestamp, "digest": tombstone[1]})
+
+    def record_clear(self, timestamp):
+        with self._lock:
+            self._clear_before(timestamp)
+            self._outbox.append({"op": "clear", "ts": timestamp})
+
+    def _clear_before(self, timestamp):
+        if self.cleared_before is None or timestamp > self.cleared_before:
+            self.cleared_before = timestamp
+            # 清空时间点之前的墓碑已经没有用了
+            self._set_tombstones({tombstone for tombstone in self.tombstones if tombstone[0] > timestamp})
+
+    def _set_tombstones(self, tombstones):
+        self.tombstones = set()
+        self._tombstone_times = {}
+        for tombstone in tombstones:
+            self._add_tombstone(tombstone)
+
+    def _add_tombstone(self, tombstone):
+        timestamp, digest = tombstone
+        self.tombstones.add(tombstone)
+        self._tombstone_times.setdefault(digest, set()).add(to_micros(timestamp))
+
+    def publish(self):
+        """把发件箱中的变更写成新的增量文件；第一次同步时先发布本机已有的全部历史记录。"""
+        if not self.bootstrapped:
+            # 逐条读取历史记录，每攒够一个增量文件就写出去，不在内存中保存整份历史记录
+            ops = []
+            count = 0
+            for timestamp, text in self.store.iter_entries():
+                ops.append({"op": "add", "ts": timestamp, "text": text})
+                if len(ops) >= DELTA_MAX_OPS:
+                    self._write_delta(ops)
+                    count += len(ops)
+                    ops = []
+            self._write_delta(ops)
+            count += len(ops)
+            self.bootstrapped = True
+            self.save_state()
+            logger.info(f"Published {count} existing history entries as device {self.device_id}.")
+        with self._lock:
+            ops, self._outbox = self._outbox, []
+        try:
+            while ops:
+                self._write_delta(ops[:DELTA_MAX_OPS])
+                del ops[:DELTA_MAX_OPS]
+        finally:
+            if ops:
+                # 写入失败的变更放回发件箱开头，保持原来的顺序
+                with self._lock:
+                    self._outbox[:0] = ops
+
+    def _write_delta(self, ops):
+        if not ops:
+            return
+        lines = []
+        for op in ops:
+            ref = parse(op["text"]) if op["op"] == "add" else None
+            if ref and self.load_clip:
+                # 图片和 HTML 的正文随记录一起发布，发布时才读取
+                data = self.load_clip(ref)
+                if data is not None:
+                    op = dict(op, data=base64.b64encode(data).decode('ascii'))
+            lines.append(json.dumps(op, ensure_ascii=False) + "\n")
+        # 先写临时文件再改名，其它机器只会看到完整的增量文件
+        atomic_write(delta_path(self.shared_dir, self.device_id, self.next_seq), "".join(lines))
+        self.next_seq += 1
+        self.published += len(ops)
+
+    # ------------------------------------------------------------------
+    # 应用其它设备的变更
+    # ------------------------------------------------------------------
+    def pull(self):
+        applied = 0
+        try:
+            devices = sorted(os.listdir(self.shared_dir))
+        except FileNotFoundError:
+            return 0
+        for device_id in devices:
+            if device_id == self.device_id or not DEVICE_ID_PATTERN.match(device_id):
+                continue
+            seq = self.cursors.get(device_id, 0) + 1
+            # 序号是连续的，下一个文件不存在就说明这个设备暂时没有新的变更
+            while os.path.exists(delta_path(self.shared_dir, device_id, seq)):
+                applied += self._apply_delta(device_id, seq)
+                self.cursors[device_id] = seq
+                seq += 1
+        if applied:
+            self.applied += applied
+            logger.info(f"Applied {applied} history changes from other devices ({self.store.count()} entries).")
+        return applied
+
+    def _apply_delta(self, device_id, seq):
+        path = delta_path(self.shared_dir, device_id, seq)
+        adds, deletes, clears = [], [], []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                try:
+                    op = json.loads(line)
+                    op["ts"] = from_micros(to_micros(op["ts"]))
+                    if op["op"] == "add" and isinstance(op["text"], str):
+                        adds.append(op)
+                    elif op["op"] == "del":
+                        deletes.append((op["ts"], op["digest"]))
+                    elif op["op"] == "clear":
+                        clears.append(op["ts"])
+                    else:
+                        raise ValueError(op["op"])
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    logger.warning(f"Skipping malformed sync operation on line {line_number} of {path}.")
+
+        # 先记下墓碑和清空时间点，同一个文件中先添加后删除的记录不会被加进来
+        with self._lock:
+            for timestamp in clears:
+                self._clear_before(timestamp)
+            for tombstone in deletes:
+                self._add_tombstone(tombstone)
+            records = [op for op in adds if not self._deleted(op["ts"], content_hash(op["text"]))]
+        # 内容在来源设备上已经过敏感内容过滤，这里不再重新扫描，否则墓碑的内容哈希对不上
+        stats = import_archive(self.store, records, put_clip=self.put_clip)
+        removed = 0
+        for timestamp in clears:
+            removed += self._remove_until(timestamp)
+        for timestamp, digest in deletes:
+            removed += self._remove_matching(timestamp, digest)
+        logger.debug(f"Applied delta {seq} from {device_id}: {stats['imported']} added, {removed} removed.")
+        return stats["imported"] + removed
+
+    def _deleted(self, timestamp, digest):
+        if self.cleared_before is not None and timestamp <= self.cleared_before:
+            return True
+        key = to_micros(timestamp)
+        return any(abs(key - tombstone) <= TOMBSTONE_WINDOW for tombstone in self._tombstone_times.get(digest, ()))
+
+    def _remove_matching(self, timestamp, digest):
+        """删除时间戳前后 TOMBSTONE_WINDOW 微秒内内容哈希为 digest 的记录（包括冲突时被顺延的副本）。"""
+        key = to_micros(timestamp)
+        matches = [entry_timestamp for entry_timestamp, text in
+                   self.store.range_by_time(from_micros(key - TOMBSTONE_WINDOW), from_micros(key + TOMBSTONE_WINDOW))
+                   if content_hash(text) == digest]
+        return sum(1 for entry_timestamp in matches if self.store.delete(entry_timestamp))
+
+    def _remove_until(self, timestamp):
+        newest = self.store.get_by_rank(0)
+        if newest is None:
+            return 0
+        if newest[0] <= timestamp:
+            count = self.store.count()
+            self.store.clear()
+            return count
+        timestamps = [entry_timestamp for entry_timestamp, text in self.store.range_by_time(None, timestamp)]
+        return sum(1 for entry_timestamp in timestamps if self.store.delete(entry_timestamp))
+
+    def stats(self):
+        return {"device_id": self.device_id, "published": self.published, "applied": self.applied,
+                "devices": len(self.cursors), "tombstones": len(self.tombstones)}
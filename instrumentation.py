@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """按对数分桶的耗时直方图，记录一次耗时只需要一次二分查找。
+
+    桶的上界从 10 微秒开始每档翻倍，百分位数返回所在桶的上界（不超过最大值）。
+    """
+
+    BOUNDS = tuple(0.00001 * 2 ** i for i in range(23))
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        wanted = p / 100 * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= wanted and bucket:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Instrumentation:
+    """热点路径的耗时统计。
+
+    关闭时 wrap/instrument 直接返回原函数，不会给任何调用增加开销；开启时被包装的函数
+    每次调用都会把耗时记录到同名的直方图中（可以在后台线程中调用）。
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.monotonic()
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def wrap(self, name, func):
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def instrument(self, obj, attribute, name=None):
+        """用计时版本替换 obj 上的方法，之后通过 obj.attribute 的调用都会被计时。"""
+        if self.enabled:
+            setattr(obj, attribute, self.wrap(name or attribute, getattr(obj, attribute)))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def format_table(self):
+        lines = [f"{'name':<32}{'count':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)"]
+        for name, stats in self.snapshot().items():
+            lines.append(f"{name:<32}{stats['count']:>8}{stats['mean_ms']:>9.2f}{stats['p50_ms']:>9.2f}"
+                         f"{stats['p90_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['max_ms']:>9.2f}")
+        return "\n".join(lines)
+
+    def write(self, path, extra=None):
+        data = {
+            "generated": datetime.now().isoformat(),
+            "uptime_seconds": time.monotonic() - self.started,
+            "metrics": self.snapshot(),
+        }
+        data.update(extra or {})
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write metrics file: {e}")
+
+
+class AfterLagProbe:
+    """每隔 interval 毫秒通过 root.after 调度一次自己，记录回调实际执行时比预期晚了多久。
+
+    事件循环被某个回调阻塞时，延迟会直接体现在 tk.after_lag 直方图中。
+    """
+
+    def __init__(self, root, instrumentation, interval=100, name="tk.after_lag"):
+        self.root = root
+        self.instrumentation = instrumentation
+        self.interval = interval
+        self.name = name
+        self._expected = None
+        self._after_id = None
+
+    def start(self):
+        if self.instrumentation.enabled:
+            self._schedule()
+
+    def stop(self):
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval / 1000
+        self._after_id = self.root.after(self.interval, self._fire)
+
+    def _fire(self):
+        self.instrumentation.record(self.name, max(0.0, time.perf_counter() - self._expected))
+        self._schedule()
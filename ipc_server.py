@@ -0,0 +1,184 @@
+import os
+import json
+import signal
+import socket
+import asyncio
+import logging
+
+from clipboard_formats import display_text
+
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryServer:
+    """通过 Unix 域套接字提供历史记录查询接口，协议为 NDJSON：每行一个 JSON 请求，对应一行 JSON 响应。
+
+    请求形如 {"id": 1, "cmd": "search", "query": "foo"}，响应为 {"id": 1, "ok": true, "result": ...}
+    或 {"id": 1, "ok": false, "error": "..."}。同一连接上可以连续发送多个请求，
+    所有连接由同一个 asyncio 事件循环处理，可以同时服务多个客户端。
+    """
+
+    MAX_LINE = 1024 * 1024
+    DEFAULT_COUNT = 50
+    # 一次请求最多返回的条数，避免一个请求把整个历史记录读进内存
+    MAX_COUNT = 1000
+
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.store = engine.history_store
+        self.path = path
+        self.server = None
+        self.clients = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            if self._is_listening():
+                raise OSError(f"Another clipboard monitor is already listening on {self.path}")
+            # 上一次异常退出留下的套接字文件
+            os.remove(self.path)
+        # 历史记录可能包含敏感内容，只允许当前用户连接；套接字文件在 bind 时就以 0600 创建，
+        # 而不是创建之后再 chmod，中间不会有其他用户能连接的窗口
+        umask = os.umask(0o077)
+        try:
+            self.server = await asyncio.start_unix_server(self._handle_client, path=self.path, limit=self.MAX_LINE)
+        finally:
+            os.umask(umask)
+        logger.info(f"Serving clipboard history on {self.path}")
+
+    def _is_listening(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+                return True
+            except OSError:
+                return False
+
+    async def close(self):
+        if not self.server:
+            return
+        self.server.close()
+        # 断开仍然连着的客户端，否则 wait_closed 会一直等待
+        for writer in list(self.clients):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _handle_client(self, reader, writer):
+        self.clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 请求超过 MAX_LINE，无法继续解析这条连接上的后续数据
+                    await self._send(writer, {"id": None, "ok": False, "error": "request too large"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await self._send(writer, self.handle_request(line))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def _send(self, writer, response):
+        writer.write(json.dumps(response).encode('utf-8', 'surrogatepass') + b"\n")
+        await writer.drain()
+
+    def handle_request(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            handler = getattr(self, "cmd_" + str(request.get("cmd")), None)
+            if handler is None:
+                raise ValueError(f"unknown command: {request.get('cmd')}")
+            params = {key: value for key, value in request.items() if key not in ("id", "cmd")}
+            return {"id": request_id, "ok": True, "result": handler(**params)}
+        except (ValueError, TypeError, KeyError) as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Failed to handle IPC request: {e}")
+            return {"id": request_id, "ok": False, "error": "internal error"}
+
+    # ------------------------------------------------------------------
+    # 命令
+    # ------------------------------------------------------------------
+    def cmd_count(self):
+        return {"entries": self.store.count(), "unique": self.store.unique_count()}
+
+    def cmd_stats(self):
+        return {"persistence": self.engine.persistence.stats()}
+
+    def cmd_list(self, start=0, count=DEFAULT_COUNT, unique=False):
+        """按时间倒序列出历史记录的预览；unique 为 true 时列出去重后的内容，最多 MAX_COUNT 条。"""
+        count = min(int(count), self.MAX_COUNT)
+        if unique:
+            return [{"hash": digest, "preview": display_text(preview), "count": occurrences, "first_seen": first_seen, "last_seen": last_seen}
+                    for digest, preview, occurrences, first_seen, last_seen in self.store.slice_unique(int(start), count)]
+        return [{"ts": timestamp, "preview": display_text(preview)} for timestamp, preview in self.store.slice_by_rank(int(start), count)]
+
+    def cmd_get(self, ts=None, rank=None):
+        """按时间戳或排名读取一条记录的完整内容。"""
+        timestamp, text = self._lookup(ts, rank)
+        return {"ts": timestamp, "text": text}
+
+    def cmd_search(self, query, limit=DEFAULT_COUNT):
+        return [{"ts": timestamp, "preview": display_text(preview)} for timestamp, preview in self.store.search(str(query), min(int(limit), self.MAX_COUNT))]
+
+    def cmd_copy(self, ts=None, rank=None):
+        """把一条记录复制回剪切板。"""
+        timestamp, text = self._lookup(ts, rank)
+        self.engine.copy_to_clipboard(text)
+        return {"ts": timestamp, "length": len(text)}
+
+    def _lookup(self, ts, rank):
+        if ts is not None:
+            text = self.store.get(ts)
+            entry = (ts, text) if text is not None else None
+        elif rank is not None:
+            entry = self.store.get_by_rank(int(rank))
+        else:
+            raise ValueError("either ts or rank is required")
+        if entry is None or entry[1] is None:
+            raise ValueError("no such entry")
+        return entry
+
+
+async def serve(engine, socket_path):
+    loop = asyncio.get_running_loop()
+    # 监听线程读到的剪切板内容交给事件循环线程处理，与查询请求在同一线程中串行执行
+    engine.start(threaded_on_change=lambda text: loop.call_soon_threadsafe(engine.handle_clipboard, text))
+    server = HistoryServer(engine, socket_path)
+    try:
+        await server.start()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), engine.history_store.fsync_interval)
+            except asyncio.TimeoutError:
+                # 定期将日志刷到磁盘
+                engine.sync()
+        logger.info("Stopping headless clipboard monitor.")
+    finally:
+        await server.close()
+        engine.stop()
+
+
+def run_headless(engine, socket_path):
+    """无界面模式：只监听剪切板并通过 Unix 域套接字提供查询，直到收到 SIGINT/SIGTERM。"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Headless mode requires Unix domain sockets")
+    asyncio.run(serve(engine, socket_path))
@@ -0,0 +1,95 @@
+import os
+import gzip
+import queue
+import shutil
+import logging
+import logging.handlers
+
+from clipboard_formats import display_text
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 为 False 时日志中不出现剪切板内容，只记录长度
+_log_content = False
+
+
+def loggable(text, limit=50):
+    """日志中代表一段剪切板内容的文本：开启 log_content 时为开头的 limit 个字符，否则只有长度。"""
+    if _log_content:
+        return display_text(text)[:limit]
+    return f"<{len(text)} chars>"
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小轮转的日志文件，轮转出去的旧文件压缩为 <日志>.1.gz、<日志>.2.gz ……"""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+            shutil.copyfileobj(source_file, dest_file)
+        os.remove(source)
+
+
+class LogPipeline:
+    """所有日志先放进内存队列（QueueHandler），由后台线程（QueueListener）写入文件，
+    调用 logging 的线程不会等待磁盘，轮转和压缩也在后台线程中进行。
+
+    创建时就开始接收日志；读取配置之后调用 start(config) 才创建日志文件并开始写入，
+    读取配置期间的日志先留在队列中，不会丢失。
+    """
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.queue = queue.SimpleQueue()
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.file_handler = None
+        self.listener = None
+
+        root = logging.getLogger()
+        # 替换之前的处理器（例如另一个窗口或 basicConfig 留下的），同一条日志不会写两次
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(self.handler)
+        root.setLevel(logging.INFO)
+
+    def start(self, config):
+        """按配置创建日志文件并启动后台写入线程，同时设置日志级别。"""
+        self.file_handler = CompressingRotatingFileHandler(self.log_file, config.get("log_max_bytes", 2 * 1024 * 1024),
+                                                           config.get("log_backup_count", 5))
+        self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+        self.configure(config)
+        self.listener = logging.handlers.QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+        self.listener.start()
+
+    def configure(self, config):
+        """log_level 为全局级别，log_levels 按子系统（模块名，例如 history_store、clipboard_engine）单独设置级别。"""
+        global _log_content
+        _log_content = bool(config.get("log_content", False))
+        logging.getLogger().setLevel(self._level(config.get("log_level", "INFO"), logging.INFO))
+        for name, level in config.get("log_levels", {}).items():
+            logging.getLogger(name).setLevel(self._level(level, logging.NOTSET))
+
+    @staticmethod
+    def _level(name, default):
+        level = logging.getLevelName(str(name).upper())
+        if not isinstance(level, int):
+            logging.getLogger(__name__).warning(f"Unknown log level '{name}', using {logging.getLevelName(default)}.")
+            return default
+        return level
+
+    def stop(self):
+        """写完队列中剩余的日志后停止后台线程。"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+        logging.getLogger().removeHandler(self.handler)
+        if self.file_handler:
+            self.file_handler.close()
@@ -0,0 +1,38 @@
+class MenuChoices:
+    """一组单选的菜单项（例如所有透明度或所有字体大小）。
+
+    记录每个值对应的菜单和位置，切换设置时只修改新旧两项的高亮，不需要重建菜单。
+    item_font(value) 返回该项显示用的字体名称，字体名称菜单中每一项使用自己的字体显示。
+    """
+
+    HIGHLIGHT_COLOR = "lightblue"
+
+    def __init__(self, current, item_font=lambda value: "Arial"):
+        self.current = current
+        self.item_font = item_font
+        self.entries = {}
+        self._sizes = {}
+
+    def add(self, menu, label, value, command):
+        menu.add_command(label=label, command=command)
+        # 菜单项的位置按添加顺序计数（菜单中只有这一组的菜单项）
+        index = self._sizes.get(id(menu), 0)
+        self._sizes[id(menu)] = index + 1
+        self.entries[value] = (menu, index)
+        self._style(value, value == self.current)
+
+    def select(self, value):
+        previous, self.current = self.current, value
+        if previous != value:
+            self._style(previous, False)
+        self._style(value, True)
+
+    def _style(self, value, selected):
+        entry = self.entries.get(value)
+        if entry is None:
+            # 所在的分页还没有展开过，展开时会按 current 设置高亮
+            return
+        menu, index = entry
+        # 背景为空字符串时使用菜单本身的背景色
+        menu.entryconfigure(index, font=(self.item_font(value), 11, "bold" if selected else "normal"),
+                            background=self.HIGHLIGHT_COLOR if selected else "")
@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from instrumentation import LatencyHistogram
+
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path, data, encoding='utf-8'):
+    """先写临时文件并 fsync，再原子地替换目标文件，写到一半崩溃也不会留下被截断的文件。"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding=encoding) as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # 同时刷新目录项，保证重命名本身也已经落盘
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class InstanceLockedError(OSError):
+    pass
+
+
+class InstanceLock:
+    """同一份历史记录同一时间只允许一个进程打开（监控窗口、无界面模式或导入/导出）。
+
+    在锁文件上加非阻塞的排他锁，已经被其他进程持有时 acquire() 抛出 InstanceLockedError；
+    锁由操作系统维护，进程崩溃后自动释放，不会留下需要手动删除的锁。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        file = open(self.path, 'a+', encoding='utf-8')
+        try:
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.seek(0)
+            owner = file.read().strip() or "another process"
+            file.close()
+            raise InstanceLockedError(f"{self.path} is held by process {owner}; close the other clipboard monitor first")
+        # 记下持有者的进程号，只用于提示
+        file.seek(0)
+        file.truncate()
+        file.write(str(os.getpid()))
+        file.flush()
+        self._file = file
+
+    def release(self):
+        if self._file:
+            # 关闭文件即释放锁
+            self._file.close()
+            self._file = None
+
+
+class PersistenceWorker:
+    """后台写盘线程（write-behind）。
+
+    submit(key, write) 只记下 key 需要写盘以及最新的写入函数，立即返回；同一个 key 在
+    coalesce_window 秒内的多次提交合并为一次写入（只执行最后一次提交的 write）。
+    写入在后台线程中按 key 首次提交的顺序执行，失败只记录日志。flush() 等待已提交的写入全部完成。
+    """
+
+    def __init__(self, coalesce_window=0.5):
+        self.coalesce_window = coalesce_window
+        self.latency = LatencyHistogram()
+        self.submitted = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.failures = 0
+
+        self._dirty = {}
+        self._dirty_since = None
+        self._in_flight = 0
+        self._flushing = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """写完所有已提交的内容后停止后台线程。"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # 没有启动过或已经退出时在当前线程中写完剩余内容
+        self._write_batch()
+
+    def submit(self, key, write):
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("persistence worker is stopped")
+            if not self._dirty:
+                self._dirty_since = time.monotonic()
+            if key in self._dirty:
+                self.coalesced += 1
+            self._dirty[key] = write
+            self.submitted += 1
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """不等合并窗口结束，立即写入已提交的内容并等待完成，返回是否在 timeout 内写完。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while self._dirty or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    @property
+    def queue_depth(self):
+        return len(self._dirty) + self._in_flight
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "submitted": self.submitted,
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "write_latency": self.latency.summary(),
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._stopped:
+                    self._condition.wait()
+                # 等到合并窗口结束，期间的提交都合并进这一批
+                while self._dirty and not self._stopped and not self._flushing:
+                    remaining = self._dirty_since + self.coalesce_window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped and not self._dirty:
+                    return
+            self._write_batch()
+
+    def _write_batch(self):
+        with self._condition:
+            batch, self._dirty = self._dirty, {}
+            self._in_flight += len(batch)
+        for key, write in batch.items():
+            start = time.perf_counter()
+            try:
+                write()
+                self.writes += 1
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Failed to persist {key}: {e}")
+            self.latency.record(time.perf_counter() - start)
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """历史记录的保留上限，值为 0 表示不限制。"""
+
+    def __init__(self, max_entries=0, max_bytes=0, max_age_days=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    @property
+    def enabled(self):
+        return bool(self.max_entries or self.max_bytes or self.max_age_days)
+
+    def age_cutoff(self):
+        if not self.max_age_days:
+            return None
+        return (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+
+    def __str__(self):
+        return (f"max_entries={self.max_entries or '-'}, max_bytes={self.max_bytes or '-'}, "
+                f"max_age_days={self.max_age_days or '-'}")
+
+
+class HistoryEvictor:
+    """在后台线程中按保留策略从最旧的未固定记录开始分批淘汰。
+
+    每批只删除 batch_size 条并在批次之间让出锁，避免长时间阻塞界面线程对历史记录的访问。
+    每轮淘汰结束后通过 on_evicted(条数, 释放字节数) 报告结果（在后台线程中调用）。
+    """
+
+    BYTES_STEP = 10
+
+    def __init__(self, store, policy, on_evicted=None, interval=60, batch_size=100, batch_pause=0.05):
+        self.store = store
+        self.policy = policy
+        self.on_evicted = on_evicted
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+
+        self.total_evicted = 0
+        self.total_reclaimed_bytes = 0
+        self.passes = 0
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.policy.enabled:
+            logger.info("History retention is disabled.")
+            return
+        logger.info(f"History retention enabled: {self.policy}")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def trigger(self):
+        """有新记录加入时调用，提前唤醒淘汰线程。"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pass()
+            except Exception as e:
+                logger.error(f"History eviction failed: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def run_pass(self):
+        evicted = reclaimed = 0
+        start = time.monotonic()
+        while not self._stop.is_set():
+            batch = self._select_batch()
+            if not batch:
+                break
+            batch_evicted, batch_reclaimed = self.store.evict(batch)
+            if not batch_evicted:
+                break
+            evicted += batch_evicted
+            reclaimed += batch_reclaimed
+            time.sleep(self.batch_pause)
+
+        if evicted:
+            self.passes += 1
+            self.total_evicted += evicted
+            self.total_reclaimed_bytes += reclaimed
+            logger.info(f"Evicted {evicted} history entries, reclaimed {reclaimed} bytes in "
+                        f"{time.monotonic() - start:.3f}s ({self.store.count()} entries, "
+                        f"{self.store.total_bytes()} bytes left; {self.policy}; "
+                        f"total evicted {self.total_evicted}, reclaimed {self.total_reclaimed_bytes} bytes).")
+            if self.on_evicted:
+                self.on_evicted(evicted, reclaimed)
+        return evicted, reclaimed
+
+    def _select_batch(self):
+        policy = self.policy
+        over_entries = max(0, self.store.count() - policy.max_entries) if policy.max_entries else 0
+        over_bytes = policy.max_bytes and self.store.total_bytes() > policy.max_bytes
+        cutoff = policy.age_cutoff()
+
+        # 只超出字节上限时每批少量淘汰，再重新检查总字节数，避免删掉过多的记录
+        bytes_quota = self.BYTES_STEP if over_bytes else 0
+        batch = []
+        for timestamp in self.store.oldest_unpinned(self.batch_size):
+            # 候选按从旧到新排列
+            if len(batch) < over_entries or (cutoff and timestamp < cutoff):
+                batch.append(timestamp)
+            elif bytes_quota:
+                batch.append(timestamp)
+                bytes_quota -= 1
+            else:
+                break
+        return batch
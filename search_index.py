@@ -0,0 +1,101 @@
+import time
+import logging
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """基于 SQLite FTS5 trigram 分词器的子串索引，按内容哈希索引去重后的内容。
+
+    <prefix>_fts 保存内容的三元组倒排索引，<prefix>_docs 保存哈希和最近出现时间，
+    查询时由 SQLite 求出包含查询串的内容并按最近出现时间倒序返回，不需要逐条扫描。
+    调用方负责加锁和提交事务。少于 MIN_QUERY_CHARS 个字符的查询无法使用三元组，
+    search 返回 None，由调用方退回到逐条扫描。
+    """
+
+    MIN_QUERY_CHARS = 3
+    BUILD_BATCH = 200
+
+    def __init__(self, conn, prefix="search"):
+        self.conn = conn
+        self.docs_table = prefix + "_docs"
+        self.fts_table = prefix + "_fts"
+        self.ready = False
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5(text, tokenize='trigram')")
+        except sqlite3.OperationalError as e:
+            # SQLite 3.34 之前没有 trigram 分词器，或者编译时没有启用 FTS5
+            logger.warning(f"Full-text search index unavailable, falling back to scanning: {e}")
+            self.available = False
+            return
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.docs_table} (id INTEGER PRIMARY KEY, "
+                     f"hash TEXT NOT NULL UNIQUE, last_seen TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.docs_table}_last_seen ON {self.docs_table} (last_seen)")
+        self.available = True
+
+    def add(self, digest, text, last_seen):
+        """索引一条内容；内容已存在时只更新最近出现时间。"""
+        if not self.available:
+            return
+        cursor = self.conn.execute(f"INSERT OR IGNORE INTO {self.docs_table} (hash, last_seen) VALUES (?, ?)",
+                                   (digest, last_seen))
+        if cursor.rowcount:
+            self.conn.execute(f"INSERT INTO {self.fts_table} (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+        else:
+            self.conn.execute(f"UPDATE {self.docs_table} SET last_seen = ? WHERE hash = ?", (last_seen, digest))
+
+    def remove(self, digest):
+        if not self.available:
+            return
+        row = self.conn.execute(f"SELECT id FROM {self.docs_table} WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            self.conn.execute(f"DELETE FROM {self.fts_table} WHERE rowid = ?", row)
+            self.conn.execute(f"DELETE FROM {self.docs_table} WHERE id = ?", row)
+
+    def clear(self):
+        if not self.available:
+            return
+        self.conn.execute(f"DELETE FROM {self.fts_table}")
+        self.conn.execute(f"DELETE FROM {self.docs_table}")
+
+    def count(self):
+        if not self.available:
+            return 0
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.docs_table}").fetchone()[0]
+
+    def build(self, fetch_batch, lock, commit=None):
+        """分批建立索引。
+
+        每批在 lock 内调用 fetch_batch(position, limit)，它返回 ([(hash, text, last_seen), ...], 下一批的位置)，
+        位置为 None 表示已经取完。每批之间释放锁，建索引期间界面线程仍可以读写历史记录；
+        新增/删除的内容由调用方同步更新到索引中，与这里的批量插入互不冲突。
+        """
+        if not self.available:
+            return
+        start = time.monotonic()
+        position, indexed = None, 0
+        while True:
+            with lock:
+                rows, position = fetch_batch(position, self.BUILD_BATCH)
+                for digest, text, last_seen in rows:
+                    self.add(digest, text, last_seen)
+                if commit:
+                    commit()
+            indexed += len(rows)
+            if position is None:
+                break
+        with lock:
+            self.ready = True
+        logger.info(f"Built search index for {indexed} entries in {time.monotonic() - start:.3f}s.")
+
+    def search(self, query, limit=100):
+        """返回包含 query（不区分大小写）的内容哈希，最近出现的在前。"""
+        if not self.available or not self.ready or len(query) < self.MIN_QUERY_CHARS:
+            return None
+        # 整个查询作为一个短语，匹配连续的子串
+        phrase = '"' + query.replace('"', '""') + '"'
+        return [row[0] for row in self.conn.execute(
+            f"SELECT d.hash FROM {self.docs_table} d JOIN {self.fts_table} f ON f.rowid = d.id "
+            f"WHERE {self.fts_table} MATCH ? ORDER BY d.last_seen DESC LIMIT ?", (phrase, limit))]
@@ -0,0 +1,80 @@
+import os
+import time
+import logging
+import threading
+from collections import deque, namedtuple
+
+import psutil
+
+
+logger = logging.getLogger(__name__)
+
+
+Sample = namedtuple("Sample", ["time", "cpu", "memory", "process_cpu", "process_rss"])
+
+
+class SystemSampler:
+    """在后台线程中采样 CPU/内存使用率，结果通过队列交给 Tk 线程显示。
+
+    最近 max(windows) 秒的采样保存在固定大小的环形缓冲区中，可以按窗口统计最小/平均/最大值。
+    """
+
+    WINDOWS = (60, 300, 900)
+
+    def __init__(self, out_queue, interval=1.0, process_stats=False):
+        self.out_queue = out_queue
+        self.interval = interval
+        self.process_stats = process_stats
+        self.samples = deque(maxlen=int(max(self.WINDOWS) / interval) + 1)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._process = psutil.Process(os.getpid()) if process_stats else None
+
+    def start(self):
+        # 第一次调用 cpu_percent(None) 只是建立基准，立即返回
+        psutil.cpu_percent(interval=None)
+        if self._process:
+            self._process.cpu_percent(interval=None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                sample = self._take_sample()
+            except psutil.Error as pe:
+                logger.error(f"Psutil error: {pe}")
+                continue
+            except Exception as e:
+                logger.error(f"Failed to get system info: {e}")
+                continue
+            with self._lock:
+                self.samples.append(sample)
+            self.out_queue.put(sample)
+
+    def _take_sample(self):
+        process_cpu = process_rss = None
+        if self._process:
+            with self._process.oneshot():
+                process_cpu = self._process.cpu_percent(interval=None)
+                process_rss = self._process.memory_info().rss
+        return Sample(time.monotonic(), psutil.cpu_percent(interval=None),
+                      psutil.virtual_memory().percent, process_cpu, process_rss)
+
+    def stats(self, field="cpu"):
+        """返回 {窗口秒数: (min, avg, max)}，窗口内没有采样时对应值为 None。"""
+        with self._lock:
+            samples = list(self.samples)
+        now = time.monotonic()
+        result = {}
+        for window in self.WINDOWS:
+            values = [getattr(sample, field) for sample in reversed(samples) if now - sample.time <= window]
+            values = [value for value in values if value is not None]
+            result[window] = (min(values), sum(values) / len(values), max(values)) if values else None
+        return result
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+
+# 测试直接导入仓库根目录下的模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+# 依赖 tkinter 的模块，换成替身之后需要重新导入
+TK_MODULES = ("tkinter", "tkinter.font", "tkinter.messagebox", "tkinter.colorchooser", "virtual_listbox", "clipboard_monitor")
+
+
+@pytest.fixture
+def fake_tk():
+    """把 tkinter 换成 benchmarks/fake_tk 中不需要显示器的替身，测试结束后恢复。"""
+    import fake_tk as fake
+    saved = {name: sys.modules.pop(name) for name in TK_MODULES if name in sys.modules}
+    tk = fake.install()
+    try:
+        yield tk
+    finally:
+        for name in TK_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
@@ -0,0 +1,103 @@
+"""XclipReader 在所有者不支持 TIMESTAMP 时按 TARGETS 和所有者缓存轮询结果，外部命令读取方式在后台线程中轮询。"""
+import subprocess
+
+import pyperclip
+import pytest
+
+import clipboard_formats
+from clipboard_formats import ClipboardData, XclipReader
+
+
+class FakeXclip(XclipReader):
+    """用字典代替 xclip：clipboard 为 {目标: 字节}，没有 TIMESTAMP 时读取它会失败。"""
+
+    def __init__(self, owner):
+        super().__init__(owner=lambda: owner["window"])
+        self.clipboard = {}
+        self.commands = []
+
+    def _run(self, command):
+        target = command[command.index("-t") + 1]
+        self.commands.append(target)
+        if target == "TARGETS":
+            return "\n".join(self.clipboard).encode()
+        if target not in self.clipboard:
+            raise subprocess.CalledProcessError(1, command)
+        return self.clipboard[target]
+
+
+@pytest.fixture
+def xclip(monkeypatch):
+    owner = {"window": 0x400001}
+    reader = FakeXclip(owner)
+    text = {"value": ""}
+    monkeypatch.setattr(pyperclip, "paste", lambda: text["value"])
+    return reader, owner, text
+
+
+def test_poll_skips_image_read_while_targets_and_owner_are_unchanged(xclip):
+    reader, owner, text = xclip
+    reader.clipboard = {"TARGETS": b"", "image/png": b"first"}
+    assert reader.poll() == ClipboardData("image/png", b"first", "")
+    reader.commands.clear()
+    assert reader.poll() == ClipboardData("image/png", b"first", "")
+    assert "image/png" not in reader.commands
+
+    # 另一个程序取得了剪切板
+    reader.clipboard["image/png"] = b"second"
+    owner["window"] = 0x600001
+    assert reader.poll() == ClipboardData("image/png", b"second", "")
+
+    # 同一个程序复制了带纯文本的 HTML，纯文本不同，重新读取
+    reader.clipboard = {"TARGETS": b"", "text/html": b"<b>a</b>"}
+    text["value"] = "a"
+    assert reader.poll() == ClipboardData("text/html", b"<b>a</b>", "a")
+    reader.clipboard["text/html"] = b"<b>b</b>"
+    text["value"] = "b"
+    assert reader.poll() == ClipboardData("text/html", b"<b>b</b>", "b")
+
+
+def test_read_always_reads_and_plain_text_is_never_cached(xclip):
+    reader, owner, text = xclip
+    reader.clipboard = {"TARGETS": b"", "image/png": b"first"}
+    reader.poll()
+    # XFixes 监听器只在剪切板易主时调用 read()，同一个所有者复制的新图片也要读到
+    reader.clipboard["image/png"] = b"second"
+    assert reader.read() == ClipboardData("image/png", b"second", "")
+
+    reader.clipboard = {"TARGETS": b"", "UTF8_STRING": b""}
+    text["value"] = "one"
+    assert reader.poll() == "one"
+    text["value"] = "two"
+    assert reader.poll() == "two"
+
+
+def test_timestamp_still_short_circuits(xclip):
+    reader, owner, text = xclip
+    reader.clipboard = {"TARGETS": b"", "TIMESTAMP": b"100", "image/png": b"first"}
+    reader.read()
+    reader.commands.clear()
+    assert reader.poll() == ClipboardData("image/png", b"first", "")
+    assert reader.commands == ["TIMESTAMP"]
+
+
+def test_command_readers_poll_in_a_background_thread(monkeypatch):
+    import clipboard_engine
+    calls = {}
+
+    def fake_create(root, on_change, threaded_on_change, backend="auto", interval=500, fetch=None, poll=None):
+        calls.update(root=root, fetch=fetch, poll=poll)
+
+    monkeypatch.setattr(clipboard_engine, "create_clipboard_watcher", fake_create)
+    engine = clipboard_engine.ClipboardEngine.__new__(clipboard_engine.ClipboardEngine)
+    engine.config = {"clipboard_watcher_backend": "polling"}
+    engine.handle_clipboard = lambda content: None
+
+    engine.clipboard_reader = clipboard_formats.PyperclipReader()
+    engine.start(root="tk root")
+    assert calls["root"] == "tk root"
+
+    engine.clipboard_reader = XclipReader(owner=lambda: None)
+    engine.start(root="tk root")
+    assert calls["root"] is None
+    assert calls["poll"] == engine.clipboard_reader.poll
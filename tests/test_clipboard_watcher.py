@@ -0,0 +1,268 @@
+"""剪切板监听器的测试：XFixes 监听器在 Xvfb 中运行，用 xclip 充当选区所有者；没有 XFixes 时退回到轮询。
+
+需要 Xvfb 和 xclip 的测试在它们不存在时跳过。
+"""
+import os
+import queue
+import ctypes.util
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+import clipboard_watcher
+from clipboard_watcher import (PollingClipboardWatcher, SelectionOwner, ThreadedPollingClipboardWatcher,
+                               XFixesClipboardWatcher, create_clipboard_watcher)
+
+
+needs_xvfb = pytest.mark.skipif(not (shutil.which("Xvfb") and shutil.which("xclip")), reason="Xvfb and xclip are required")
+needs_xlib = pytest.mark.skipif(not (ctypes.util.find_library("X11") and ctypes.util.find_library("Xfixes")),
+                                reason="libX11 and libXfixes are required")
+# 没有 X 服务器监听的显示名
+MISSING_DISPLAY = ":8791"
+
+
+def start_xvfb(*extra_args):
+    """启动一个 Xvfb，由它自己选择空闲的显示编号，返回 (进程, 显示名)。"""
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp", *extra_args],
+                               pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        number = pipe.readline().strip()
+    if not number:
+        process.kill()
+        process.wait()
+        pytest.skip("Xvfb failed to start")
+    return process, f":{number}"
+
+
+@pytest.fixture
+def xvfb():
+    process, display = start_xvfb()
+    yield display
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def xvfb_without_xfixes():
+    process, display = start_xvfb("-extension", "XFIXES")
+    yield display
+    process.terminate()
+    process.wait()
+
+
+def set_clipboard(display, text):
+    # xclip 在后台保持 CLIPBOARD 的所有权并提供内容，直到另一个 xclip 取得所有权
+    subprocess.run(["xclip", "-selection", "clipboard", "-i"], input=text.encode(), env=dict(os.environ, DISPLAY=display),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=5)
+
+
+def read_clipboard(display):
+    result = subprocess.run(["xclip", "-selection", "clipboard", "-o"], env=dict(os.environ, DISPLAY=display),
+                            capture_output=True, timeout=5)
+    return result.stdout.decode()
+
+
+def assert_no_more(changes, wait=1.0):
+    time.sleep(wait)
+    assert changes.empty(), f"unexpected extra callbacks: {list(changes.queue)}"
+
+
+@needs_xvfb
+def test_xfixes_reports_each_owner_change_once(xvfb):
+    changes = queue.Queue()
+    watcher = XFixesClipboardWatcher(changes.put, fetch=lambda: read_clipboard(xvfb), display_name=xvfb)
+    watcher.start()
+    try:
+        # 启动时读取一次当前内容，还没有所有者时为空
+        assert changes.get(timeout=5) == ""
+        for text in ("first", "second", "second"):
+            set_clipboard(xvfb, text)
+            # 每次易主只回调一次，内容相同也会回调（是否记录由调用方判断）
+            assert changes.get(timeout=5) == text
+        assert_no_more(changes)
+    finally:
+        watcher.stop()
+    assert not watcher._thread.is_alive()
+
+
+@needs_xvfb
+def test_create_prefers_xfixes(xvfb, monkeypatch):
+    monkeypatch.setenv("DISPLAY", xvfb)
+    changes = queue.Queue()
+    watcher = create_clipboard_watcher(None, changes.put, changes.put, fetch=lambda: read_clipboard(xvfb))
+    try:
+        assert isinstance(watcher, XFixesClipboardWatcher)
+        assert changes.get(timeout=5) == ""
+        set_clipboard(xvfb, "hello")
+        assert changes.get(timeout=5) == "hello"
+    finally:
+        watcher.stop()
+
+
+@needs_xvfb
+def test_create_falls_back_to_polling_without_xfixes_extension(xvfb_without_xfixes, monkeypatch):
+    display = xvfb_without_xfixes
+    monkeypatch.setenv("DISPLAY", display)
+    changes = queue.Queue()
+    watcher = create_clipboard_watcher(None, changes.put, changes.put, interval=50, fetch=lambda: read_clipboard(display))
+    try:
+        assert isinstance(watcher, ThreadedPollingClipboardWatcher)
+        assert changes.get(timeout=5) == ""
+        set_clipboard(display, "polled")
+        assert changes.get(timeout=5) == "polled"
+        assert_no_more(changes, wait=0.3)
+    finally:
+        watcher.stop()
+
+
+@needs_xlib
+def test_xfixes_start_fails_cleanly_without_x_server():
+    # 函数原型可以加载，连接不上显示器时抛出 OSError 而不是崩溃
+    watcher = XFixesClipboardWatcher(lambda text: None, display_name=MISSING_DISPLAY)
+    with pytest.raises(OSError, match="Cannot open X display"):
+        watcher.start()
+    assert watcher._thread is None
+
+
+@needs_xlib
+def test_create_falls_back_to_polling_without_x_server(monkeypatch):
+    monkeypatch.setattr(clipboard_watcher.sys, "platform", "linux")
+    monkeypatch.setenv("DISPLAY", MISSING_DISPLAY)
+    changes = queue.Queue()
+    watcher = create_clipboard_watcher(None, changes.put, changes.put, interval=10, fetch=lambda: "text")
+    try:
+        assert isinstance(watcher, ThreadedPollingClipboardWatcher)
+        assert changes.get(timeout=2) == "text"
+        assert_no_more(changes, wait=0.1)
+    finally:
+        watcher.stop()
+
+
+@needs_xlib
+def test_selection_owner_without_x_server():
+    owner = SelectionOwner(display_name=MISSING_DISPLAY)
+    assert owner() is None
+    # 打开失败后不再反复尝试
+    assert owner() is None
+    owner.close()
+
+
+@needs_xvfb
+def test_selection_owner_changes_with_clipboard_owner(xvfb):
+    owner = SelectionOwner(display_name=xvfb)
+
+    def wait_for_owner(previous):
+        # xclip 转到后台之后才取得所有权
+        deadline = time.monotonic() + 5
+        while owner() in (0, previous) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return owner()
+
+    try:
+        assert owner() == 0
+        set_clipboard(xvfb, "first")
+        first = wait_for_owner(0)
+        assert first
+        set_clipboard(xvfb, "second")
+        assert wait_for_owner(first) not in (0, first)
+    finally:
+        owner.close()
+
+
+class SequenceClipboard:
+    """依次返回设置的内容，模拟剪切板。"""
+
+    def __init__(self):
+        self.text = ""
+        self.lock = threading.Lock()
+
+    def set(self, text):
+        with self.lock:
+            self.text = text
+
+    def read(self):
+        with self.lock:
+            return self.text
+
+
+def unavailable_xfixes(monkeypatch):
+    def fail():
+        raise OSError("libX11 or libXfixes not found")
+    monkeypatch.setattr(XFixesClipboardWatcher, "_load_libraries", staticmethod(fail))
+    monkeypatch.setattr(clipboard_watcher.sys, "platform", "linux")
+    monkeypatch.setenv("DISPLAY", ":99")
+
+
+def test_threaded_polling_fallback_reports_each_change_once(monkeypatch):
+    unavailable_xfixes(monkeypatch)
+    clipboard = SequenceClipboard()
+    changes = queue.Queue()
+    watcher = create_clipboard_watcher(None, changes.put, changes.put, interval=10, fetch=clipboard.read)
+    try:
+        assert isinstance(watcher, ThreadedPollingClipboardWatcher)
+        assert changes.get(timeout=2) == ""
+        for text in ("a", "b", "a"):
+            clipboard.set(text)
+            assert changes.get(timeout=2) == text
+        assert_no_more(changes, wait=0.1)
+    finally:
+        watcher.stop()
+
+
+class FakeRoot:
+    """只记录 after() 的回调，由测试手动执行。"""
+
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+
+    def after(self, delay, callback):
+        self.next_id += 1
+        self.pending[self.next_id] = callback
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def run_pending(self):
+        callbacks, self.pending = list(self.pending.values()), {}
+        for callback in callbacks:
+            callback()
+
+
+def test_tk_polling_fallback_reports_each_change_once(monkeypatch):
+    unavailable_xfixes(monkeypatch)
+    clipboard = SequenceClipboard()
+    root = FakeRoot()
+    changes = []
+    watcher = create_clipboard_watcher(root, changes.append, None, fetch=clipboard.read)
+    assert isinstance(watcher, PollingClipboardWatcher)
+    for text in ("x", "x", "y"):
+        clipboard.set(text)
+        root.run_pending()
+    assert changes == ["", "x", "y"]
+    watcher.stop()
+    assert not root.pending
+
+
+def test_polling_survives_read_errors():
+    root = FakeRoot()
+    changes = []
+    results = iter([RuntimeError("clipboard busy"), "ok"])
+
+    def fetch():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    watcher = PollingClipboardWatcher(root, changes.append, fetch=fetch)
+    watcher.start()
+    root.run_pending()
+    assert changes == ["ok"]
+    watcher.stop()
@@ -0,0 +1,155 @@
+"""历史记录存储：重复内容的首次/最近出现时间，写操作不在调用方的线程中提交或 fsync，SQLite 的键集分页。"""
+import os
+import random
+import sqlite3
+
+import pytest
+
+from history_store import HistoryStore, JsonHistoryStore, SqliteHistoryStore, from_micros
+
+
+def expected_unique(entries):
+    unique = {}
+    for timestamp, text in sorted(entries.items()):
+        count, first_seen, last_seen = unique.get(text, (0, timestamp, timestamp))
+        unique[text] = (count + 1, first_seen, timestamp)
+    return sorted(((text, count, first_seen, last_seen) for text, (count, first_seen, last_seen) in unique.items()),
+                  key=lambda row: row[3], reverse=True)
+
+
+def actual_unique(store):
+    return [(text, count, first_seen, last_seen)
+            for digest, text, count, first_seen, last_seen in store.slice_unique(0, store.unique_count())]
+
+
+def test_first_and_last_seen_follow_inserts_and_deletes(tmp_path):
+    store = JsonHistoryStore(str(tmp_path / "clipboard_history.json"))
+    store.load()
+    rng = random.Random(7)
+    entries = {}
+    for step in range(2000):
+        if entries and rng.random() < 0.4:
+            # 删除时偏向最早和最近的一次出现，这两种情况需要更新首次/最近出现时间
+            timestamp = rng.choice([min(entries), max(entries), rng.choice(list(entries))])
+            assert store.delete(timestamp)
+            del entries[timestamp]
+        else:
+            timestamp = from_micros(rng.randrange(10 ** 6))
+            text = f"text {rng.randrange(20)}"
+            store.insert(timestamp, text)
+            entries[timestamp] = text
+        if step % 100 == 0:
+            assert actual_unique(store) == expected_unique(entries)
+    assert actual_unique(store) == expected_unique(entries)
+    store.close()
+
+    reloaded = JsonHistoryStore(str(tmp_path / "clipboard_history.json"))
+    reloaded.load()
+    assert actual_unique(reloaded) == expected_unique(entries)
+    # 重新加载后建立的出现时间数组同样可以继续删除
+    for timestamp in sorted(entries)[:50]:
+        assert reloaded.delete(timestamp)
+        del entries[timestamp]
+    assert actual_unique(reloaded) == expected_unique(entries)
+    reloaded.close()
+
+
+def committed_timestamps(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return [row[0] for row in conn.execute("SELECT ts FROM events ORDER BY ts")]
+    finally:
+        conn.close()
+
+
+def test_sqlite_writes_wait_for_sync(tmp_path):
+    db_file = str(tmp_path / "clipboard_history.db")
+    store = SqliteHistoryStore(db_file)
+    store.load()
+    store.auto_sync = False
+    store.insert("2024-01-01T00:00:00", "one")
+    store.pin("2024-01-01T00:00:00")
+    # 同一个连接上已经可以查到，其它连接要等 sync() 提交后才看得到
+    assert store.get("2024-01-01T00:00:00") == "one" and store.is_pinned("2024-01-01T00:00:00")
+    assert committed_timestamps(db_file) == []
+
+    # 失败的写操作只回滚自己，之前还没提交的修改保留
+    with pytest.raises(AttributeError):
+        store.insert_many([("2024-01-01T00:00:01", "two"), ("2024-01-01T00:00:02", None)])
+    assert store.count() == 1
+    store.sync()
+    assert committed_timestamps(db_file) == ["2024-01-01T00:00:00"]
+
+    store.delete("2024-01-01T00:00:00")
+    store.insert("2024-01-01T00:00:03", "three")
+    store.close()
+    assert committed_timestamps(db_file) == ["2024-01-01T00:00:03"]
+
+
+def test_json_clear_compacts_in_sync(tmp_path):
+    store = JsonHistoryStore(str(tmp_path / "clipboard_history.json"))
+    store.load()
+    store.auto_sync = False
+    store.insert("2024-01-01T00:00:00", "one")
+    store.sync()
+    store.clear()
+    # 清空只追加一条日志，压缩和 fsync 留给后台线程调用的 sync()
+    assert not os.path.exists(store.rotated_journal_file)
+    assert store.count() == 0
+    store.sync()
+    store.compact(wait=True)
+    with open(store.journal_file, encoding='utf-8') as file:
+        assert file.read() == ""
+    store.close()
+
+    reloaded = JsonHistoryStore(str(tmp_path / "clipboard_history.json"))
+    reloaded.load()
+    assert reloaded.count() == 0
+    reloaded.close()
+
+
+def test_history_store_is_abstract():
+    with pytest.raises(TypeError):
+        HistoryStore()
+
+
+def test_sqlite_keyset_paging_matches_offset(tmp_path):
+    store = SqliteHistoryStore(str(tmp_path / "clipboard_history.db"))
+    store.load()
+    rng = random.Random(11)
+    for index in range(500):
+        store.insert(from_micros(rng.randrange(10 ** 9)), f"text {rng.randrange(150)}")
+
+    def expected_page(start, count):
+        return store.conn.execute("SELECT e.ts, b.text FROM events e JOIN blobs b ON b.hash = e.hash "
+                                  "ORDER BY e.ts DESC LIMIT ? OFFSET ?", (count, max(0, start))).fetchall()
+
+    def expected_unique(start, count):
+        return store.conn.execute("SELECT hash, text, count, first_seen, last_seen FROM blobs "
+                                  "ORDER BY last_seen DESC LIMIT ? OFFSET ?", (count, max(0, start))).fetchall()
+
+    start = 0
+    for step in range(400):
+        action = rng.random()
+        if action < 0.1:
+            store.insert(from_micros(rng.randrange(10 ** 9)), f"text {rng.randrange(150)}")
+        elif action < 0.2 and store.count():
+            store.delete(store.get_by_rank(rng.randrange(store.count()))[0])
+        # 像列表滚动一样：多数是相邻的翻页，偶尔拖动滚动条跳到任意位置或末尾
+        move = rng.random()
+        if move < 0.4:
+            start += 20
+        elif move < 0.7:
+            start -= rng.randrange(1, 25)
+        elif move < 0.85:
+            start = rng.randrange(store.count() + 5)
+        else:
+            start = store.count() - rng.randrange(1, 30)
+        start = max(0, start)
+        assert store.slice_by_rank(start, 20) == expected_page(start, 20)
+        rank = rng.randrange(store.count())
+        assert store.get_by_rank(rank) == tuple(expected_page(rank, 1)[0])
+        unique_start = rng.randrange(store.unique_count())
+        assert store.slice_unique(unique_start, 10) == expected_unique(unique_start, 10)
+        assert store.get_unique_by_rank(unique_start)[4] == expected_unique(unique_start, 1)[0][4]
+    store.close()
@@ -0,0 +1,168 @@
+"""两个实例通过同一个临时共享目录同步：添加、删除、清空双向传播，增量文件乱序到达，崩溃后重放状态文件。"""
+import os
+import shutil
+
+import pytest
+
+from history_store import open_history_store
+from history_sync import HistorySync, delta_path
+
+
+class Node:
+    """一台机器：自己的历史记录存储，加上按 ClipboardEngine 的方式记录本机变更的 HistorySync。"""
+
+    def __init__(self, directory, shared_dir, backend):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shared_dir = shared_dir
+        self.store = open_history_store(backend, os.path.join(directory, "clipboard_history"))
+        self.sync = self.restart()
+
+    def restart(self):
+        self.sync = HistorySync(self.store, self.shared_dir, os.path.join(self.directory, "clipboard_history.sync.json"))
+        self.sync.load_state()
+        os.makedirs(os.path.join(self.shared_dir, self.sync.device_id), exist_ok=True)
+        return self.sync
+
+    def add(self, timestamp, text):
+        self.store.insert(timestamp, text)
+        self.sync.record_add(timestamp, text)
+
+    def delete(self, text):
+        for timestamp, entry_text in list(self.store.iter_entries()):
+            if entry_text == text:
+                self.store.delete(timestamp)
+                self.sync.record_delete(timestamp, text)
+
+    def clear(self, timestamp):
+        self.store.clear()
+        self.sync.record_clear(timestamp)
+
+    def texts(self):
+        return sorted(text for timestamp, text in self.store.iter_entries())
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def nodes(request, tmp_path):
+    shared_dir = str(tmp_path / "shared")
+    os.makedirs(shared_dir)
+    created = [Node(str(tmp_path / name), shared_dir, request.param) for name in ("a", "b", "c")]
+    yield created
+    for node in created:
+        node.store.close()
+
+
+def sync_all(*nodes):
+    for node in nodes + nodes:
+        node.sync.run_pass()
+
+
+def hide(node, seq, tmp_path):
+    """模拟网盘还没有把这个增量文件同步过来。"""
+    path = delta_path(node.shared_dir, node.sync.device_id, seq)
+    hidden = str(tmp_path / f"hidden-{node.sync.device_id}-{seq}")
+    shutil.move(path, hidden)
+    return lambda: shutil.move(hidden, path)
+
+
+def test_add_delete_and_clear_in_both_directions(nodes):
+    a, b, c = nodes
+    a.add("2024-01-01T10:00:00", "from a")
+    b.add("2024-01-01T11:00:00", "from b")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["from a", "from b"]
+
+    b.delete("from a")
+    a.delete("from b")
+    a.add("2024-01-01T12:00:00", "kept")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["kept"]
+
+    b.clear("2024-01-02T00:00:00")
+    b.add("2024-01-03T00:00:00", "b after clear")
+    # a 在清空之前复制、还没有发布的记录同样被清掉，之后的记录保留
+    a.add("2024-01-01T13:00:00", "a before clear")
+    a.add("2024-01-04T00:00:00", "a after clear")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["a after clear", "b after clear"]
+
+    a.clear("2024-01-05T00:00:00")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == []
+
+
+def test_colliding_adds_are_deleted_everywhere(nodes):
+    a, b, c = nodes
+    # 同一微秒复制了不同的内容，后应用的一条被顺延
+    a.add("2024-01-01T00:00:00", "x")
+    b.add("2024-01-01T00:00:00", "y")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["x", "y"]
+    b.delete("x")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["y"]
+    assert len(list(a.store.iter_entries())) == len(list(b.store.iter_entries())) == 1
+
+
+def test_out_of_order_delta_files(nodes, tmp_path):
+    a, b, c = nodes
+    c.add("2024-01-01T10:00:00", "shared")
+    c.sync.run_pass()
+    a.sync.run_pass()
+    a.delete("shared")
+    a.add("2024-01-01T11:00:00", "a first")
+    a.sync.run_pass()
+    a.add("2024-01-01T12:00:00", "a second")
+    a.sync.run_pass()
+
+    # b 先看到 a 的删除，再看到 c 添加的那条记录：墓碑保证它不会被加回来
+    restore_c = hide(c, 1, tmp_path)
+    # a 的第二个增量文件先于第一个到达：序号不连续时等前面的文件到达再应用
+    restore_a = hide(a, 1, tmp_path)
+    b.sync.run_pass()
+    assert b.texts() == []
+    restore_a()
+    b.sync.run_pass()
+    assert b.texts() == ["a first", "a second"]
+    restore_c()
+    b.sync.run_pass()
+    assert b.texts() == ["a first", "a second"]
+
+    sync_all(a, b, c)
+    assert a.texts() == b.texts() == c.texts() == ["a first", "a second"]
+
+
+def test_replaying_old_state_after_crash(nodes):
+    a, b, c = nodes
+    a.add("2024-01-01T10:00:00", "one")
+    a.add("2024-01-01T11:00:00", "two")
+    sync_all(a, b)
+    state_file = b.sync.state_file
+    with open(state_file, 'rb') as file:
+        old_state = file.read()
+
+    a.delete("one")
+    a.add("2024-01-01T12:00:00", "three")
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["three", "two"]
+
+    # 崩溃前没来得及保存状态：b 回到旧的读游标，已经应用过的增量文件再应用一遍
+    with open(state_file, 'wb') as file:
+        file.write(old_state)
+    b.restart()
+    b.sync.run_pass()
+    assert b.texts() == ["three", "two"]
+
+    # 写完增量文件、保存状态之前崩溃：重启后跳过已经存在的序号，不覆盖已发布的文件
+    b.add("2024-01-01T13:00:00", "four")
+    b.sync.publish()
+    published = delta_path(b.shared_dir, b.sync.device_id, b.sync.next_seq - 1)
+    with open(published, encoding='utf-8') as file:
+        content = file.read()
+    b.restart()
+    b.add("2024-01-01T14:00:00", "five")
+    b.sync.run_pass()
+    with open(published, encoding='utf-8') as file:
+        assert file.read() == content
+    sync_all(a, b)
+    assert a.texts() == b.texts() == ["five", "four", "three", "two"]
@@ -0,0 +1,53 @@
+"""无界面查询接口：套接字文件创建时就只有当前用户可以访问，一次请求返回的条数有上限。"""
+import asyncio
+import json
+import os
+import stat
+import types
+
+import pytest
+
+from history_store import JsonHistoryStore
+from ipc_server import HistoryServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    store = JsonHistoryStore(str(tmp_path / "clipboard_history.json"))
+    store.load()
+    store.auto_sync = False
+    server = HistoryServer(types.SimpleNamespace(history_store=store), str(tmp_path / "clipboard_monitor.sock"))
+    yield server
+    store.close()
+
+
+def test_socket_is_created_private(server, monkeypatch):
+    created = {}
+    start_unix_server = asyncio.start_unix_server
+
+    async def recording_start(*args, **kwargs):
+        result = await start_unix_server(*args, **kwargs)
+        # bind 之后、start() 返回之前的权限
+        created["mode"] = stat.S_IMODE(os.stat(server.path).st_mode)
+        return result
+
+    monkeypatch.setattr(asyncio, "start_unix_server", recording_start)
+    umask = os.umask(0o022)
+    try:
+        async def run():
+            await server.start()
+            await server.close()
+        asyncio.run(run())
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    assert created["mode"] & 0o077 == 0
+
+
+def test_list_count_is_capped(server):
+    for index in range(HistoryServer.MAX_COUNT + 5):
+        server.store.insert(f"2024-01-01T00:00:00.{index:06d}", f"entry {index}")
+    response = server.handle_request(json.dumps({"id": 1, "cmd": "list", "count": 10 ** 9}))
+    assert response["ok"] and len(response["result"]) == HistoryServer.MAX_COUNT
+    response = server.handle_request(json.dumps({"id": 2, "cmd": "search", "query": "entry", "limit": 10 ** 9}))
+    assert response["ok"] and len(response["result"]) == HistoryServer.MAX_COUNT
@@ -0,0 +1,134 @@
+"""VirtualListbox 的选中状态，管理窗口在后台同步/淘汰之后删除的是用户选中的条目，删除后不再显示缓存的预览。"""
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class Click:
+    def __init__(self, row):
+        # fake_tk 的 Listbox.nearest 按每行 10 像素换算
+        self.y = row * 10
+
+
+def make_listbox(rows, keyed=False):
+    from virtual_listbox import VirtualListbox
+    data = list(rows)
+
+    def fetch(start, count):
+        items = data[start:start + count]
+        return [(row, f"row {row}") for row in items] if keyed else [f"row {row}" for row in items]
+
+    listbox = VirtualListbox(None, lambda: len(data), fetch, selectmode="multiple", keyed=keyed, height=5)
+    return listbox, data
+
+
+def test_refresh_clears_selection(fake_tk):
+    listbox, data = make_listbox(range(10))
+    listbox._on_click(Click(1))
+    listbox._on_click(Click(3))
+    assert listbox.curselection() == (1, 3)
+    # 数据源在任意位置插入了一行，原来的行号已经对应别的条目
+    data.insert(0, "new")
+    listbox.refresh()
+    assert listbox.curselection() == ()
+    assert listbox.listbox.selected == set()
+
+
+def test_insert_and_delete_rows_shift_selection(fake_tk):
+    listbox, data = make_listbox(range(10), keyed=True)
+    listbox._on_click(Click(2))
+    data.insert(0, "new")
+    listbox.insert_rows(0)
+    assert listbox.curselection() == (3,)
+    assert listbox.selected_keys() == [2]
+    del data[0]
+    listbox.delete_rows([0])
+    assert listbox.curselection() == (2,)
+    assert listbox.selected_keys() == [2]
+
+
+def test_keyed_selection_remembers_displayed_rows(fake_tk):
+    listbox, data = make_listbox(range(10), keyed=True)
+    listbox._on_click(Click(0))
+    listbox.anchor = 0
+    listbox._on_shift_click(Click(2))
+    # 数据源在后台变化，显示还没有刷新：键仍是用户看到的那几行
+    data[:0] = ["a", "b"]
+    assert listbox.curselection() == (0, 1, 2)
+    assert listbox.selected_keys() == [0, 1, 2]
+
+
+@pytest.fixture
+def monitor(fake_tk, tmp_path, monkeypatch):
+    import pyperclip
+    monkeypatch.setattr(pyperclip, "paste", lambda: "")
+    monkeypatch.setattr(pyperclip, "copy", lambda text: None)
+    (tmp_path / "config.json").write_text(json.dumps({"clipboard_reader_backend": "pyperclip", "content_filter_enabled": False}))
+    import clipboard_monitor
+    app = clipboard_monitor.ClipboardMonitor(fake_tk.Tk(), data_dir=str(tmp_path))
+    deadline = time.monotonic() + 10
+    while not app.history_ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+        app.process_ui_queue()
+    assert app.history_ready
+    yield app
+    app.on_close()
+
+
+def test_delete_after_background_insert_removes_the_selected_entry(monitor):
+    store = monitor.history_store
+    base = datetime(2024, 1, 1)
+    for offset in range(5):
+        store.insert((base + timedelta(seconds=offset)).isoformat(), f"entry {offset}")
+    monitor.update_history_listbox()
+    monitor.open_history_window()
+    inner = monitor.history_listbox_inner
+    # 最新的在前：第 1 行是 "entry 3"
+    inner._on_click(Click(1))
+    selected = store.get_by_rank(1)
+    assert selected == ((base + timedelta(seconds=3)).isoformat(), "entry 3")
+
+    # 同步线程插入了更新的记录，界面还没有刷新
+    store.insert((base + timedelta(seconds=10)).isoformat(), "remote")
+    monitor.delete_selected()
+
+    assert store.get(selected[0]) is None
+    assert store.get((base + timedelta(seconds=10)).isoformat()) == "remote"
+    assert store.get((base + timedelta(seconds=4)).isoformat()) == "entry 4"
+    assert store.count() == 5
+
+
+def test_sync_refresh_clears_manage_window_selection(monitor):
+    store = monitor.history_store
+    base = datetime(2024, 1, 1)
+    for offset in range(3):
+        store.insert((base + timedelta(seconds=offset)).isoformat(), f"entry {offset}")
+    monitor.update_history_listbox()
+    monitor.open_history_window()
+    monitor.history_listbox_inner._on_click(Click(0))
+    store.insert((base + timedelta(seconds=10)).isoformat(), "remote")
+    monitor.on_history_synced(1)
+    assert monitor.history_listbox_inner.curselection() == ()
+    # 没有选中任何条目时不会删除
+    monitor.delete_selected()
+    assert store.count() == 4
+
+
+def test_deleted_entry_preview_is_not_reused(monitor):
+    store = monitor.history_store
+    timestamp = datetime(2024, 1, 1).isoformat()
+    store.insert(timestamp, "secret " * 100)
+    monitor.update_history_listbox()
+    monitor.open_history_window()
+    assert monitor.fetch_history_previews(0, 1) == [("secret " * 100)[:50]]
+    # 缓存中只有截断后的预览
+    assert all(len(preview) <= 200 for preview in monitor.previews.previews.values())
+
+    monitor.history_listbox_inner._on_click(Click(0))
+    monitor.delete_selected()
+    assert not monitor.previews.previews
+    # 同一个时间戳上导入或同步来的另一条内容显示自己的预览
+    store.insert(timestamp, "replacement")
+    assert monitor.fetch_history_previews(0, 1) == ["replacement"]
@@ -0,0 +1,309 @@
+import tkinter as tk
+from tkinter import font as tkfont
+
+
+class VirtualListbox(tk.Frame):
+    """只渲染可见行的列表框。
+
+    Tk 中只保存当前可见窗口内的行，其余行在滚动时通过 fetch_rows(start, count) 按需取出，
+    可见窗口上下各多取 overscan 行缓存在内存里，小幅滚动时不用重新取数据。
+    选中状态按逻辑行号保存，滚动不会丢失多选；数据源整体变化（refresh）后行号不再对应原来的条目，选中状态会被清除。
+
+    keyed 为 True 时 fetch_rows 返回 (键, 文本) 列表，选中时记下用户看到的那一行的键，
+    selected_keys() 返回它们，数据源在后台变化、显示还没有刷新时也不会对应到别的条目。
+    """
+
+    STRIPE_COLORS = ('white', '#E8E8E8')
+
+    def __init__(self, master, row_count, fetch_rows, selectmode=tk.SINGLE, overscan=20, keyed=False, **listbox_options):
+        super().__init__(master)
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        self.selectmode = selectmode
+        self.overscan = overscan
+        self.keyed = keyed
+
+        self.top = 0
+        self.visible_rows = int(listbox_options.get("height", 10))
+        self.total = 0
+        # 逻辑行号 -> 选中时这一行的键（没有 keyed 时为 None）
+        self.selection = {}
+        self.anchor = None
+        self._cache_start = 0
+        self._cache = []
+
+        self.listbox = tk.Listbox(self, selectmode=tk.MULTIPLE, activestyle=tk.NONE,
+                                  exportselection=False, **listbox_options)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # 接管 Listbox 自带的滚动和选择行为
+        self.listbox.bind('<Button-1>', self._on_click)
+        self.listbox.bind('<Shift-Button-1>', self._on_shift_click)
+        self.listbox.bind('<B1-Motion>', lambda event: "break")
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda event: self._scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda event: self._scroll_by(3))
+        self.listbox.bind('<Up>', lambda event: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda event: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda event: self._scroll_by(-self.visible_rows))
+        self.listbox.bind('<Next>', lambda event: self._scroll_by(self.visible_rows))
+        self.listbox.bind('<Home>', lambda event: self._scroll_to(0))
+        self.listbox.bind('<End>', lambda event: self._scroll_to(self.total))
+        self.listbox.bind('<Configure>', self._on_resize)
+
+        self.refresh()
+
+    # ------------------------------------------------------------------
+    # 与 tk.Listbox 兼容的接口
+    # ------------------------------------------------------------------
+    def bind(self, sequence=None, func=None, add=None):
+        return self.listbox.bind(sequence, func, add)
+
+    def configure(self, cnf=None, **kw):
+        result = self.listbox.configure(cnf, **kw)
+        if "font" in kw:
+            self._on_resize()
+        return result
+
+    config = configure
+
+    def size(self):
+        return self.total
+
+    def curselection(self):
+        return tuple(sorted(self.selection))
+
+    def selected_keys(self):
+        """按行号顺序返回选中行的键。"""
+        return [self.selection[index] for index in sorted(self.selection)]
+
+    def selection_clear(self):
+        self.selection.clear()
+        self.anchor = None
+        self._render()
+
+    def see(self, index):
+        if index < self.top:
+            self._scroll_to(index)
+        elif index >= self.top + self.visible_rows:
+            self._scroll_to(index - self.visible_rows + 1)
+
+    # ------------------------------------------------------------------
+    # 数据刷新
+    # ------------------------------------------------------------------
+    def refresh(self):
+        """数据源发生变化后调用：重新读取行数并重绘可见窗口。
+
+        不知道哪些行被插入或删除（例如同步或淘汰发生在任意位置），原来的行号可能已经指向别的条目，
+        所以清除选中状态，避免之后对用户没有选过的条目执行删除等操作。已知变化的位置时用 insert_rows/delete_rows。
+        """
+        self.total = self.row_count()
+        self.selection.clear()
+        self.anchor = None
+        self._cache = []
+        self._clamp_top()
+        self._render()
+
+    def insert_rows(self, index, count=1):
+        """数据源在逻辑行 index 处插入了 count 行，就地更新而不重建整个列表。"""
+        self.total += count
+        self.selection = {i + count if i >= index else i: key for i, key in self.selection.items()}
+        if self.anchor is not None and self.anchor >= index:
+            self.anchor += count
+        self._shift_cache(index, count)
+
+        if index < self.top:
+            # 插入发生在可见窗口上方：保持当前看到的内容不动
+            self.top += count
+        elif index < self.top + self.visible_rows:
+            offset = index - self.top
+            rows = self._rows(index, min(count, self.visible_rows - offset))
+            self.listbox.insert(offset, *rows)
+            self.listbox.delete(self.visible_rows, tk.END)
+            self._restyle()
+        self._update_scrollbar()
+
+    def delete_rows(self, indices):
+        """数据源删除了逻辑行 indices（删除前的行号），就地更新显示。"""
+        for index in sorted(set(indices), reverse=True):
+            if not 0 <= index < self.total:
+                continue
+            self.total -= 1
+            self.selection = {i - 1 if i > index else i: key for i, key in self.selection.items() if i != index}
+            if self.anchor is not None and self.anchor >= index:
+                self.anchor = None if self.anchor == index else self.anchor - 1
+            self._shift_cache(index, -1)
+            if index < self.top:
+                self.top -= 1
+            elif index < self.top + self.visible_rows:
+                self.listbox.delete(index - self.top)
+
+        # 补齐可见窗口底部空出来的行
+        top = self.top
+        self._clamp_top()
+        shown = self.listbox.size()
+        wanted = max(0, min(self.visible_rows, self.total - self.top))
+        if self.top != top or shown > wanted:
+            self._render()
+            return
+        if shown < wanted:
+            self.listbox.insert(tk.END, *self._rows(self.top + shown, wanted - shown))
+        self._restyle()
+        self._update_scrollbar()
+
+    def _shift_cache(self, index, count):
+        cache_end = self._cache_start + len(self._cache)
+        if index >= cache_end:
+            return
+        if index < self._cache_start:
+            self._cache_start += count
+        else:
+            # 缓存内部发生变化，丢弃缓存让下一次按需重新读取
+            self._cache = []
+
+    def _clamp_top(self):
+        self.top = max(0, min(self.top, self.total - self.visible_rows))
+
+    def _items(self, start, count):
+        cache_end = self._cache_start + len(self._cache)
+        if not (self._cache_start <= start and start + count <= cache_end):
+            fetch_start = max(0, start - self.overscan)
+            fetch_count = min(self.total, start + count + self.overscan) - fetch_start
+            self._cache_start = fetch_start
+            self._cache = list(self.fetch_rows(fetch_start, fetch_count))
+        offset = start - self._cache_start
+        return self._cache[offset:offset + count]
+
+    def _rows(self, start, count):
+        items = self._items(start, count)
+        return [text for key, text in items] if self.keyed else items
+
+    def _select(self, indices):
+        """选中 indices，键取自当前显示的内容（缓存），不重新查询数据源。"""
+        for index in indices:
+            if index in self.selection:
+                continue
+            if self.keyed:
+                items = self._items(index, 1)
+                if not items:
+                    continue
+                self.selection[index] = items[0][0]
+            else:
+                self.selection[index] = None
+
+    def _render(self):
+        count = max(0, min(self.visible_rows, self.total - self.top))
+        rows = self._rows(self.top, count) if count else []
+
+        self.listbox.delete(0, tk.END)
+        if rows:
+            self.listbox.insert(tk.END, *rows)
+        self._restyle()
+        self._update_scrollbar()
+
+    def _restyle(self):
+        # 条纹颜色和选中状态都按逻辑行号计算，滚动时保持稳定
+        self.listbox.selection_clear(0, tk.END)
+        for offset in range(self.listbox.size()):
+            index = self.top + offset
+            self.listbox.itemconfig(offset, bg=self.STRIPE_COLORS[index % 2])
+            if index in self.selection:
+                self.listbox.selection_set(offset)
+
+    def _update_scrollbar(self):
+        if self.total:
+            shown = self.listbox.size()
+            self.scrollbar.set(self.top / self.total, (self.top + shown) / self.total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # ------------------------------------------------------------------
+    # 滚动
+    # ------------------------------------------------------------------
+    def yview(self, *args):
+        if not args:
+            return
+        if args[0] == tk.MOVETO:
+            self._scroll_to(int(float(args[1]) * self.total))
+        elif args[0] == tk.SCROLL:
+            amount = int(args[1])
+            if args[2] == tk.PAGES:
+                amount *= self.visible_rows
+            self._scroll_by(amount)
+
+    def _scroll_to(self, top):
+        old_top = self.top
+        self.top = top
+        self._clamp_top()
+        if self.top != old_top:
+            self._render()
+        return "break"
+
+    def _scroll_by(self, amount):
+        return self._scroll_to(self.top + amount)
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_resize(self, event=None):
+        line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1 \
+            + 2 * int(self.listbox.cget("selectborderwidth"))
+        height = self.listbox.winfo_height()
+        if height <= 1:
+            # 窗口尚未布局完成，沿用配置的行数
+            return
+        visible_rows = max(1, (height - 2 * int(self.listbox.cget("borderwidth"))) // line_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self._clamp_top()
+            self._render()
+
+    # ------------------------------------------------------------------
+    # 选择
+    # ------------------------------------------------------------------
+    def _index_at(self, y):
+        offset = self.listbox.nearest(y)
+        if offset < 0:
+            return None
+        index = self.top + offset
+        return index if index < self.total else None
+
+    def _on_click(self, event):
+        self.listbox.focus_set()
+        index = self._index_at(event.y)
+        if index is None:
+            return "break"
+        if self.selectmode == tk.MULTIPLE and index in self.selection:
+            del self.selection[index]
+        elif self.selectmode == tk.MULTIPLE:
+            self._select([index])
+        else:
+            self.selection.clear()
+            self._select([index])
+        self.anchor = index
+        self._render()
+        return "break"
+
+    def _on_shift_click(self, event):
+        index = self._index_at(event.y)
+        if index is None or self.selectmode != tk.MULTIPLE or self.anchor is None:
+            return self._on_click(event)
+        low, high = sorted((self.anchor, index))
+        self._select(range(low, high + 1))
+        self._render()
+        return "break"
+
+    def _move_selection(self, step):
+        if not self.total:
+            return "break"
+        current = self.anchor if self.anchor is not None else self.top - step
+        index = max(0, min(self.total - 1, current + step))
+        if self.selectmode != tk.MULTIPLE:
+            self.selection.clear()
+            self._select([index])
+        self.anchor = index
+        self.see(index)
+        self._render()
+        return "break"